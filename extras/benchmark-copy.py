@@ -0,0 +1,76 @@
+"""
+Compare shutil.copytree with the CopyEngine used by the installer on a synthetic tree.
+
+usage: python extras/benchmark-copy.py [--files 50000] [--size 4096] [--workers 0] [--repeat 3] [--path TEMP_DIR]
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from universal_updater.CopyEngine import CopyEngine  # noqa: E402
+
+
+def make_tree(root, files, size, files_per_folder=200):
+    """
+    Create a synthetic tree of small files.
+    """
+    payload = os.urandom(size)
+    for index in range(files):
+        folder = os.path.join(root, f'dir{index // files_per_folder:04d}')
+        if index % files_per_folder == 0:
+            os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, f'file{index:06d}.bin'), 'wb') as file:
+            file.write(payload)
+
+
+def timed(label, function, dest, repeat):
+    """
+    Run a copy function several times into a fresh destination and print the best wall time.
+    """
+    best = None
+    for _ in range(repeat):
+        shutil.rmtree(dest, ignore_errors=True)
+        start = time.perf_counter()
+        function(dest)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    shutil.rmtree(dest, ignore_errors=True)
+    print(f'{label:<28} {best:8.2f} s')
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='CopyEngine benchmark')
+    parser.add_argument('--files', type=int, default=50000)
+    parser.add_argument('--size', type=int, default=4096)
+    parser.add_argument('--workers', type=int, default=0, help='CopyEngine workers (0 = auto)')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per method, the best one is reported')
+    parser.add_argument('--path', default=None, help='Folder for the temporary trees (same filesystem)')
+    arguments = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=arguments.path) as work_path:
+        source = os.path.join(work_path, 'source')
+        print(f'creating {arguments.files} files of {arguments.size} bytes in {work_path}')
+        make_tree(source, arguments.files, arguments.size)
+
+        dest = os.path.join(work_path, 'dest')
+        engine = CopyEngine(workers=arguments.workers)
+        baseline = timed('shutil.copytree', lambda path: shutil.copytree(
+            source, path, copy_function=shutil.copy, dirs_exist_ok=True), dest, arguments.repeat)
+        single = timed('CopyEngine (1 worker)', lambda path: CopyEngine(workers=1).copy_tree(
+            source, path), dest, arguments.repeat)
+        parallel = timed(f'CopyEngine ({engine.workers} workers)', lambda path: engine.copy_tree(
+            source, path), dest, arguments.repeat)
+
+        print(f'speedup: {baseline / single:.2f}x (1 worker), {baseline / parallel:.2f}x ({engine.workers} workers)')
+        print(f'reflink: {engine.use_reflink}, copy_file_range: {engine.use_copy_file_range}')
+
+
+if __name__ == '__main__':
+    main()
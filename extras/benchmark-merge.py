@@ -0,0 +1,105 @@
+"""
+Compare the old repack merge (unpack the whole old archive, copy the new version over it, recompress
+everything) with Packer.repack_step on a large synthetic tool where only a few files changed.
+
+usage: python extras/benchmark-merge.py [--files 5000] [--size 16384] [--changed 10] [--methods deflate zstd] [--repeat 3] [--path TEMP_DIR]
+"""
+import os
+import sys
+import time
+import shutil
+import pathlib
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from universal_updater.Packer import Packer  # noqa: E402
+from universal_updater.ToolSpec import ToolSpec  # noqa: E402
+
+
+def make_tree(root, files, size, files_per_folder=200, seed=0):
+    """
+    Create a synthetic tree of compressible files.
+    """
+    words = [f'word{index:05d}'.encode() for index in range(2048)]
+    for index in range(files):
+        folder = os.path.join(root, f'dir{index // files_per_folder:04d}')
+        if index % files_per_folder == 0:
+            os.makedirs(folder, exist_ok=True)
+        content = b' '.join(words[(index * 7 + seed + step) % len(words)] for step in range(size // 10))
+        with open(os.path.join(folder, f'file{index:06d}.txt'), 'wb') as file:
+            file.write(content[:size])
+
+
+def legacy_merge(packer, tool_folder_path, tool_unpack_path, version):
+    """
+    The repack merge before the archive-level merge: a full round trip through a temporary folder.
+    """
+    old_version = packer.tool_config.get('local_version', '0')
+    old_compress_path = tool_folder_path.joinpath(packer.repack_save_compress_name(packer.tool_name, old_version))
+    temp_path = tool_folder_path.parent.joinpath('legacy-temp')
+    packer.unpack(old_compress_path, temp_path)
+    shutil.copytree(tool_unpack_path, temp_path, dirs_exist_ok=True)
+    shutil.rmtree(tool_unpack_path)
+    shutil.move(temp_path, tool_unpack_path)
+
+    new_compress_path = tool_folder_path.joinpath(packer.repack_save_compress_name(packer.tool_name, version))
+    packer.write_archive(new_compress_path, tool_unpack_path)
+    old_compress_path.unlink()
+
+
+def run(method, work_path, arguments, use_legacy):
+    """
+    Prepare the old archive and the new version, then time the merge.
+    """
+    old_path = work_path.joinpath('old')
+    new_path = work_path.joinpath('new')
+    tool_folder_path = work_path.joinpath('tool')
+    shutil.rmtree(tool_folder_path, ignore_errors=True)
+    shutil.rmtree(new_path, ignore_errors=True)
+    tool_folder_path.mkdir()
+
+    packer = Packer(str(work_path), 'full', False, repack_method=method)
+    tool_config = ToolSpec('Bench', {'url': 'http://localhost/', 're_version': '.', 'folder': str(tool_folder_path),
+                                     'merge': 'true'}, work_path)
+    packer.tool_setup('Bench', tool_config.with_state({'local_version': '1'}))
+    packer.write_archive(tool_folder_path.joinpath(packer.repack_save_compress_name('Bench', '1')), old_path)
+
+    # the new version only ships the changed files, the rest comes from the old archive
+    for index in range(arguments.changed):
+        relative_path = pathlib.Path(f'dir{index * 37 % arguments.files // 200:04d}', f'file{index * 37 % arguments.files:06d}.txt')
+        new_path.joinpath(relative_path.parent).mkdir(parents=True, exist_ok=True)
+        new_path.joinpath(relative_path).write_bytes(os.urandom(arguments.size))
+
+    start = time.perf_counter()
+    if use_legacy:
+        legacy_merge(packer, tool_folder_path, new_path, '2')
+    else:
+        packer.repack_step(tool_folder_path, new_path, new_path, '2')
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Repack merge benchmark')
+    parser.add_argument('--files', type=int, default=5000)
+    parser.add_argument('--size', type=int, default=16384)
+    parser.add_argument('--changed', type=int, default=10, help='Files replaced by the new version')
+    parser.add_argument('--methods', nargs='+', default=['deflate', 'zstd'], choices=sorted(Packer.REPACK_METHODS))
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per method, the best one is reported')
+    parser.add_argument('--path', default=None, help='Folder for the temporary trees')
+    arguments = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=arguments.path) as work_path:
+        work_path = pathlib.Path(work_path)
+        print(f'creating {arguments.files} files of {arguments.size} bytes in {work_path}')
+        make_tree(work_path.joinpath('old'), arguments.files, arguments.size)
+
+        for method in arguments.methods:
+            legacy = min(run(method, work_path, arguments, True) for _ in range(arguments.repeat))
+            merged = min(run(method, work_path, arguments, False) for _ in range(arguments.repeat))
+            print(f'{method:<8} legacy {legacy:8.2f} s   merge {merged:8.2f} s   speedup {legacy / merged:.2f}x')
+
+
+if __name__ == '__main__':
+    main()
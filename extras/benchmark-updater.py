@@ -0,0 +1,420 @@
+"""
+End-to-end benchmark of UpdateManager.handle_updates against a local mock release server.
+
+The server imitates GitHub (releases.atom, expanded_assets and the REST latest release), Scoop manifests,
+plain vendor pages and range-capable archive downloads, with configurable latency and bandwidth.
+Vendor pages and http downloads are spread over --hosts loopback addresses (127.0.0.1, 127.0.0.2...), so the
+per-host limits apply as they would with real vendors; GitHub and Scoop share the first one.
+A synthetic tools.ini with N tools is run twice: "install" (every tool is new) and "check" (every tool is up
+to date). Each run reports tools/sec, bytes/sec and the latency percentiles of every updater phase.
+Arguments after "--" are passed to the updater, e.g. to compare --parallel-workers or --download-segments.
+
+usage: python extras/benchmark-updater.py [--tools 40] [--kinds web github scoop http] [--archive-size 1048576]
+                                          [--page-size 65536] [--latency 20] [--bandwidth 0] [--hosts 4] [--github-api]
+                                          [--json FILE] [--path TEMP_DIR] [-- UPDATER_ARGUMENTS]
+"""
+import io
+import os
+import re
+import sys
+import json
+import time
+import random
+import asyncio
+import hashlib
+import logging
+import pathlib
+import zipfile
+import argparse
+import platform
+import tempfile
+import threading
+from email.utils import formatdate
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from UpdateManager import UpdateManager  # noqa: E402
+from universal_updater.ConfigManager import ConfigManager  # noqa: E402
+from universal_updater.Scraper import Scraper  # noqa: E402
+from universal_updater.Updater import Updater  # noqa: E402
+
+# updater phase -> Updater method timed for it
+PHASES = {
+    'check': 'check_async',
+    'stream': 'stream_step',
+    'download': 'download_step',
+    'process': 'processing_tool_step',
+    'post_update': 'post_update',
+    'install': 'install',
+}
+
+
+class MockReleaseServer:
+    """
+    aiohttp server imitating the release sources, running on its own event loop thread.
+    """
+
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, archive, page_size, latency, bandwidth):
+        self.archive = archive
+        self.page_size = page_size
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.etag = f'"{hashlib.sha256(archive).hexdigest()[:16]}"'
+        self.last_modified = formatdate(usegmt=True)
+        self.requests = 0
+        self.bytes_sent = 0
+        self.base_url = None
+        self.base_urls = []
+        self._loop = asyncio.new_event_loop()
+        self._runner = None
+
+    def start(self, hosts):
+        """
+        Start the server on a free port of the first hosts loopback addresses.
+        """
+        threading.Thread(target=self._loop.run_forever, name='MockReleaseServer', daemon=True).start()
+        addresses = [f'127.0.0.{index + 1}' for index in range(hosts)]
+        port = asyncio.run_coroutine_threadsafe(self._start(addresses), self._loop).result()
+        self.base_urls = [f'http://{address}:{port}' for address in addresses]
+        self.base_url = self.base_urls[0]
+
+    async def _start(self, addresses):
+        # GitHub asset links are joined as "host/" + "/owner/repo/...", which github.com accepts
+        app = web.Application(middlewares=[web.normalize_path_middleware(append_slash=False, merge_slashes=True),
+                                           self.middleware])
+        app.add_routes([
+            web.get('/vendor/{name}.html', self.vendor_page),
+            web.get('/download/{name}.zip', self.download),
+            web.get('/{owner}/{repo}/releases/download/{tag}/{name}.zip', self.download),
+            web.get('/repos/{owner}/{repo}/releases/latest', self.github_latest),
+            web.get('/ScoopInstaller/{bucket}/master/bucket/{app}.json', self.scoop_manifest),
+            web.get('/{owner}/{repo}/releases.atom', self.github_atom),
+            web.get('/{owner}/{repo}/releases/expanded_assets/{tag}', self.github_assets),
+        ])
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        port = 0
+        for address in addresses:
+            await web.TCPSite(self._runner, address, port).start()
+            port = self._runner.addresses[0][1]
+
+        return port
+
+    def stop(self):
+        """
+        Stop the server and its loop.
+        """
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+    @web.middleware
+    async def middleware(self, request, handler):
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        response = await handler(request)
+        if isinstance(response, web.Response) and response.body:
+            self.bytes_sent += len(response.body)
+
+        return response
+
+    def padding(self, line):
+        """
+        Filler lines that bring a page to page_size bytes.
+        """
+        return (line + '\n') * (self.page_size // (len(line) + 1))
+
+    @staticmethod
+    def get_index(name):
+        return int(re.search(r'\d+', name).group())
+
+    async def vendor_page(self, request):
+        name = request.match_info['name']
+        version = get_version(self.get_index(name))
+        body = (f'<html><body><h1>{name}</h1>\n<p>Version {version}</p>\n'
+                f'<a href="download/{name}.zip">Download</a>\n'
+                f'{self.padding("<p>Older release notes and changelog entries</p>")}</body></html>')
+        return web.Response(text=body, content_type='text/html')
+
+    async def github_atom(self, request):
+        owner, repo = request.match_info['owner'], request.match_info['repo']
+        tag = f'v{get_version(self.get_index(repo))}'
+        entry = f'<entry><link rel="alternate" type="text/html" href="{self.base_url}/{owner}/{repo}/releases/tag/{{0}}"/></entry>'
+        body = (f'<?xml version="1.0" encoding="UTF-8"?>\n<feed>\n{entry.format(tag)}\n'
+                f'{self.padding(entry.format("v0.0.1"))}</feed>')
+        return web.Response(text=body, content_type='application/atom+xml')
+
+    async def github_assets(self, request):
+        owner, repo, tag = request.match_info['owner'], request.match_info['repo'], request.match_info['tag']
+        body = (f'<ul>\n<li><a href="/{owner}/{repo}/releases/download/{tag}/{repo}-{tag}.zip" rel="nofollow">'
+                f'{repo}-{tag}.zip</a></li>\n</ul>')
+        return web.Response(text=body, content_type='text/html')
+
+    async def github_latest(self, request):
+        repo = request.match_info['repo']
+        tag = f'v{get_version(self.get_index(repo))}'
+        return web.json_response({
+            'tag_name': tag,
+            'assets': [{
+                'browser_download_url': f'{self.base_url}/download/{repo}.zip',
+                'digest': f'sha256:{hashlib.sha256(self.archive).hexdigest()}',
+            }],
+        })
+
+    async def scoop_manifest(self, request):
+        app = request.match_info['app']
+        return web.json_response({
+            'version': get_version(self.get_index(app)),
+            'url': f'{self.base_url}/download/{app}.zip',
+            'hash': hashlib.sha256(self.archive).hexdigest(),
+        })
+
+    async def download(self, request):
+        size = len(self.archive)
+        start, end, status = 0, size - 1, 200
+        headers = {
+            'Content-Type': 'application/zip',
+            'Accept-Ranges': 'bytes',
+            'ETag': self.etag,
+            'Last-Modified': self.last_modified,
+        }
+        match = re.match(r'bytes=(\d*)-(\d*)', request.headers.get('Range', ''))
+        if match and (match.group(1) or match.group(2)):
+            if match.group(1):
+                start = int(match.group(1))
+                end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+            else:
+                start = max(size - int(match.group(2)), 0)
+            status = 206
+            headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+
+        headers['Content-Length'] = str(end - start + 1)
+        response = web.StreamResponse(status=status, headers=headers)
+        await response.prepare(request)
+        if request.method == 'HEAD':
+            return response
+
+        position = start
+        while position <= end:
+            chunk = self.archive[position:min(position + self.CHUNK_SIZE, end + 1)]
+            await response.write(chunk)
+            self.bytes_sent += len(chunk)
+            position += len(chunk)
+            if self.bandwidth:
+                await asyncio.sleep(len(chunk) / self.bandwidth)
+
+        await response.write_eof()
+        return response
+
+
+def get_version(index):
+    """
+    Version published by the mock server for tool number index.
+    """
+    return f'1.{index}.0'
+
+
+def make_archive(size, files=8, seed=0):
+    """
+    Create a zip of about size bytes (stored random data, so the size is predictable).
+    """
+    generator = random.Random(seed)
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as archive:
+        for index in range(files):
+            archive.writestr(f'tool/file{index:03d}.bin', generator.randbytes(max(size // files, 1)))
+
+    return buffer.getvalue()
+
+
+def make_config(path, tools, kinds, base_urls):
+    """
+    Write a synthetic tools.ini, the kinds of tool are assigned round-robin.
+    """
+    lines = ['[UpdaterConfig]', 'disable_install_check = True', '']
+    for index in range(tools):
+        kind = kinds[index % len(kinds)]
+        name = f'tool{index}'
+        base_url = base_urls[index % len(base_urls)]
+        lines += [f'[{name}]', f'folder = tools/{name}']
+        if kind == 'web':
+            lines += [f'url = {base_url}/vendor/{name}.html', r're_version = Version ([\d.]+)',
+                      r're_download = href="([^"]+\.zip)"']
+        elif kind == 'github':
+            lines += ['from = github', f'url = bench/{name}', rf're_download = {name}\S*\.zip']
+        elif kind == 'scoop':
+            lines += ['from = scoop', f'url = {name}', 'scoop_bucket = extras']
+        else:
+            lines += ['from = http', f'update_url = {base_url}/download/{name}.zip']
+        lines.append('')
+
+    path.write_text('\n'.join(lines))
+
+
+def patch_scraper(base_url):
+    """
+    Point the GitHub and Scoop URLs of every Scraper at the mock server.
+    """
+    original_init = Scraper.__init__
+
+    def init(self, *args, **kwargs):
+        original_init(self, *args, **kwargs)
+        self.github_version_check = base_url + '/{0}/releases.atom'
+        self.github_files = base_url + '/{0}/releases/expanded_assets/{1}'
+        self.github_api_files = base_url + '/repos/{0}/releases/latest'
+        self.scoop_manifest = base_url + '/ScoopInstaller/{0}/master/bucket/{1}.json'
+
+    Scraper.__init__ = init
+
+
+def patch_phases(timings):
+    """
+    Record the duration of every call of the Updater methods in PHASES.
+    """
+    for phase, method_name in PHASES.items():
+        original = getattr(Updater, method_name)
+        if asyncio.iscoroutinefunction(original):
+            async def wrapper(self, *args, _original=original, _phase=phase, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await _original(self, *args, **kwargs)
+                finally:
+                    timings[_phase].append(time.perf_counter() - start)
+        else:
+            def wrapper(self, *args, _original=original, _phase=phase, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return _original(self, *args, **kwargs)
+                finally:
+                    timings[_phase].append(time.perf_counter() - start)
+
+        setattr(Updater, method_name, wrapper)
+
+
+def percentiles(values):
+    """
+    Nearest-rank percentiles of a list of durations, in milliseconds.
+    """
+    if not values:
+        return {'count': 0}
+
+    values = sorted(values)
+
+    def rank(percent):
+        return round(values[min(len(values) - 1, max(0, int(len(values) * percent / 100 + 0.5) - 1))] * 1000, 2)
+
+    return {'count': len(values), 'p50': rank(50), 'p90': rank(90), 'p99': rank(99),
+            'max': round(values[-1] * 1000, 2), 'total': round(sum(values) * 1000, 2)}
+
+
+def run(name, server, timings, updater_arguments, tools):
+    """
+    Run UpdateManager.handle_updates once in the current folder and collect its metrics.
+    """
+    for values in timings.values():
+        values.clear()
+    requests, bytes_sent = server.requests, server.bytes_sent
+
+    sys.argv = ['updater', '-dsu', '-dpb', '-dmc'] + updater_arguments
+    manager = UpdateManager()
+    manager.parse_arguments()
+    manager.config_manager.set_write_behind(manager.arguments.config_flush_interval)
+    manager.set_logging_level()
+    logging.getLogger().setLevel(logging.DEBUG if manager.arguments.debug else logging.ERROR)
+
+    start = time.perf_counter()
+    manager.handle_updates()
+    manager.config_manager.close()
+    elapsed = time.perf_counter() - start
+
+    config_manager = ConfigManager(manager.config_file_name, manager.state_file_name)
+    installed = sum(config_manager.get_config(f'tool{index}', 'local_version') is not None for index in range(tools))
+    config_manager.close()
+
+    bytes_sent = server.bytes_sent - bytes_sent
+    return {
+        'run': name,
+        'seconds': round(elapsed, 3),
+        'tools': tools,
+        'installed': installed,
+        'tools_per_sec': round(tools / elapsed, 2),
+        'requests': server.requests - requests,
+        'bytes': bytes_sent,
+        'bytes_per_sec': round(bytes_sent / elapsed),
+        'phases': {phase: percentiles(values) for phase, values in timings.items()},
+    }
+
+
+def main():
+    arguments = sys.argv[1:]
+    updater_arguments = []
+    if '--' in arguments:
+        updater_arguments = arguments[arguments.index('--') + 1:]
+        arguments = arguments[:arguments.index('--')]
+
+    parser = argparse.ArgumentParser(description='Updater end-to-end benchmark')
+    parser.add_argument('--tools', type=int, default=40)
+    parser.add_argument('--kinds', nargs='+', default=['web', 'github', 'scoop', 'http'],
+                        choices=['web', 'github', 'scoop', 'http'])
+    parser.add_argument('--archive-size', type=int, default=1024 * 1024, help='Bytes of every tool archive')
+    parser.add_argument('--page-size', type=int, default=64 * 1024, help='Bytes of the vendor pages and feeds')
+    parser.add_argument('--latency', type=float, default=20, help='Milliseconds added to every request')
+    parser.add_argument('--bandwidth', type=float, default=0, help='Bytes/sec of every download connection (0 = unlimited)')
+    parser.add_argument('--hosts', type=int, default=4, choices=range(1, 255), metavar='1-254',
+                        help='Loopback addresses the vendor tools are spread over (use 1 where only 127.0.0.1 works)')
+    parser.add_argument('--github-api', action='store_true', help='Use the GitHub REST mode instead of the HTML pages')
+    parser.add_argument('--json', default=None, help='Write the results as JSON to this file ("-" = stdout)')
+    parser.add_argument('--path', default=None, help='Folder for the temporary work folder')
+    arguments = parser.parse_args(arguments)
+    if arguments.github_api:
+        updater_arguments += ['--use-github-api', 'benchmark', '--github-batch-size', '0']
+
+    server = MockReleaseServer(make_archive(arguments.archive_size), arguments.page_size,
+                               arguments.latency / 1000, arguments.bandwidth)
+    server.start(arguments.hosts)
+    patch_scraper(server.base_url)
+    timings = {phase: [] for phase in PHASES}
+    patch_phases(timings)
+
+    results = {
+        'benchmark': 'updater',
+        'updater_version': UpdateManager().version,
+        'python': platform.python_version(),
+        'cpus': os.cpu_count(),
+        'settings': {key: value for key, value in vars(arguments).items() if key not in ('json', 'path')},
+        'updater_arguments': updater_arguments,
+        'runs': [],
+    }
+    current_path = os.getcwd()
+    try:
+        with tempfile.TemporaryDirectory(dir=arguments.path) as work_path:
+            os.chdir(work_path)
+            make_config(pathlib.Path(work_path, 'tools.ini'), arguments.tools, arguments.kinds, server.base_urls)
+            for name in ('install', 'check'):
+                result = run(name, server, timings, updater_arguments, arguments.tools)
+                results['runs'].append(result)
+                phases = '  '.join(f'{phase} p50 {values["p50"]:.0f}/p90 {values["p90"]:.0f} ms'
+                                   for phase, values in result['phases'].items() if values['count'])
+                print(f'{name:<8} {result["seconds"]:7.2f} s  {result["tools_per_sec"]:7.2f} tools/s  '
+                      f'{result["bytes_per_sec"] / 1024 / 1024:7.2f} MiB/s  {result["requests"]} requests  '
+                      f'{result["installed"]}/{result["tools"]} installed', file=sys.stderr)
+                print(f'         {phases}', file=sys.stderr)
+            os.chdir(current_path)
+    finally:
+        os.chdir(current_path)
+        server.stop()
+
+    if arguments.json == '-':
+        print(json.dumps(results, indent=2))
+    elif arguments.json:
+        with open(arguments.json, 'w') as results_file:
+            json.dump(results, results_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,10 @@
 import argparse
+import asyncio
+import heapq
 import signal
 import sys
 import os
+import time
 import platform
 import threading
 import colorama
@@ -10,7 +13,17 @@ import psutil
 from concurrent.futures import ThreadPoolExecutor
 
 from universal_updater.Updater import Updater
+from universal_updater.Packer import Packer
 from universal_updater.ConfigManager import ConfigManager
+from universal_updater.CheckSchedule import CheckSchedule
+from universal_updater.ResponseCache import ResponseCache
+from universal_updater.DownloadCache import DownloadCache
+from universal_updater.HttpEngine import HttpEngine
+from universal_updater.HostLimiter import HostLimiter
+from universal_updater.GitHubBatchLookup import GitHubBatchLookup
+from universal_updater.RunMetrics import RunMetrics
+import pypdl_extend
+import py7zr_extend
 from universal_updater.ColoredFormatter import ColoredFormatter
 
 
@@ -26,10 +39,18 @@ class UpdateManager:
         self.version = '2.5.1'
         self.process_mutex = 'mutex.lock'
         self.config_file_name = 'tools.ini'
+        self.state_file_name = 'tools.state.db'
         self.config_section_defaults = 'UpdaterConfig'
         self.config_section_self_update = 'UpdaterAutoUpdater'
+        self.response_cache_folder = 'cache'
+        self.response_cache = None
+        self.download_cache_folder = os.path.join('cache', 'downloads')
+        self.download_cache = None
+        self.http_engine = None
+        self.daemon_reload_interval = 30
+        self.summary_slowest_tools = 5
         self.arguments = {}
-        self.config_manager = ConfigManager(self.config_file_name)
+        self.config_manager = ConfigManager(self.config_file_name, self.state_file_name)
         colorama.init(autoreset=True)
 
     def print_banner(self):
@@ -104,6 +125,19 @@ class UpdateManager:
         except (ValueError, TypeError):
             return default
 
+    def get_argparse_default_float(self, option, default):
+        """
+        Retrieves a float default value from config, falling back to default on invalid values.
+
+        :param option: The name of the argparse option
+        :param default: The float default value if not found or invalid
+        :return: Float default value
+        """
+        try:
+            return float(self.get_argparse_default(option, default, is_bool=False))
+        except (ValueError, TypeError):
+            return default
+
     def get_argparse_default(self, option, default, is_bool=True):
         """
         Retrieves the default value for a given argparse option from the configuration.
@@ -137,6 +171,20 @@ class UpdateManager:
             help='Specify a list of tools to update. Defaults to updating all tools if not provided.',
             nargs='*'
         )
+        parser.add_argument(
+            '-rb',
+            '--rollback',
+            dest='rollback',
+            help='Restore the version kept by the last atomic install of the given tools.',
+            nargs='+'
+        )
+        parser.add_argument(
+            '-es',
+            '--export-state',
+            dest='export_state',
+            metavar='FILE',
+            help='Write a copy of tools.ini with the state of every tool (local_version...) and exit.',
+        )
         parser.add_argument(
             '-dsu',
             '--disable-self-update',
@@ -193,6 +241,30 @@ class UpdateManager:
             action='store_true',
             default=False
         )
+        parser.add_argument(
+            '-rpm',
+            '--repack-method',
+            dest='repack_method',
+            help='Compression method for repacked tools: lzma2 (.7z), zstd (.7z), deflate (.zip) or store (.zip).',
+            choices=['lzma2', 'zstd', 'deflate', 'store'],
+            default=self.get_argparse_default('repack_method', 'lzma2', False)
+        )
+        parser.add_argument(
+            '-rpl',
+            '--repack-level',
+            dest='repack_level',
+            help='Compression level for repacked tools (-1 = default of the method).',
+            type=int,
+            default=self.get_argparse_default_int('repack_level', -1)
+        )
+        parser.add_argument(
+            '-rpt',
+            '--repack-threads',
+            dest='repack_threads',
+            help='Number of compression threads for repacked tools (0 = number of CPUs).',
+            type=int,
+            default=self.get_argparse_default_int('repack_threads', 0)
+        )
         parser.add_argument(
             '-uga',
             '--use-github-api',
@@ -223,6 +295,30 @@ class UpdateManager:
             action='store_true',
             default=False
         )
+        parser.add_argument(
+            '-dm',
+            '--daemon',
+            dest='daemon',
+            help='Keep running and check each tool when it is due, reloading tools.ini when it changes.',
+            action='store_true',
+            default=False
+        )
+        parser.add_argument(
+            '-is',
+            '--ignore-schedule',
+            dest='ignore_schedule',
+            help='Check every tool now, even the ones whose check interval has not elapsed.',
+            action='store_true',
+            default=False
+        )
+        parser.add_argument(
+            '-do',
+            '--due-only',
+            dest='due_only',
+            help='Apply the check schedule to the tools given with --update too (by default they are always checked).',
+            action='store_true',
+            default=False
+        )
         parser.add_argument(
             '-d',
             '--debug',
@@ -255,6 +351,30 @@ class UpdateManager:
             type=int,
             default=self.get_argparse_default_int('parallel_workers', 1)
         )
+        parser.add_argument(
+            '-cw',
+            '--check-workers',
+            dest='check_workers',
+            help='Number of tools to check for updates in parallel.',
+            type=int,
+            default=self.get_argparse_default_int('check_workers', 64)
+        )
+        parser.add_argument(
+            '-cpw',
+            '--copy-workers',
+            dest='copy_workers',
+            help='Number of files copied in parallel when installing a tool (0 = auto).',
+            type=int,
+            default=self.get_argparse_default_int('copy_workers', 0)
+        )
+        parser.add_argument(
+            '-uw',
+            '--unpack-workers',
+            dest='unpack_workers',
+            help='Number of archive members extracted in parallel when unpacking a tool (0 = auto).',
+            type=int,
+            default=self.get_argparse_default_int('unpack_workers', 0)
+        )
         parser.add_argument(
             '-ds',
             '--download-segments',
@@ -263,15 +383,168 @@ class UpdateManager:
             type=int,
             default=self.get_argparse_default_int('download_segments', 3)
         )
+        parser.add_argument(
+            '-gbs',
+            '--github-batch-size',
+            dest='github_batch_size',
+            help='Number of GitHub repos resolved per GraphQL query when a token is set (0 = disabled).',
+            type=int,
+            default=self.get_argparse_default_int('github_batch_size', 50)
+        )
+        parser.add_argument(
+            '-hc',
+            '--host-connections',
+            dest='host_connections',
+            help='Maximum concurrent connections per host (0 = unlimited).',
+            type=int,
+            default=self.get_argparse_default_int('host_connections', 6)
+        )
+        parser.add_argument(
+            '-hr',
+            '--host-rate',
+            dest='host_rate',
+            help='Maximum new requests per second per host (0 = unlimited, a host answering 429 is still slowed down).',
+            type=float,
+            default=self.get_argparse_default_float('host_rate', 0.0)
+        )
+        parser.add_argument(
+            '-dcs',
+            '--download-cache-size',
+            dest='download_cache_size',
+            help='Size in MB of the local cache of downloaded files (0 = disabled).',
+            type=int,
+            default=self.get_argparse_default_int('download_cache_size', 0)
+        )
+        parser.add_argument(
+            '-cfi',
+            '--config-flush-interval',
+            dest='config_flush_interval',
+            help='Seconds a change to tools.ini is buffered before it is written (0 = write every change).',
+            type=float,
+            default=self.get_argparse_default_float('config_flush_interval', 5.0)
+        )
+        parser.add_argument(
+            '-ci',
+            '--check-interval',
+            dest='check_interval',
+            help='Hours between checks of the tools that do not set check_interval (0 = every run).',
+            type=float,
+            default=self.get_argparse_default_float('check_interval', 0.0)
+        )
+        parser.add_argument(
+            '-cj',
+            '--check-jitter',
+            dest='check_jitter',
+            help='Fraction of the check interval a cycle can be shortened by, to spread checks out (0 to 1).',
+            type=float,
+            default=self.get_argparse_default_float('check_jitter', 0.1)
+        )
+        parser.add_argument(
+            '-dmi',
+            '--daemon-interval',
+            dest='daemon_interval',
+            help='Minimum hours between checks of a tool in daemon mode, also the retry delay of failed tools.',
+            type=float,
+            default=self.get_argparse_default_float('daemon_interval', 1.0)
+        )
+        parser.add_argument(
+            '-ai',
+            '--atomic-install',
+            dest='atomic_install',
+            help='Stage updates next to the tool folders and swap them in, keeping the old version for --rollback.',
+            action='store_true',
+            default=self.get_argparse_default('atomic_install', False)
+        )
+        parser.add_argument(
+            '-ii',
+            '--incremental-install',
+            dest='incremental_install',
+            help='Copy only new or changed files into the tool folders (no repack).',
+            action='store_true',
+            default=self.get_argparse_default('incremental_install', False)
+        )
+        parser.add_argument(
+            '-su',
+            '--stream-unpack',
+            dest='stream_unpack',
+            help='Extract ZIP updates while they are downloaded (falls back to the regular path when not possible).',
+            action='store_true',
+            default=self.get_argparse_default('stream_unpack', False)
+        )
+        parser.add_argument(
+            '-drc',
+            '--disable-response-cache',
+            dest='disable_response_cache',
+            help='Disable the conditional-request cache for scraped pages.',
+            action='store_true',
+            default=self.get_argparse_default('disable_response_cache', False)
+        )
+        parser.add_argument(
+            '-mf',
+            '--metrics-file',
+            dest='metrics_file',
+            metavar='FILE',
+            help='Write the time and bytes of every update phase of the run as JSON.',
+            default=self.get_argparse_default('metrics_file', '', False)
+        )
+        parser.add_argument(
+            '-pf',
+            '--prometheus-file',
+            dest='prometheus_file',
+            metavar='FILE',
+            help='Write the metrics of the run for the Prometheus node exporter textfile collector (*.prom).',
+            default=self.get_argparse_default('prometheus_file', '', False)
+        )
 
         self.arguments = parser.parse_args()
 
         if self.arguments.parallel_workers < 1:
             parser.error('--parallel-workers must be at least 1')
 
+        if self.arguments.check_workers < 1:
+            parser.error('--check-workers must be at least 1')
+
+        repack_levels = Packer.REPACK_METHODS[self.arguments.repack_method][1]
+        if self.arguments.repack_level != -1 and self.arguments.repack_level not in repack_levels:
+            parser.error(f'--repack-level must be -1 or from {repack_levels.start} to {repack_levels.stop - 1} '
+                         f'for {self.arguments.repack_method}')
+
+        if self.arguments.repack_threads < 0:
+            parser.error('--repack-threads must be 0 or greater')
+
+        if self.arguments.copy_workers < 0:
+            parser.error('--copy-workers must be 0 or greater')
+
+        if self.arguments.unpack_workers < 0:
+            parser.error('--unpack-workers must be 0 or greater')
+
         if self.arguments.download_segments < 1:
             parser.error('--download-segments must be at least 1')
 
+        if self.arguments.github_batch_size < 0:
+            parser.error('--github-batch-size must be 0 or greater')
+
+        if self.arguments.download_cache_size < 0:
+            parser.error('--download-cache-size must be 0 or greater')
+
+        if self.arguments.host_connections < 0:
+            parser.error('--host-connections must be 0 or greater')
+
+        if self.arguments.host_rate < 0:
+            parser.error('--host-rate must be 0 or greater')
+
+        if self.arguments.config_flush_interval < 0:
+            parser.error('--config-flush-interval must be 0 or greater')
+
+        if self.arguments.check_interval < 0:
+            parser.error('--check-interval must be 0 or greater')
+
+        if not 0 <= self.arguments.check_jitter <= 1:
+            parser.error('--check-jitter must be between 0 and 1')
+
+        if self.arguments.daemon_interval <= 0:
+            parser.error('--daemon-interval must be greater than 0')
+
     def update_default_params(self):
         """
         Updates default parameters in the configuration based on command-line arguments.
@@ -285,11 +558,35 @@ class UpdateManager:
                                        str(self.arguments.disable_install_check))
         self.config_manager.set_config(self.config_section_defaults, 'disable_progress', str(self.arguments.disable_progress))
         self.config_manager.set_config(self.config_section_defaults, 'save_format_type', self.arguments.save_format_type)
+        self.config_manager.set_config(self.config_section_defaults, 'repack_method', self.arguments.repack_method)
+        self.config_manager.set_config(self.config_section_defaults, 'repack_level', str(self.arguments.repack_level))
+        self.config_manager.set_config(self.config_section_defaults, 'repack_threads', str(self.arguments.repack_threads))
         self.config_manager.set_config(self.config_section_defaults, 'use_github_api', self.arguments.use_github_api)
         self.config_manager.set_config(self.config_section_defaults, 'request_timeout', str(self.arguments.request_timeout))
         self.config_manager.set_config(self.config_section_defaults, 'download_retries', str(self.arguments.download_retries))
         self.config_manager.set_config(self.config_section_defaults, 'parallel_workers', str(self.arguments.parallel_workers))
+        self.config_manager.set_config(self.config_section_defaults, 'check_workers', str(self.arguments.check_workers))
+        self.config_manager.set_config(self.config_section_defaults, 'copy_workers', str(self.arguments.copy_workers))
+        self.config_manager.set_config(self.config_section_defaults, 'unpack_workers', str(self.arguments.unpack_workers))
         self.config_manager.set_config(self.config_section_defaults, 'download_segments', str(self.arguments.download_segments))
+        self.config_manager.set_config(self.config_section_defaults, 'github_batch_size', str(self.arguments.github_batch_size))
+        self.config_manager.set_config(self.config_section_defaults, 'host_connections', str(self.arguments.host_connections))
+        self.config_manager.set_config(self.config_section_defaults, 'host_rate', str(self.arguments.host_rate))
+        self.config_manager.set_config(self.config_section_defaults, 'config_flush_interval',
+                                       str(self.arguments.config_flush_interval))
+        self.config_manager.set_config(self.config_section_defaults, 'check_interval', str(self.arguments.check_interval))
+        self.config_manager.set_config(self.config_section_defaults, 'check_jitter', str(self.arguments.check_jitter))
+        self.config_manager.set_config(self.config_section_defaults, 'daemon_interval', str(self.arguments.daemon_interval))
+        self.config_manager.set_config(self.config_section_defaults, 'download_cache_size',
+                                       str(self.arguments.download_cache_size))
+        self.config_manager.set_config(self.config_section_defaults, 'atomic_install', str(self.arguments.atomic_install))
+        self.config_manager.set_config(self.config_section_defaults, 'incremental_install',
+                                       str(self.arguments.incremental_install))
+        self.config_manager.set_config(self.config_section_defaults, 'stream_unpack', str(self.arguments.stream_unpack))
+        self.config_manager.set_config(self.config_section_defaults, 'disable_response_cache',
+                                       str(self.arguments.disable_response_cache))
+        self.config_manager.set_config(self.config_section_defaults, 'metrics_file', self.arguments.metrics_file)
+        self.config_manager.set_config(self.config_section_defaults, 'prometheus_file', self.arguments.prometheus_file)
 
         logging.info(colorama.Fore.GREEN + '[*] Update default params successful')
 
@@ -343,6 +640,46 @@ class UpdateManager:
 
         return update_list
 
+    def filter_due_tools(self, update_list):
+        """
+        Drops the tools whose check interval has not elapsed since their last check, without any request.
+        The schedule is not applied with --ignore-schedule or --force, nor to the tools given with --update
+        unless --due-only is set.
+
+        :param update_list: List of tools to update
+        :return: List of tools due for a check
+        """
+        if self.arguments.ignore_schedule or self.arguments.force_download or \
+                (self.arguments.update and not self.arguments.due_only):
+            return update_list
+
+        schedule = CheckSchedule(self.arguments.check_interval, self.arguments.check_jitter)
+        now = time.time()
+        due_list = []
+        next_check = None
+        for name in update_list:
+            try:
+                tool_config = self.config_manager.get_tool_config(name)
+            except Exception:
+                # a bad config fails in the check phase, with the other failures
+                due_list.append(name)
+                continue
+
+            tool_next_check = schedule.get_next_check(name, tool_config)
+            if tool_next_check <= now:
+                due_list.append(name)
+                continue
+
+            logging.debug(f'{name}: not due for a check until {time.strftime("%Y-%m-%d %H:%M", time.localtime(tool_next_check))}')
+            next_check = tool_next_check if next_check is None else min(next_check, tool_next_check)
+
+        skipped = len(update_list) - len(due_list)
+        if skipped:
+            logging.info(colorama.Fore.YELLOW + f'[+] Skipping {skipped} tools not due for a check '
+                                                f'(next one in {(next_check - now) / 3600:.1f}h, use --ignore-schedule to check them)')
+
+        return due_list
+
     def handle_auto_update(self):
         """
         Handles the auto-update logic for the script itself.
@@ -351,6 +688,9 @@ class UpdateManager:
         updater = Updater(
             config_manager=self.config_manager,
             updater_setup=auto_update_setup,
+            response_cache=self.response_cache,
+            http_engine=self.http_engine,
+            download_cache=self.download_cache,
         )
         if self.config_section_self_update in self.config_manager.get_sections() and \
                 not self.arguments.disable_self_update:
@@ -364,38 +704,114 @@ class UpdateManager:
             # add missing new line separator
             logging.info("\n")
 
+    async def prefetch_github_releases(self, updater_setup, update_list):
+        """
+        Resolves the latest release of every github mode tool with batched GraphQL queries.
+        Only used when a GitHub API token is configured.
+
+        :param updater_setup: Dictionary of updater configuration settings
+        :param update_list: List of tools to update
+        :return: Dict of repo -> latest release (REST shape), empty if the batch mode is disabled
+        """
+        use_github_api = updater_setup.get('use_github_api', '')
+        github_batch_size = updater_setup.get('github_batch_size', 50)
+        if not use_github_api or not github_batch_size:
+            return {}
+
+        repos = [
+            self.config_manager.get_config(name, 'url')
+            for name in update_list
+            if self.config_manager.get_config(name, 'from', fallback='web') == 'github'
+        ]
+        if not repos:
+            return {}
+
+        lookup = GitHubBatchLookup(
+            http_engine=self.http_engine,
+            token=use_github_api,
+            user_agent=Updater.REQUEST_USER_AGENT,
+            batch_size=github_batch_size,
+            request_timeout=updater_setup.get('request_timeout', 30),
+        )
+        return await lookup.fetch(repos)
+
     def handle_tool_updates(self, updater_setup, update_list):
         """
         Handles the update process for each tool in the update list.
+        Runs in two phases: every tool is checked as a coroutine on the shared HTTP engine (at most
+        check_workers at once), then only the tools that changed are downloaded and installed
+        with the (smaller) parallel workers pool.
 
         :param updater_setup: Dictionary of updater configuration settings
         :param update_list: List of tools to update
         """
+        metrics = RunMetrics()
         failed_updates = 0
         failed_names = []
+        pending_updates = {}
+        github_releases = {}
         lock = threading.Lock()
         total_updates = len(update_list)
+        check_workers = updater_setup.get('check_workers', 64)
         parallel_workers = updater_setup.get('parallel_workers', 1)
         if parallel_workers > 1 and not updater_setup.get('disable_progress', False):
             updater_setup = {**updater_setup, 'disable_progress': True}
         logging.info(colorama.Fore.YELLOW + '[+] Checking for tool updates:')
 
-        def update_tool(name):
+        def register_failure(name, exception):
             nonlocal failed_updates
-            updater = Updater(
-                config_manager=self.config_manager,
-                updater_setup=updater_setup,
-            )
+            with lock:
+                failed_updates += 1
+                failed_names.append(name)
+            metrics.set_result(name, 'failed')
+            logging.error(exception)
+
+        async def check_tool(name, semaphore):
+            async with semaphore:
+                updater = Updater(
+                    config_manager=self.config_manager,
+                    updater_setup=updater_setup,
+                    response_cache=self.response_cache,
+                    http_engine=self.http_engine,
+                    github_releases=github_releases,
+                    download_cache=self.download_cache,
+                    metrics=metrics,
+                )
+                try:
+                    scrape_data = await updater.check_async(name)
+                except Exception as exception:
+                    register_failure(name, exception)
+                    return
+
+            metrics.set_result(name, 'available' if scrape_data else 'up_to_date')
+            if scrape_data:
+                with lock:
+                    pending_updates[name] = (updater, scrape_data)
+
+        async def check_tools():
+            github_releases.update(await self.prefetch_github_releases(updater_setup, update_list))
+            semaphore = asyncio.Semaphore(check_workers)
+            await asyncio.gather(*(check_tool(name, semaphore) for name in update_list))
+
+        def install_tool(name):
+            updater, scrape_data = pending_updates[name]
             try:
-                updater.update(name)
+                updater.install(scrape_data)
+                metrics.set_result(name, 'updated')
             except Exception as exception:
-                with lock:
-                    failed_updates += 1
-                    failed_names.append(name)
-                logging.error(exception)
+                register_failure(name, exception)
+
+        self.http_engine.run(check_tools())
+
+        # keep the install order of the update list
+        install_list = [name for name in update_list if name in pending_updates]
+        if install_list and not updater_setup.get('dry_run', False):
+            logging.info(colorama.Fore.YELLOW + f'\n[+] Installing {len(install_list)} tool updates:')
+            with ThreadPoolExecutor(max_workers=parallel_workers) as executor:
+                executor.map(install_tool, install_list)
 
-        with ThreadPoolExecutor(max_workers=parallel_workers) as executor:
-            executor.map(update_tool, update_list)
+        if not updater_setup.get('dry_run', False):
+            self.save_durations(metrics)
 
         # add missing new line separator
         logging.info("\n")
@@ -407,19 +823,178 @@ class UpdateManager:
         if failed_names:
             logging.info(colorama.Fore.YELLOW +
                      f"    Failed updates: {', '.join(failed_names)}")
+        if self.response_cache:
+            cache_stats = self.response_cache.stats
+            logging.info(colorama.Fore.YELLOW +
+                     f"    Response cache: {cache_stats['not_modified']} of {cache_stats['revalidated']} revalidated "
+                     f"pages reused (304), {cache_stats['misses']} not cached")
+
+        self.report_metrics(metrics, updater_setup)
+
+    def save_durations(self, metrics):
+        """
+        Records the time the check and install of every tool took in its state (last_duration, in seconds).
+        Failed tools keep the duration of their last complete run.
+
+        :param metrics: RunMetrics of the run
+        """
+        for name, tool in list(metrics.tools.items()):
+            if tool['result'] in ('updated', 'up_to_date'):
+                self.config_manager.set_config(name, 'last_duration', f'{metrics.get_tool_seconds(name):.3f}')
+
+    def report_metrics(self, metrics, updater_setup):
+        """
+        Logs the slowest tools of a run and writes its metrics to the --metrics-file and --prometheus-file.
+
+        :param metrics: RunMetrics of the run
+        :param updater_setup: Dictionary of updater configuration settings
+        """
+        slowest = [item for item in metrics.get_slowest(self.summary_slowest_tools) if item[1] >= 0.05]
+        if slowest:
+            logging.info(colorama.Fore.YELLOW + '    Slowest tools:')
+            for name, seconds, phases in slowest:
+                top_phases = sorted(phases.items(), key=lambda item: item[1]['seconds'], reverse=True)[:3]
+                phase_text = ', '.join(f'{phase} {record["seconds"]:.1f} s' for phase, record in top_phases
+                                       if record['seconds'] >= 0.05)
+                logging.info(colorama.Fore.YELLOW + f'      {name}: {seconds:.1f} s' +
+                             (f' ({phase_text})' if phase_text else ''))
+
+        for option, write in (('metrics_file', metrics.write_json), ('prometheus_file', metrics.write_prometheus)):
+            file_name = updater_setup.get(option)
+            if not file_name:
+                continue
+
+            try:
+                write(file_name)
+            except OSError as error:
+                logging.error(colorama.Fore.RED + f'Could not write the metrics to {file_name}: {error}')
+
+    def setup_engine(self):
+        """
+        Creates the caches, the host limiter and the HTTP engine shared by every updater.
+        """
+        if not self.arguments.disable_response_cache:
+            self.response_cache = ResponseCache(self.response_cache_folder)
+
+        if self.arguments.download_cache_size:
+            self.download_cache = DownloadCache(self.download_cache_folder, self.arguments.download_cache_size * 1024 * 1024)
+
+        host_limiter = HostLimiter(
+            max_connections=self.arguments.host_connections,
+            requests_per_second=self.arguments.host_rate,
+        )
+        pypdl_extend.host_limit.set_host_limiter(host_limiter)
+        py7zr_extend.zstd.set_threads(self.arguments.repack_threads or os.cpu_count() or 1)
+        self.http_engine = HttpEngine(host_limiter=host_limiter)
 
     def handle_updates(self):
         """
         Orchestrates the update process based on the configuration.
         """
-        self.handle_auto_update()
+        self.setup_engine()
+        try:
+            self.handle_auto_update()
 
-        updater_setup = vars(self.arguments)
-        update_list = self.generate_update_list()
-        self.handle_tool_updates(updater_setup, update_list)
+            updater_setup = vars(self.arguments)
+            update_list = self.filter_due_tools(self.generate_update_list())
+            self.handle_tool_updates(updater_setup, update_list)
+        finally:
+            self.http_engine.close()
 
         Updater(config_manager=self.config_manager).cleanup_updates_root()
 
+    def get_next_check(self, schedule, name):
+        """
+        Gets the time the next check of a tool is due.
+
+        :param schedule: CheckSchedule instance
+        :param name: Name of the tool
+        :return: Unix timestamp, 0 if it is due now
+        """
+        try:
+            return schedule.get_next_check(name, self.config_manager.get_tool_config(name))
+        except Exception:
+            # a bad config fails when the tool is checked, with the other failures
+            return 0
+
+    def build_check_queue(self, schedule):
+        """
+        Builds the min-heap of (next check time, tool name) of the daemon mode.
+
+        :param schedule: CheckSchedule instance
+        :return: List ordered as a heap
+        """
+        ignore_schedule = self.arguments.ignore_schedule or self.arguments.force_download
+        queue = [(0 if ignore_schedule else self.get_next_check(schedule, name), name)
+                 for name in self.generate_update_list()]
+        heapq.heapify(queue)
+
+        return queue
+
+    def handle_daemon(self):
+        """
+        Keeps running and checks every tool when it is due, with the HTTP engine, its connections and the parsed
+        config kept between checks. The tools wait in a min-heap ordered by their next check time; the ones that
+        are due are checked and installed together with the regular pipeline and queued again for their next
+        check (a failed tool is retried after daemon_interval). tools.ini is reloaded when it changes on disk.
+        """
+        schedule = CheckSchedule(self.arguments.check_interval, self.arguments.check_jitter,
+                                 min_interval=self.arguments.daemon_interval)
+        updater_setup = vars(self.arguments)
+        self.setup_engine()
+        try:
+            self.handle_auto_update()
+            queue = self.build_check_queue(schedule)
+            logging.info(colorama.Fore.YELLOW + f'[+] Daemon mode: {len(queue)} tools scheduled')
+            while True:
+                if self.config_manager.reload_if_changed():
+                    logging.info(colorama.Fore.YELLOW + f'[+] {self.config_file_name} changed, reloading')
+                    queue = self.build_check_queue(schedule)
+
+                now = time.time()
+                due_list = []
+                while queue and queue[0][0] <= now:
+                    due_list.append(heapq.heappop(queue)[1])
+
+                if due_list:
+                    self.handle_tool_updates(updater_setup, due_list)
+                    Updater(config_manager=self.config_manager).cleanup_updates_root()
+
+                    # a tool whose check did not complete has no new last_checked, retry it later
+                    now = time.time()
+                    retry_time = now + schedule.min_interval * 3600
+                    for name in due_list:
+                        next_check = self.get_next_check(schedule, name)
+                        heapq.heappush(queue, (next_check if next_check > now else retry_time, name))
+
+                    logging.info(colorama.Fore.YELLOW + f'[+] Next check at '
+                                                        f'{time.strftime("%Y-%m-%d %H:%M", time.localtime(queue[0][0]))}')
+                    continue
+
+                wait = queue[0][0] - now if queue else self.daemon_reload_interval
+                time.sleep(min(wait, self.daemon_reload_interval))
+        finally:
+            self.http_engine.close()
+
+    def handle_rollback(self):
+        """
+        Restores the previous version of the tools given with --rollback.
+        """
+        logging.info(colorama.Fore.YELLOW + '[+] Rolling back tools:')
+        updater = Updater(config_manager=self.config_manager, updater_setup=vars(self.arguments))
+        for name in self.arguments.rollback:
+            try:
+                updater.rollback(name)
+            except Exception as exception:
+                logging.error(exception)
+
+    def handle_export_state(self):
+        """
+        Writes a copy of the config file with the state of every tool merged back in.
+        """
+        count = self.config_manager.export_state(self.arguments.export_state)
+        logging.info(colorama.Fore.YELLOW + f'[+] Exported the state of {count} tools to {self.arguments.export_state}')
+
     def main(self):
         """
         Main entry point for the UpdateManager.
@@ -432,10 +1007,19 @@ class UpdateManager:
         self.change_current_directory()
         self.print_banner()
         self.parse_arguments()
+        self.config_manager.set_write_behind(self.arguments.config_flush_interval)
         self.set_logging_level()
         self.check_single_instance()
         self.update_default_params()
-        self.handle_updates()
+        if self.arguments.export_state:
+            self.handle_export_state()
+        elif self.arguments.rollback:
+            self.handle_rollback()
+        elif self.arguments.daemon:
+            self.handle_daemon()
+        else:
+            self.handle_updates()
+        self.config_manager.close()
         self.cleanup_mutex()
 
 
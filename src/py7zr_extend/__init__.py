@@ -0,0 +1,3 @@
+from . import zstd
+
+zstd.apply()
\ No newline at end of file
@@ -0,0 +1,32 @@
+# Monkey-patch py7zr's Zstandard compressor so it can use libzstd worker threads.
+# py7zr builds the compressor with the level only, so the thread count is module state
+# set by the UpdateManager (see set_threads) and shared by every archive of the run.
+
+from py7zr import compressor
+from py7zr.properties import FILTER_ZSTD
+
+# Number of libzstd worker threads (0 or 1 = compress in the calling thread)
+threads = 0
+
+
+def set_threads(count):
+    """Set the number of libzstd worker threads used when writing zstd .7z archives."""
+    global threads
+    threads = count
+
+
+class ThreadedZstdCompressor(compressor.ZstdCompressor):
+    """py7zr ZstdCompressor that enables libzstd multi-threading."""
+
+    def __init__(self, level):
+        zstd = compressor.zstd
+        options = {zstd.CompressionParameter.compression_level: level}
+        if threads > 1:
+            options[zstd.CompressionParameter.nb_workers] = threads
+        self.compressor = zstd.ZstdCompressor(options=options)
+
+
+def apply():
+    """Apply the zstd compressor monkey-patch."""
+    _, decompressor = compressor.algorithm_class_map[FILTER_ZSTD]
+    compressor.algorithm_class_map[FILTER_ZSTD] = (ThreadedZstdCompressor, decompressor)
@@ -1,5 +1,13 @@
 from . import consumer
 from . import producer
+from . import host_limit
+from . import metadata
+from . import resume
+from . import digest
 
 consumer.apply()
-producer.apply()
\ No newline at end of file
+producer.apply()
+digest.apply()
+host_limit.apply()
+metadata.apply()
+resume.apply()
\ No newline at end of file
@@ -0,0 +1,63 @@
+# Monkey-patch pypdl so the sha256 of every download is computed while its bytes go through memory,
+# without reading the finished file again:
+# - A single-segment download is written in order, so each chunk is hashed as it is written.
+# - Multi-segment downloads are written out of order, but pypdl copies every segment into the final
+#   file when they are done (combine_files), so the segments are hashed during that copy.
+# The hex digests are stored in download_digests, keyed by the file_path pypdl writes to.
+
+import time
+import asyncio
+import hashlib
+import aiofiles
+from aiofiles import os as aio_os
+from pypdl import consumer
+from pypdl.downloader import BaseDownloader, MEGABYTE
+from pypdl.utils import CHUNKSIZE
+
+# file_path -> sha256 hex digest of the finished download, popped by the Downloader
+download_digests = {}
+
+
+async def _patched_download(self, url, path, mode, **kwargs):
+    # same loop as BaseDownloader.download, plus the digest when the file is written from its start
+    digest = hashlib.sha256() if mode == "wb" else None
+    start_time = time.monotonic()
+    async with self.session.get(url, **kwargs) as response:
+        async with aiofiles.open(path, mode) as file:
+            async for chunk in response.content.iter_chunked(MEGABYTE):
+                await file.write(chunk)
+                if digest is not None:
+                    digest.update(chunk)
+                self.curr += len(chunk)
+
+                if self.speed_limit > 0:
+                    expected_time = self.curr / self.speed_limit
+                    current_time = time.monotonic() - start_time
+                    sleep_time = expected_time - current_time
+                    if sleep_time > 0:
+                        await asyncio.sleep(sleep_time)
+
+    if digest is not None:
+        download_digests[path] = digest.hexdigest()
+
+
+async def _patched_combine_files(file_path, segments):
+    digest = hashlib.sha256()
+    async with aiofiles.open(file_path, "wb") as dest:
+        for segment in range(segments):
+            segment_file = f"{file_path}.{segment}"
+            async with aiofiles.open(segment_file, "rb") as src:
+                while chunk := await src.read(CHUNKSIZE):
+                    await dest.write(chunk)
+                    digest.update(chunk)
+
+            await aio_os.remove(segment_file)
+
+    await aio_os.remove(f"{file_path}.json")
+    download_digests[file_path] = digest.hexdigest()
+
+
+def apply():
+    """Apply the digest monkey-patches (before host_limit, which wraps the download method)."""
+    BaseDownloader.download = _patched_download
+    consumer.combine_files = _patched_combine_files
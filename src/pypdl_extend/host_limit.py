@@ -0,0 +1,34 @@
+# Monkey-patch pypdl's BaseDownloader.download so every segment request goes through
+# the HostLimiter shared with the scrape engine (see universal_updater/HostLimiter.py).
+# pypdl opens one connection per segment, so without this N workers x M segments
+# connections can hit the same host at once.
+
+from pypdl.downloader import BaseDownloader
+
+# Limiter shared by every download of the run, set by the UpdateManager
+host_limiter = None
+
+# Reference to the method the limiter wraps, saved by apply() so earlier patches (digest.py) are kept
+_original_download = None
+
+
+def set_host_limiter(limiter):
+    """Set the HostLimiter used by every pypdl segment download (None disables it)."""
+    global host_limiter
+    host_limiter = limiter
+
+
+async def _patched_download(self, url, path, mode, **kwargs):
+    limiter = host_limiter
+    if limiter is None:
+        return await _original_download(self, url, path, mode, **kwargs)
+
+    async with limiter.limit(url):
+        return await _original_download(self, url, path, mode, **kwargs)
+
+
+def apply():
+    """Apply the downloader monkey-patch."""
+    global _original_download
+    _original_download = BaseDownloader.download
+    BaseDownloader.download = _patched_download
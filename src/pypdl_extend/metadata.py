@@ -0,0 +1,111 @@
+# Monkey-patch pypdl's Producer metadata probe so the Downloader does not need its own HEAD request:
+# - The HEAD follows redirects (pypdl's does not), so the filename falls back to the final URL
+#   (e.g. SourceForge "latest/download" links) when there is no Content-Disposition.
+# - The Content-Type and final URL of the probe are recorded in download_probes.
+# - A validator registered by the Downloader rejects invalid downloads (e.g. HTML error pages)
+#   before any segment is requested, and a 4xx answer to the probe is recorded the same way.
+#   Rejected tasks are failed without retry by producer.py.
+
+from urllib.parse import unquote, urlparse
+from aiohttp import ClientResponseError
+from pypdl.producer import Producer
+
+from . import host_limit
+
+# Probes registered by the Downloader, keyed by the file_path given to pypdl (the update folder).
+# Each probe is a dict with:
+# - validate: optional callable(content_type) that raises if the download must be rejected
+# - file_path, url, content_type: filled after the probe
+# - error: exception raised by validate or the ClientResponseError of a 4xx answer, if any
+download_probes = {}
+
+# 4xx answers that are worth retrying
+_RETRY_STATUS_CODES = (408, 429)
+
+# Save reference to the original method so we can delegate the task setup to it
+_original_fetch_task_info = Producer._fetch_task_info
+
+
+class ProbeRejectedError(Exception):
+    """Raised when the probed download is rejected (by a registered validator or a 4xx answer)."""
+
+
+async def _extract_metadata(session, method, url, **kwargs):
+    limiter = host_limit.host_limiter
+    if limiter is not None:
+        await limiter.acquire(url)
+
+    try:
+        async with session.request(method, url, allow_redirects=True, **kwargs) as resp:
+            h = {k.lower(): v.strip('"') for k, v in resp.headers.items()}
+            return {
+                "accept-ranges": h.get("accept-ranges", "").lower() == "bytes",
+                "content-length": h.get("content-length", ""),
+                "content-range": h.get("content-range", ""),
+                "etag": h.get("etag", ""),
+                # keep the quotes here, pypdl needs them to parse quoted filenames
+                "content-disposition": resp.headers.get("content-disposition", ""),
+                "content-type": h.get("content-type", ""),
+                "url": str(resp.url),
+                "status": resp.status,
+            }
+    finally:
+        if limiter is not None:
+            limiter.release(url)
+
+
+async def _patched_fetch_metadata(self, url, **kwargs):
+    kwargs["raise_for_status"] = False
+    metadata = await _extract_metadata(self._session, "HEAD", url, **kwargs)
+
+    if not (
+        metadata["accept-ranges"]
+        and metadata["etag"]
+        and metadata["content-disposition"]
+        and (metadata["content-length"] or metadata["content-range"])
+    ):
+        kwargs.setdefault("headers", {}).update({"Range": "bytes=0-0"})
+        kwargs["raise_for_status"] = True
+        metadata.update(await _extract_metadata(self._session, "GET", url, **kwargs))
+
+    # pypdl names the file after the original URL, use the final one instead
+    final_name = unquote(urlparse(metadata["url"]).path.split("/")[-1])
+    if not metadata["content-disposition"] and final_name:
+        metadata["content-disposition"] = f'attachment; filename="{final_name}"'
+
+    self._probe_metadata = metadata
+    return metadata
+
+
+async def _patched_fetch_task_info(self, url, file_path, multisegment, **kwargs):
+    self._probe_metadata = {}
+    probe = download_probes.get(file_path)
+    try:
+        result = await _original_fetch_task_info(self, url, file_path, multisegment, **kwargs)
+    except ClientResponseError as error:
+        if probe is None or not 400 <= error.status < 500 or error.status in _RETRY_STATUS_CODES:
+            raise
+
+        probe["error"] = error
+        raise ProbeRejectedError(str(error)) from error
+
+    if probe is None:
+        return result
+
+    probe["file_path"] = result[1]
+    probe["url"] = self._probe_metadata.get("url", url)
+    probe["content_type"] = self._probe_metadata.get("content-type", "")
+    if probe.get("validate"):
+        try:
+            probe["validate"](probe["content_type"])
+        except Exception as error:
+            probe["error"] = error
+            raise ProbeRejectedError(str(error)) from error
+
+    return result
+
+
+def apply():
+    """Apply the metadata probe monkey-patch."""
+    Producer._fetch_metadata = _patched_fetch_metadata
+    Producer._fetch_task_info = _patched_fetch_task_info
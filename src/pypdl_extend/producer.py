@@ -1,60 +1,100 @@
 # Monkey-patch pypdl's Producer.enqueue_tasks to handle special task states
-# flagged by the patched consumer (see fatal_state.py):
+# flagged by the patched consumer (see fatal_state.py) and by the metadata probe (see metadata.py):
 # - Fatal task IDs are immediately marked as failed (no retry).
 # - Single-segment-fallback task IDs are reconfigured to multisegment=False
 #   and given an extra retry attempt before being re-dispatched.
+# - Tasks whose metadata probe was rejected (invalid Content-Type or a 4xx answer) are marked as failed
+#   at once. pypdl waits 3 seconds and retries every failed probe, so the loop is replaced as a whole
+#   (same logic as pypdl 1.5.7) to fail these without the wait.
 
+import asyncio
 from pypdl.producer import Producer
+from pypdl.utils import check_main_thread_exception
 
 from .fatal_state import fatal_task_ids, force_single_segment_task_ids
+from .metadata import download_probes, ProbeRejectedError
 
-# Save reference to the original method so we can delegate non-special cases to it
-_original_enqueue_tasks = Producer.enqueue_tasks
+# Seconds pypdl waits before retrying a failed probe
+_PROBE_RETRY_DELAY = 3
+
+
+def _is_rejected(producer, task_id):
+    probe = download_probes.get(producer._tasks[task_id].file_path)
+    return probe is not None and probe.get('error') is not None
 
 
 async def _patched_enqueue_tasks(self, in_queue, out_queue):
-    # Wrap in_queue.get to intercept flagged task IDs before normal retry logic
-    original_get = in_queue.get
-
-    async def filtered_get():
-        while True:
-            batch = await original_get()
-            if batch is None:
-                return None
-
-            remaining_ids = []
-            for task_id in batch:
-                if task_id in fatal_task_ids:
-                    # Fatal — mark as failed without retrying
-                    task = self._tasks[task_id]
-                    self.add_failed(task.url, task.callback)
-                    fatal_task_ids.discard(task_id)
-                elif task_id in force_single_segment_task_ids:
-                    # Reconfigure task to single-segment mode and grant one more attempt
-                    task = self._tasks[task_id]
-                    task.multisegment = False
-
-                    # Bump tries so this task gets re-dispatched (it was decremented to 0
-                    # during the failed multi-segment attempt)
-                    task.tries = max(task.tries, 1)
-                    force_single_segment_task_ids.discard(task_id)
-                    remaining_ids.append(task_id)
-                else:
-                    # Normal task — let the original logic handle it
-                    remaining_ids.append(task_id)
-
-            if remaining_ids:
-                return remaining_ids
-
-    # All IDs in this batch were handled here; loop and get the next batch
-    in_queue.get = filtered_get
-    try:
-        await _original_enqueue_tasks(self, in_queue, out_queue)
-    finally:
-        # Restore original get to avoid side effects if Pypdl is reused
-        in_queue.get = original_get
+    self._logger.debug("Producer started")
+    while True:
+        batch = await in_queue.get()
+        if batch is None:
+            break
+
+        total_size = 0
+        for task_id in batch:
+            task = self._tasks[task_id]
+            if _is_rejected(self, task_id):
+                # Rejected by the metadata probe — fail without retrying
+                self.add_failed(task.url, task.callback)
+                continue
+
+            if task_id in fatal_task_ids:
+                # Fatal — mark as failed without retrying
+                fatal_task_ids.discard(task_id)
+                self.add_failed(task.url, task.callback)
+                continue
+
+            if task_id in force_single_segment_task_ids:
+                # Reconfigure task to single-segment mode and grant one more attempt
+                # (tries was decremented to 0 during the failed multi-segment attempt)
+                force_single_segment_task_ids.discard(task_id)
+                task.multisegment = False
+                task.tries = max(task.tries, 1)
+
+            if task.tries <= 0:
+                self.add_failed(task.url, task.callback)
+                continue
+
+            task.tries -= 1
+            try:
+                url, file_path, multisegment, etag, size, kwargs = await self._fetch_task_info(
+                    task.url, task.file_path, task.multisegment, **task.kwargs
+                )
+            except asyncio.CancelledError:
+                raise
+            except ProbeRejectedError:
+                # the Downloader reports the recorded error
+                self.add_failed(task.url, task.callback)
+                continue
+            except Exception as error:
+                check_main_thread_exception(error)
+                self._logger.debug(f"Failed to get header for {task}, skipping task")
+                self._logger.exception(error)
+                await asyncio.sleep(_PROBE_RETRY_DELAY)
+                task.url = task.mirrors.pop(0) if task.mirrors else task.default_url
+                await in_queue.put([task_id])
+                continue
+
+            if size.value == 0:
+                self._logger.debug("Size is Unavailable, setting size to None")
+                self._size_avail = False
+
+            total_size -= task.size.value
+            total_size += size.value
+            task.size = size
+            await out_queue.put((
+                task_id,
+                (url, file_path, multisegment, etag, size, task.segments, task.overwrite, task.speed_limit,
+                 task.etag_validation, task.hash_algorithms, task.callback, kwargs),
+            ))
+
+        if self._size is None:
+            self._size = total_size
+        else:
+            self._size += total_size
+    self._logger.debug("Producer exited")
 
 
 def apply():
     """Apply the producer monkey-patch."""
-    Producer.enqueue_tasks = _patched_enqueue_tasks
\ No newline at end of file
+    Producer.enqueue_tasks = _patched_enqueue_tasks
@@ -0,0 +1,68 @@
+# Monkey-patch pypdl's create_segment_table to make resuming a multi-segment download safe
+# across process restarts. pypdl keeps a "<file>.json" segment map next to the segments, but:
+# - with etag_validation=False it resumes any map, even one written for another URL;
+# - with etag_validation=True it never resumes when the server sends no ETag.
+# This patch resumes only when the URL and the total size match, and the ETag too if the server sends one.
+
+import json
+from aiofiles import open as fopen
+from aiofiles import os as aio_os
+from pypdl import consumer
+from pypdl.utils import Size
+
+
+async def _load_progress(progress_file):
+    if not await aio_os.path.exists(progress_file):
+        return None
+
+    try:
+        async with fopen(progress_file, "r") as f:
+            return json.loads(await f.read())
+    except (OSError, ValueError):
+        return None
+
+
+async def _patched_create_segment_table(url, file_path, segments, size, etag, etag_validation):
+    progress_file = file_path + ".json"
+    overwrite = True
+
+    progress = await _load_progress(progress_file)
+    if (
+        progress
+        and progress.get("url") == url
+        and progress.get("size") == size.value
+        and size.value > 0
+        and (not etag_validation or not (etag or progress.get("etag")) or progress.get("etag") == etag)
+    ):
+        segments = progress["segments"]
+        overwrite = False
+
+    async with fopen(progress_file, "w") as f:
+        await f.write(
+            json.dumps(
+                {"url": url, "etag": etag, "size": size.value, "segments": segments},
+                indent=4,
+            )
+        )
+
+    table = {"url": url, "segments": segments, "overwrite": overwrite}
+    partition_size, add_bytes = divmod(size.value, segments)
+
+    for segment in range(segments):
+        start = size.start + partition_size * segment
+        end = size.start + partition_size * (segment + 1) - 1  # range is inclusive
+
+        if segment == segments - 1:
+            end += add_bytes
+
+        table[segment] = {
+            "segment_size": Size(start, end),
+            "segment_path": f"{file_path}.{segment}",
+        }
+
+    return table
+
+
+def apply():
+    """Apply the segment table monkey-patch."""
+    consumer.create_segment_table = _patched_create_segment_table
@@ -0,0 +1,57 @@
+import zlib
+
+
+class CheckSchedule:
+    """
+    Decides when a tool has to be checked again, from its check_interval (hours) and the last_checked time
+    kept in its state.
+    Each cycle is shortened by a part of the jitter derived from the tool name and its last check, so it is
+    stable between runs but differs per tool: tools that were checked together drift apart over time instead
+    of all becoming due in the same run and hitting the same hosts at once.
+    """
+
+    def __init__(self, default_interval=0, jitter=0.1, min_interval=0):
+        """
+        Initialize the schedule.
+
+        :param default_interval: Hours between checks of the tools that do not set check_interval (0 = every run)
+        :param jitter: Fraction of the interval a cycle can be shortened by (0 to 1)
+        :param min_interval: Minimum hours between checks of any tool (used by the daemon mode)
+        """
+        self.default_interval = default_interval
+        self.jitter = jitter
+        self.min_interval = min_interval
+
+    def get_interval(self, tool_config):
+        """
+        Get the check interval of a tool.
+
+        :param tool_config: ToolSpec of the tool
+        :return: Interval in seconds (0 = every run)
+        """
+        interval = tool_config.check_interval
+        if interval is None:
+            interval = self.default_interval
+
+        return max(interval, self.min_interval) * 3600
+
+    def get_next_check(self, name, tool_config):
+        """
+        Get the time the next check of a tool is due.
+
+        :param name: Name of the tool
+        :param tool_config: ToolSpec of the tool, with its state
+        :return: Unix timestamp, 0 if the tool is due on every run or was never checked
+        """
+        interval = self.get_interval(tool_config)
+        last_checked = tool_config.get('last_checked', '')
+        if not interval or not last_checked:
+            return 0
+
+        try:
+            last_checked = float(last_checked)
+        except ValueError:
+            return 0
+
+        spread = zlib.crc32(f'{name}:{last_checked}'.encode()) / 0xFFFFFFFF
+        return last_checked + interval * (1 - self.jitter * spread)
@@ -1,25 +1,137 @@
+import os
+import atexit
 import configparser
 import threading
 import colorama
+import logging
+
+from universal_updater.StateStore import StateStore
+from universal_updater.ToolSpec import ToolSpec
 
 
 class ConfigManager:
     """
     Manages configuration settings, including getting and setting values,
     as well as updating the local version of a tool.
+    With a state file, the runtime values written by the updater (STATE_KEYS) are kept in a StateStore
+    and tools.ini only holds the configuration. State keys found in tools.ini (an older install or a
+    manual edit) are moved to the store the first time the state is used.
+    In write-behind mode (set_write_behind) the changes to the config file are kept in memory and
+    written on a timer, after a number of changes, and on flush()/close() or at exit.
+    Every write goes to a temporary file that is synced and renamed over the config file.
+    reload_if_changed() reads the file again when it was changed by someone else (see the daemon mode).
+    The tools are parsed into ToolSpec objects once, the first time a tool is requested (after the working
+    directory is set), and a tool with a bad config keeps its error until then.
     """
 
-    def __init__(self, config_file_name):
+    # runtime values written by the updater
+    STATE_KEYS = ('local_version', 'previous_version', 'local_digest', 'last_checked', 'last_duration')
+
+    def __init__(self, config_file_name, state_file_name=None):
         """
         Initialize with the name of the config file.
 
         :param config_file_name: Name of the configuration file
+        :param state_file_name: Optional name of the SQLite state database (None keeps the state in the config file)
         """
         self.config = configparser.ConfigParser()
         self.config_file_name = config_file_name
+        self.state_store = StateStore(state_file_name) if state_file_name else None
+        self._state_imported = False
+        self._tool_specs = None
         self._lock = threading.Lock()
+        self.flush_interval = 0
+        self.flush_threshold = 0
+        self._pending_changes = 0
+        self._flush_timer = None
+        self.stats = {'changes': 0, 'writes': 0}
+        self._file_signature = self._get_file_signature()
         self.config.read(self.config_file_name)
 
+    def set_write_behind(self, flush_interval, flush_threshold=32):
+        """
+        Buffer the changes to the config file instead of writing it on every change.
+
+        :param flush_interval: Seconds a change can wait before it is written (0 = write every change)
+        :param flush_threshold: Number of pending changes that triggers a write right away
+        """
+        with self._lock:
+            if flush_interval and not self.flush_interval:
+                atexit.register(self.flush)
+            elif not flush_interval and self.flush_interval:
+                atexit.unregister(self.flush)
+
+            self.flush_interval = flush_interval
+            self.flush_threshold = flush_threshold
+            if not flush_interval:
+                self._flush()
+
+    def _get_file_signature(self):
+        """
+        Get the modification time and size of the config file.
+
+        :return: Tuple, or None if the file does not exist
+        """
+        try:
+            stat = os.stat(self.config_file_name)
+        except OSError:
+            return None
+
+        return stat.st_mtime_ns, stat.st_size
+
+    def reload_if_changed(self):
+        """
+        Read the config file again if it changed on disk since it was last read or written by this instance.
+        The changes of the file that were not written yet are dropped (the edited file wins), the values kept
+        in the state store are not affected and state keys added by hand are moved to the store again.
+
+        :return: True if the file was reloaded
+        """
+        with self._lock:
+            signature = self._get_file_signature()
+            if signature == self._file_signature:
+                return False
+
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+
+            self._pending_changes = 0
+            self._file_signature = signature
+            self.config = configparser.ConfigParser()
+            self.config.read(self.config_file_name)
+            self._tool_specs = None
+            self._state_imported = False
+
+            return True
+
+    def _get_state_store(self):
+        """
+        Get the state store, moving the state keys of the config file into it on the first call
+        (caller must hold the lock).
+
+        :return: StateStore instance or None if the state is kept in the config file
+        """
+        if self.state_store is None or self._state_imported:
+            return self.state_store
+
+        found = False
+        for section in self.config.sections():
+            values = {key: self.config.get(section, key) for key in self.STATE_KEYS
+                      if self.config.has_option(section, key)}
+            if values:
+                found = True
+                self.state_store.set_many(section, values)
+                for key in values:
+                    self.config.remove_option(section, key)
+
+        # the store has the values now, so the config file can lose them
+        if found:
+            self._config_changed()
+
+        self._state_imported = True
+        return self.state_store
+
     def get_config(self, section, key, fallback=None):
         """
         Get a configuration value.
@@ -30,6 +142,12 @@ class ConfigManager:
         :return: Value of the configuration key
         """
         with self._lock:
+            state_store = self._get_state_store() if key in self.STATE_KEYS else None
+            if state_store:
+                value = state_store.get(section, key)
+                if value is not None:
+                    return value
+
             return self.config.get(section, key, fallback=fallback)
 
     def set_config(self, section, key, value):
@@ -41,25 +159,67 @@ class ConfigManager:
         :param value: Value to set
         """
         with self._lock:
+            state_store = self._get_state_store() if key in self.STATE_KEYS else None
+            if state_store:
+                state_store.set(section, key, value)
+                return
+
             if not self.config.has_section(section):
                 self.config.add_section(section)
 
             self.config.set(section, key, value)
-            self._write_config()
+            if self._tool_specs is not None:
+                self._tool_specs.pop(section, None)
+            self._config_changed()
 
     def get_tool_config(self, name):
         """
         Retrieve the configuration for a specific tool.
 
         :param name: Name of the tool
-        :return: Dictionary containing the tool's configuration
+        :return: ToolSpec of the tool, with its state
+        :raises Exception: If the tool does not exist or its config is not valid
         """
         with self._lock:
             if name in self.config.sections():
-                return dict(self.config.items(name))
+                state_store = self._get_state_store()
+                spec = self._get_tool_spec(name)
+                if isinstance(spec, Exception):
+                    raise spec
+
+                return spec.with_state(state_store.get_tool_state(name)) if state_store else spec
 
         raise Exception(colorama.Fore.RED + f'No entries were found for {name}')
 
+    def _get_tool_spec(self, name):
+        """
+        Get the spec of a tool, parsing every section on the first call and a changed section again
+        (caller must hold the lock).
+
+        :param name: Name of the tool
+        :return: ToolSpec, or the Exception raised while building it
+        """
+        if self._tool_specs is None:
+            self._tool_specs = {}
+            for section in self.config.sections():
+                self._tool_specs[section] = self._build_tool_spec(section)
+        elif name not in self._tool_specs:
+            self._tool_specs[name] = self._build_tool_spec(name)
+
+        return self._tool_specs[name]
+
+    def _build_tool_spec(self, section):
+        """
+        Build the spec of a section (caller must hold the lock).
+
+        :param section: Section in the config file
+        :return: ToolSpec, or the Exception raised while building it
+        """
+        try:
+            return ToolSpec(section, dict(self.config.items(section)), os.getcwd())
+        except Exception as error:
+            return error
+
     def get_boolean(self, section, option, fallback=None):
         """
         Get a boolean configuration value.
@@ -90,6 +250,42 @@ class ConfigManager:
         """
         self.set_config(name, 'local_version', version)
 
+    def export_state(self, file_name):
+        """
+        Write a copy of the config file with the state of every tool merged back in (the old format).
+
+        :param file_name: Name of the file to write
+        :return: Number of tools exported
+        """
+        with self._lock:
+            exported = configparser.ConfigParser()
+            exported.read_dict(self.config)
+            state_store = self._get_state_store()
+            state = state_store.get_all() if state_store else {}
+
+        count = 0
+        for section, values in state.items():
+            # tools removed from the config file are not exported
+            if not exported.has_section(section):
+                continue
+
+            count += 1
+            for key, value in values.items():
+                exported.set(section, key, value)
+
+        self._write_file(exported, file_name)
+
+        return count
+
+    def close(self):
+        """
+        Write the pending changes and close the state store, if any.
+        """
+        self.flush()
+        logging.debug(f'Config: {self.stats["changes"]} changes written in {self.stats["writes"]} writes')
+        if self.state_store is not None:
+            self.state_store.close()
+
     def save_config(self):
         """
         Save the current configuration to file.
@@ -97,9 +293,60 @@ class ConfigManager:
         with self._lock:
             self._write_config()
 
+    def flush(self):
+        """
+        Write the pending changes to the config file, if any.
+        """
+        with self._lock:
+            self._flush()
+
+    def _config_changed(self):
+        """
+        Record a change of the config file and write it now or later, depending on the write-behind
+        settings (caller must hold the lock).
+        """
+        self.stats['changes'] += 1
+        self._pending_changes += 1
+        if not self.flush_interval or self._pending_changes >= self.flush_threshold:
+            self._flush()
+        elif self._flush_timer is None:
+            self._flush_timer = threading.Timer(self.flush_interval, self.flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
+    def _flush(self):
+        """
+        Write the pending changes (caller must hold the lock).
+        """
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+
+        if self._pending_changes:
+            self._write_config()
+
     def _write_config(self):
         """
         Write the current configuration to file (caller must hold the lock).
         """
-        with open(self.config_file_name, 'w') as config_file:
-            self.config.write(config_file)
+        self._write_file(self.config, self.config_file_name)
+        self._file_signature = self._get_file_signature()
+        self._pending_changes = 0
+        self.stats['writes'] += 1
+
+    @staticmethod
+    def _write_file(config, file_name):
+        """
+        Write a configuration to a temporary file, sync it and rename it over the file, so a crash
+        leaves either the old or the new content, never a partial file.
+
+        :param config: ConfigParser to write
+        :param file_name: Name of the file to replace
+        """
+        temp_file_name = f'{file_name}.tmp'
+        with open(temp_file_name, 'w') as config_file:
+            config.write(config_file)
+            config_file.flush()
+            os.fsync(config_file.fileno())
+
+        os.replace(temp_file_name, file_name)
@@ -0,0 +1,202 @@
+import os
+import json
+import time
+import pathlib
+import hashlib
+import threading
+import logging
+
+from universal_updater.Helpers import Helpers
+from universal_updater.CopyEngine import CopyEngine
+
+
+class DownloadCache:
+    """
+    Content-addressed cache of downloaded files, keyed by (URL, version).
+    Blobs are stored by sha256 and evicted in LRU order when the cache grows over its size cap.
+    Files are always copied in and out of the cache (a reflink where the filesystem supports it), never hard
+    linked: an installed file is written to by later updates and by the tools themselves.
+    """
+
+    def __init__(self, cache_folder_path, max_size):
+        """
+        Initialize the cache and load its index.
+
+        :param cache_folder_path: Path to the folder where the blobs and the index are stored
+        :param max_size: Maximum size of all the blobs in bytes
+        """
+        self.cache_folder_path = pathlib.Path(cache_folder_path)
+        self.blobs_path = self.cache_folder_path.joinpath('blobs')
+        self.index_path = self.cache_folder_path.joinpath('index.json')
+        self.max_size = max_size
+        self.copy_engine = CopyEngine()
+        self._lock = threading.Lock()
+        self.blobs_path.mkdir(parents=True, exist_ok=True)
+        self.index = self._load_index()
+
+    def _load_index(self):
+        """
+        Load the index from disk, dropping entries whose blob is gone.
+
+        :return: Dict of key -> entry
+        """
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as index_file:
+                index = json.load(index_file)
+        except (OSError, ValueError):
+            return {}
+
+        return {key: entry for key, entry in index.items() if self.blobs_path.joinpath(entry['sha256']).exists()}
+
+    def _save_index(self):
+        """
+        Write the index to disk (caller must hold the lock).
+        """
+        temp_path = self.index_path.with_suffix('.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as index_file:
+            json.dump(self.index, index_file)
+        os.replace(temp_path, self.index_path)
+
+    @staticmethod
+    def get_key(url, version):
+        """
+        Get the cache key of a download.
+
+        :param url: Download URL
+        :param version: Version of the tool
+        :return: Key string
+        """
+        return hashlib.sha256(f'{url}\n{version}'.encode()).hexdigest()
+
+    @staticmethod
+    def hash_file(file_path):
+        """
+        Compute the sha256 of a file.
+
+        :param file_path: Path to the file
+        :return: Hex digest string
+        """
+        return Helpers.get_file_digest(file_path)
+
+    def contains(self, url, version):
+        """
+        Check if a download is cached.
+
+        :param url: Download URL
+        :param version: Version of the tool
+        :return: Boolean
+        """
+        with self._lock:
+            return self.get_key(url, version) in self.index
+
+    def get_sha256(self, url, version):
+        """
+        Get the sha256 of a cached download without reading it.
+
+        :param url: Download URL
+        :param version: Version of the tool
+        :return: Hex digest string or None if it is not cached
+        """
+        with self._lock:
+            entry = self.index.get(self.get_key(url, version))
+            return entry['sha256'] if entry else None
+
+    def get(self, url, version, dest_folder_path):
+        """
+        Restore a cached download into a folder.
+
+        :param url: Download URL
+        :param version: Version of the tool
+        :param dest_folder_path: Folder where the file will be placed
+        :return: Path to the restored file or None if it is not cached
+        """
+        key = self.get_key(url, version)
+        with self._lock:
+            entry = self.index.get(key)
+            if not entry:
+                return None
+
+            entry['last_used'] = time.time()
+            self._save_index()
+
+        dest_path = pathlib.Path(dest_folder_path).joinpath(entry['file_name'])
+        try:
+            self.copy_engine.copy_file(self.blobs_path.joinpath(entry['sha256']), dest_path)
+        except OSError as error:
+            # the blob was removed behind the index, download it again
+            logging.debug(f'Download cache: {entry["file_name"]} is not readable ({error}), dropping it')
+            dest_path.unlink(missing_ok=True)
+            with self._lock:
+                self.index.pop(key, None)
+                self._save_index()
+            return None
+
+        return dest_path
+
+    def put(self, url, version, file_path, sha256=None):
+        """
+        Store a downloaded file in the cache.
+
+        :param url: Download URL
+        :param version: Version of the tool
+        :param file_path: Path to the downloaded file
+        :param sha256: Optional digest of the file if it is already known
+        :return: sha256 of the file
+        """
+        file_path = pathlib.Path(file_path)
+        sha256 = sha256 or self.hash_file(file_path)
+        size = file_path.stat().st_size
+        if size > self.max_size:
+            return sha256
+
+        # copy outside the lock, the other tools keep using the cache meanwhile
+        blob_path = self.blobs_path.joinpath(sha256)
+        temp_blob_path = None
+        if not blob_path.exists():
+            temp_blob_path = blob_path.with_suffix(f'.{threading.get_ident()}.tmp')
+            self.copy_engine.copy_file(file_path, temp_blob_path)
+
+        with self._lock:
+            if temp_blob_path is not None:
+                if blob_path.exists():
+                    temp_blob_path.unlink()
+                else:
+                    os.replace(temp_blob_path, blob_path)
+
+            self.index[self.get_key(url, version)] = {
+                'sha256': sha256,
+                'file_name': file_path.name,
+                'size': size,
+                'last_used': time.time(),
+            }
+            self._evict()
+            self._save_index()
+
+        return sha256
+
+    def _evict(self):
+        """
+        Remove the least recently used blobs until the cache fits its size cap (caller must hold the lock).
+        """
+        blob_sizes = {}
+        for entry in self.index.values():
+            blob_sizes[entry['sha256']] = entry['size']
+
+        total_size = sum(blob_sizes.values())
+        entries = sorted(self.index.items(), key=lambda item: item[1]['last_used'])
+        for key, entry in entries:
+            if total_size <= self.max_size:
+                break
+
+            del self.index[key]
+
+            # the same blob can be shared by several keys (e.g. a mirror URL)
+            if any(other['sha256'] == entry['sha256'] for other in self.index.values()):
+                continue
+
+            total_size -= blob_sizes[entry['sha256']]
+            logging.debug(f'Download cache: evicting {entry["file_name"]} ({entry["sha256"]})')
+            try:
+                self.blobs_path.joinpath(entry['sha256']).unlink()
+            except OSError:
+                pass
@@ -1,6 +1,6 @@
+import os
 import pathlib
 import aiohttp
-import requests
 import colorama
 import logging
 
@@ -33,9 +33,11 @@ class Downloader:
         self.user_agent = user_agent
         self.disable_progress = disable_progress
         self.update_folder_path = update_folder_path
+        self.partial_folder_path = None
         self.download_retries = download_retries
         self.download_segments = download_segments
         self.request_timeout = request_timeout
+        self.file_digest = None
         self.tool_name = ""
 
     def validate_content_type(self, content_type):
@@ -56,74 +58,90 @@ class Downloader:
                 f'server returned Content-Type "{mime_type}" instead of a binary or archive file'
             )
 
-    def resolve_filename(self, url, check_content_type=True, cookies=None):
-        """
-        Resolve the real filename via HEAD request.
-        Handles redirects and Content-Disposition headers.
-
-        :param url: Original download URL
-        :param check_content_type: Flag to validate the Content-Type header
-        :param cookies: Optional cookies dict to include in the request
-        :return: Resolved filename string
-        """
-        response = requests.head(url, headers={'User-Agent': self.user_agent},
-                                         cookies=cookies, allow_redirects=True, timeout=self.request_timeout)
-        response.raise_for_status()
-        logging.debug("HEAD %s -> status=%s headers=%s", url, response.status_code, dict(response.headers))
-
-        # validate Content-Type to detect invalid downloads (e.g. error pages)
-        if check_content_type:
-            self.validate_content_type(response.headers.get('content-type', ''))
-
-        # try to get filename from Content-Disposition header
-        content_disposition = response.headers.get('content-disposition', '')
-        if 'filename=' in content_disposition:
-            return content_disposition.split('filename=')[-1].strip('"; ')
-
-        # fallback to filename from final URL (after redirects)
-        return Helpers.get_filename_from_url(response.url)
-
-    def download_file(self, url, file_name, cookies=None):
+    def download_file(self, url, file_name=None, cookies=None, check_content_type=True):
         """
         Download a file from a given URL using pypdl.
+        If file_name is not known, pypdl resolves it (and the Content-Type) from its own metadata probe,
+        so no extra request is needed.
+        If partial_folder_path is set, the segments are written there and kept on failure, so the
+        next run resumes them with range requests. The finished file is moved to the update folder.
+        The sha256 of the file, computed while it is written (see pypdl_extend/digest.py), is stored
+        in file_digest.
 
         :param url: URL of the file to download
-        :param file_name: Resolved filename for the download
+        :param file_name: Resolved filename for the download, or None to resolve it from the probe
         :param cookies: Optional cookies dict to include in the request
+        :param check_content_type: Flag to validate the Content-Type header of the probe
         :return: Path where the file has been saved
         """
-        dest_path = pathlib.Path(self.update_folder_path).joinpath(file_name)
+        self.file_digest = None
+        download_folder_path = pathlib.Path(self.partial_folder_path or self.update_folder_path)
+        download_folder_path.mkdir(parents=True, exist_ok=True)
+
+        if file_name:
+            file_path = str(download_folder_path.joinpath(file_name))
+            probe = {'validate': None}
+        else:
+            # pypdl names the file inside the folder, the probe reports the name back
+            file_path = str(download_folder_path)
+            probe = {'validate': self.validate_content_type if check_content_type else None}
+        pypdl_extend.metadata.download_probes[file_path] = probe
 
         # create a logger adapter to prefix pypdl messages with the tool name
         # this propagates to the root logger, so ColoredFormatter applies automatically
+        base_logger = logging.getLogger('downloader')
         logger = logging.LoggerAdapter(
-            logging.getLogger('downloader'),
+            base_logger,
             {'tool_name': self.tool_name}
         )
         logger.process = lambda msg, kwargs: (f'{self.tool_name}: {msg}', kwargs)
 
         downloader = Pypdl(logger=logger)
-        result = downloader.start(
-            url=url,
-            file_path=str(dest_path),
-            segments=self.download_segments,
-            display=not self.disable_progress,
-            multisegment=True,
-            block=True,
-            retries=self.download_retries,
-            overwrite=True,
-            etag_validation=False,
-            headers={'User-Agent': self.user_agent},
-            cookies=cookies,
-            timeout=aiohttp.ClientTimeout(total=self.request_timeout),
-        )
+        try:
+            result = downloader.start(
+                url=url,
+                file_path=file_path,
+                segments=self.download_segments,
+                display=not self.disable_progress,
+                multisegment=True,
+                block=True,
+                retries=self.download_retries,
+                overwrite=True,
+                etag_validation=True,
+                headers={'User-Agent': self.user_agent},
+                cookies=cookies,
+                timeout=aiohttp.ClientTimeout(total=self.request_timeout),
+            )
+        finally:
+            pypdl_extend.metadata.download_probes.pop(file_path, None)
+
+        error = probe.get('error')
+        if isinstance(error, aiohttp.ClientResponseError):
+            raise Exception(colorama.Fore.RED + f'{self.tool_name}: download failed, server returned '
+                                                f'HTTP {error.status} {error.message} for {error.request_info.real_url}')
+        if error:
+            raise error
 
         if downloader.failed or not result:
             raise Exception(colorama.Fore.RED + f'{self.tool_name}: download failed')
 
+        if not file_name:
+            logging.debug("%s: probe %s -> %s (%s)", self.tool_name, url, probe.get('url'), probe.get('content_type'))
+            file_path = probe['file_path']
+
+        # a file left by an earlier run (no bytes written now) has no digest yet
+        self.file_digest = pypdl_extend.digest.download_digests.pop(file_path, None) or \
+            Helpers.get_file_digest(file_path)
+
+        dest_path = pathlib.Path(self.update_folder_path).joinpath(pathlib.Path(file_path).name)
+        if self.partial_folder_path:
+            os.replace(file_path, dest_path)
+            Helpers.delete_folder(self.partial_folder_path)
+
         return dest_path
 
-    def download_from_web(self, tool_name, download_url, check_content_type=True, cookies=None):
+    def download_from_web(self, tool_name, download_url, check_content_type=True, cookies=None, file_name=None,
+                          content_type=None):
         """
         Perform a download step for a given tool.
 
@@ -131,12 +149,19 @@ class Downloader:
         :param download_url: URL from which to download the tool
         :param check_content_type: Flag to validate the Content-Type header
         :param cookies: Optional cookies dict to include in the request
+        :param file_name: Optional filename already resolved by the scrape step (e.g. from its HEAD request)
+        :param content_type: Optional Content-Type already returned by the scrape step
         :return: Path where the file has been saved
         """
         self.tool_name = tool_name
 
-        # resolve real filename (handles redirects and Content-Disposition)
-        file_name = self.resolve_filename(download_url, check_content_type, cookies)
-        logging.info(f'{self.tool_name}: downloading update "{file_name}"')
+        if file_name:
+            # the scrape step already probed this URL, reuse its headers
+            if check_content_type:
+                self.validate_content_type(content_type)
+            logging.info(f'{self.tool_name}: downloading update "{file_name}"')
+        else:
+            logging.info(f'{self.tool_name}: downloading update from {download_url}')
 
-        return self.download_file(url=download_url, file_name=file_name, cookies=cookies)
+        return self.download_file(url=download_url, file_name=file_name, cookies=cookies,
+                                  check_content_type=check_content_type)
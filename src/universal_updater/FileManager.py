@@ -5,20 +5,31 @@ import colorama
 import logging
 
 from universal_updater.Helpers import Helpers
+from universal_updater.TreeSync import TreeSync
+from universal_updater.CopyEngine import CopyEngine
 
 
 class FileManager:
     """Handles file and folder operations like cleanup and copy."""
 
-    def __init__(self, script_path, disable_clean):
+    def __init__(self, script_path, disable_clean, incremental_install=False, copy_engine=None,
+                 atomic_install=False):
         """
         Initialize FileManager with script path and clean option.
 
         :param script_path: Path to the script
         :param disable_clean: Flag to disable folder cleanup
+        :param incremental_install: Flag to copy only new or changed files when saving
+        :param copy_engine: Optional CopyEngine used to copy the tool into its folder
+        :param atomic_install: Flag to stage the new version next to the tool folder and swap it in
         """
         self.script_path = script_path
         self.disable_clean = disable_clean
+        self.incremental_install = incremental_install
+        self.copy_engine = copy_engine or CopyEngine()
+        self.atomic_install = atomic_install
+        self.previous_saved = False
+        self.tree_sync = TreeSync(pathlib.Path(script_path).joinpath('cache', 'manifests'))
         self.tool_name = ""
         self.tool_config = {}
 
@@ -31,6 +42,7 @@ class FileManager:
         """
         self.tool_name = tool_name
         self.tool_config = tool_config
+        self.previous_saved = False
 
     def get_tool_install_path(self):
         """
@@ -38,15 +50,8 @@ class FileManager:
 
         :return: Absolute path object for the tool's installation folder
         """
-        folder = self.tool_config.get('folder')
-        if not folder:
-            raise Exception(colorama.Fore.RED + f'{self.tool_name}: "folder" key is required in config')
-
-        tool_folder_path = pathlib.Path(folder)
-        if not tool_folder_path.is_absolute():
-            tool_folder_path = pathlib.Path(self.script_path).joinpath(tool_folder_path)
-
-        return tool_folder_path.resolve(strict=False)
+        # resolved when the config is loaded
+        return self.tool_config.folder_path
 
     def processing_tool_path(self, tool_unpack_path):
         """
@@ -84,14 +89,123 @@ class FileManager:
         """
         logging.info(f'{self.tool_name}: saving to folder {tool_folder_path}')
 
-        use_merge = self.tool_config.get('merge', None)
-        if not self.disable_clean and not use_merge:
-            Helpers.cleanup_folder(tool_folder_path)
+        use_merge = self.tool_config.merge
+        atomic_install = self.atomic_install or self.tool_config.atomic_install
+        incremental_install = self.incremental_install or self.tool_config.incremental_install
+        if atomic_install:
+            self.save_atomic(tool_folder_path, tool_unpack_path, keep_old_files=self.disable_clean or use_merge)
+        elif incremental_install:
+            self.tree_sync.sync(self.tool_name, tool_unpack_path, tool_folder_path,
+                                delete_removed=not self.disable_clean and not use_merge)
+        else:
+            if not self.disable_clean and not use_merge:
+                Helpers.cleanup_folder(tool_folder_path)
 
-        shutil.copytree(tool_unpack_path, tool_folder_path, copy_function=shutil.copy, dirs_exist_ok=True)
+            self.copy_engine.copy_tree(tool_unpack_path, tool_folder_path)
 
         return {
             'tool_name': self.tool_name,
             'tool_folder': str(tool_folder_path),
             'save_compress_name': '',
         }
+
+    def get_sibling_path(self, tool_folder_path, suffix):
+        """
+        Get the path of a hidden folder next to the tool folder (same filesystem, so it can be renamed in).
+
+        :param tool_folder_path: Path to the tool folder
+        :param suffix: Purpose of the folder ('staging' or 'previous')
+        :return: Path object
+        """
+        return tool_folder_path.parent.joinpath(f'.{tool_folder_path.name}.{suffix}')
+
+    def copy_missing_files(self, old_folder_path, new_folder_path):
+        """
+        Copy the files of the old tree that are not in the new one (disable_clean / merge semantics).
+        They are copied rather than hard linked so the tree kept for rollback never changes.
+
+        :param old_folder_path: Currently installed tree
+        :param new_folder_path: Staged tree
+        """
+        folders, files = self.copy_engine.list_tree(old_folder_path)
+        for folder in folders:
+            new_folder_path.joinpath(folder).mkdir(parents=True, exist_ok=True)
+
+        for relative_path, _ in files:
+            dest_path = new_folder_path.joinpath(relative_path)
+            if not dest_path.exists():
+                shutil.copy2(old_folder_path.joinpath(relative_path), dest_path)
+
+    def swap_folders(self, tool_folder_path, staging_path, previous_path):
+        """
+        Swap the staged tree in, keeping the current one as the previous version.
+
+        :param tool_folder_path: Path to the tool folder
+        :param staging_path: Path to the staged tree
+        :param previous_path: Path where the current tree is kept
+        :raises Exception: If a folder cannot be renamed (e.g. a file of the tool is in use)
+        """
+        Helpers.delete_folder(previous_path)
+        try:
+            if tool_folder_path.exists():
+                os.rename(tool_folder_path, previous_path)
+
+            try:
+                os.rename(staging_path, tool_folder_path)
+            except OSError:
+                if previous_path.exists() and not tool_folder_path.exists():
+                    os.rename(previous_path, tool_folder_path)
+                raise
+        except OSError as error:
+            raise Exception(colorama.Fore.RED + f'{self.tool_name}: cannot swap folder {tool_folder_path}: {error}')
+
+    def save_atomic(self, tool_folder_path, tool_unpack_path, keep_old_files):
+        """
+        Stage the new version next to the tool folder and swap it in with renames.
+        The old tree is kept next to the tool folder for rollback().
+
+        :param tool_folder_path: Path to the folder where the tool will be saved
+        :param tool_unpack_path: Path where the tool is unpacked
+        :param keep_old_files: Carry over the installed files that are not in the new version
+        """
+        staging_path = self.get_sibling_path(tool_folder_path, 'staging')
+        previous_path = self.get_sibling_path(tool_folder_path, 'previous')
+        Helpers.delete_folder(staging_path)
+
+        # a rename writes nothing when updates/ is on the same volume as the tool folder
+        try:
+            os.rename(tool_unpack_path, staging_path)
+        except OSError:
+            logging.debug(f'{self.tool_name}: cannot move the update to {staging_path}, copying it')
+            self.copy_engine.copy_tree(tool_unpack_path, staging_path)
+
+        try:
+            if keep_old_files and tool_folder_path.exists():
+                self.copy_missing_files(tool_folder_path, staging_path)
+
+            self.swap_folders(tool_folder_path, staging_path, previous_path)
+        finally:
+            Helpers.delete_folder(staging_path)
+
+        self.previous_saved = True
+
+    def rollback(self):
+        """
+        Swap the tool folder with the version kept by the last atomic install.
+        Running it again restores the newer version.
+
+        :raises Exception: If there is no previous version
+        """
+        tool_folder_path = self.get_tool_install_path()
+        staging_path = self.get_sibling_path(tool_folder_path, 'staging')
+        previous_path = self.get_sibling_path(tool_folder_path, 'previous')
+        if not previous_path.is_dir():
+            raise Exception(colorama.Fore.RED + f'{self.tool_name}: there is no previous version to roll back to')
+
+        Helpers.delete_folder(staging_path)
+        os.rename(previous_path, staging_path)
+        try:
+            self.swap_folders(tool_folder_path, staging_path, previous_path)
+        finally:
+            if staging_path.exists() and not previous_path.exists():
+                os.rename(staging_path, previous_path)
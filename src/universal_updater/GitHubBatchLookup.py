@@ -0,0 +1,130 @@
+import json
+import logging
+
+
+class GitHubBatchLookup:
+    """
+    Fetches the latest release of many GitHub repositories with a few GraphQL queries.
+    The results use the same shape as the REST "releases/latest" response, so the scraper
+    can consume them without extra requests.
+    """
+
+    GRAPHQL_URL = 'https://api.github.com/graphql'
+
+    RELEASE_FIELDS = """
+        latestRelease {
+          tagName
+          releaseAssets(first: 100) {
+            nodes { name downloadUrl digest }
+          }
+        }"""
+
+    def __init__(self, http_engine, token, user_agent, batch_size=50, request_timeout=30):
+        """
+        Initialize the lookup.
+
+        :param http_engine: HttpEngine used for the requests
+        :param token: GitHub API token (GraphQL always requires authentication)
+        :param user_agent: User agent string for HTTP requests
+        :param batch_size: Number of repositories per GraphQL query
+        :param request_timeout: Timeout in seconds for HTTP requests
+        """
+        self.http_engine = http_engine
+        self.token = token
+        self.user_agent = user_agent
+        self.batch_size = batch_size
+        self.request_timeout = request_timeout
+
+    def build_query(self, repos):
+        """
+        Build one GraphQL query for a chunk of repositories, one alias per repository.
+
+        :param repos: List of "owner/name" strings
+        :return: GraphQL query string
+        """
+        fields = []
+        for index, repo in enumerate(repos):
+            owner, name = repo.split('/', 1)
+            fields.append(f'r{index}: repository(owner: {json.dumps(owner)}, name: {json.dumps(name)}) {{'
+                          f'{self.RELEASE_FIELDS}\n}}')
+
+        return 'query {\n' + '\n'.join(fields) + '\n}'
+
+    @staticmethod
+    def to_rest_release(release):
+        """
+        Convert a GraphQL latestRelease node to the REST "releases/latest" shape.
+
+        :param release: latestRelease node
+        :return: Dict with 'tag_name' and 'assets'
+        """
+        return {
+            'tag_name': release.get('tagName'),
+            'assets': [
+                {
+                    'name': asset.get('name'),
+                    'browser_download_url': asset.get('downloadUrl'),
+                    'digest': asset.get('digest'),
+                }
+                for asset in release.get('releaseAssets', {}).get('nodes', [])
+            ],
+        }
+
+    async def fetch_chunk(self, repos):
+        """
+        Fetch the latest release of a chunk of repositories.
+
+        :param repos: List of "owner/name" strings
+        :return: Dict of repo -> release (REST shape). Repos without a result are omitted.
+        """
+        headers = {
+            'User-Agent': self.user_agent,
+            'Authorization': f'bearer {self.token}',
+        }
+        response = await self.http_engine.request('post', self.GRAPHQL_URL, headers=headers,
+                                                  json={'query': self.build_query(repos)},
+                                                  timeout=self.request_timeout)
+        response.raise_for_status()
+        payload = response.json()
+
+        # partial errors (e.g. a renamed repo) have the path of their repo and still return data for the
+        # rest of the chunk, the others (token scope, schema) fail the whole query
+        data = payload.get('data')
+        for error in payload.get('errors') or []:
+            if data and error.get('path'):
+                logging.debug("GitHub GraphQL error: %s", error.get('message'))
+            else:
+                logging.warning(f'GitHub GraphQL error, falling back to REST: {error.get("message")}')
+
+        if not data:
+            if not payload.get('errors'):
+                logging.warning('GitHub GraphQL batch lookup returned no data, falling back to REST')
+            return {}
+
+        releases = {}
+        for index, repo in enumerate(repos):
+            repository = data.get(f'r{index}')
+            if repository and repository.get('latestRelease'):
+                releases[repo] = self.to_rest_release(repository['latestRelease'])
+
+        return releases
+
+    async def fetch(self, repos):
+        """
+        Fetch the latest release of every repository, chunked by batch_size.
+        Failed chunks are skipped so those tools fall back to the REST API.
+
+        :param repos: Iterable of "owner/name" strings
+        :return: Dict of repo -> release (REST shape)
+        """
+        repos = sorted({repo for repo in repos if repo and repo.count('/') == 1})
+        releases = {}
+        for start in range(0, len(repos), self.batch_size):
+            chunk = repos[start:start + self.batch_size]
+            try:
+                releases.update(await self.fetch_chunk(chunk))
+            except Exception as exception:
+                logging.warning(f'GitHub GraphQL batch lookup failed, falling back to REST: {exception}')
+
+        logging.debug(f'GitHub GraphQL batch lookup: {len(releases)} of {len(repos)} repos resolved')
+        return releases
@@ -1,16 +1,20 @@
 import pathlib
 import shutil
+import hashlib
 from urllib.parse import urlparse
 
 
 class Helpers:
 
     @staticmethod
-    def cleanup_folder(path):
+    def cleanup_folder(path, exclude=()):
         """
-        Clean up a folder by deleting all its contents.
+        Clean up a folder by deleting all its contents, except the names listed in exclude.
         """
         for file in pathlib.Path(path).iterdir():
+            if file.name in exclude:
+                continue
+
             if file.is_dir():
                 shutil.rmtree(file)
             else:
@@ -44,3 +48,44 @@ class Helpers:
             return ''
 
         return pathlib.Path(scheme_removed).name
+
+    @staticmethod
+    def get_filename_from_headers(headers, url: str) -> str:
+        """
+        Extract the filename from a Content-Disposition header, falling back to the (final) URL.
+        """
+        content_disposition = headers.get('content-disposition', '')
+        if 'filename=' in content_disposition:
+            return content_disposition.split('filename=')[-1].strip('"; ')
+
+        return Helpers.get_filename_from_url(url)
+
+    @staticmethod
+    def get_file_digest(file_path, algorithm='sha256') -> str:
+        """
+        Compute the hex digest of a file with any hashlib algorithm.
+        """
+        digest = hashlib.new(algorithm)
+        with open(file_path, 'rb') as file:
+            for chunk in iter(lambda: file.read(1024 * 1024), b''):
+                digest.update(chunk)
+
+        return digest.hexdigest()
+
+    @staticmethod
+    def parse_digest(value, default_algorithm='sha256'):
+        """
+        Normalize a digest like "sha256:ABC..." or a bare hex string to "algorithm:hex", or None if invalid.
+        """
+        if not value or not isinstance(value, str):
+            return None
+
+        algorithm, _, hex_digest = value.strip().rpartition(':')
+        algorithm = algorithm.lower().replace('-', '') or default_algorithm
+        hex_digest = hex_digest.lower()
+        if algorithm not in hashlib.algorithms_available or not hex_digest:
+            return None
+        if any(char not in '0123456789abcdef' for char in hex_digest):
+            return None
+
+        return f'{algorithm}:{hex_digest}'
@@ -0,0 +1,116 @@
+import time
+import asyncio
+import threading
+import contextlib
+from urllib.parse import urlparse
+
+
+class HostLimiter:
+    """
+    Limits the number of concurrent connections and the request rate per host (URL netloc).
+    The rate limit is opt-in: by default only the connections are limited, and a host that answers
+    429 is slowed down with backoff().
+    Uses a thread lock so it can be shared by the scrape engine loop, every pypdl download loop
+    and the worker threads at the same time.
+    """
+
+    POLL_INTERVAL = 0.05
+
+    def __init__(self, max_connections=6, requests_per_second=0):
+        """
+        Initialize the limiter.
+
+        :param max_connections: Maximum concurrent connections per host, 0 disables the limit
+        :param requests_per_second: Maximum new requests per second per host, 0 disables the limit
+        """
+        self.max_connections = max_connections
+        self.request_interval = 1 / requests_per_second if requests_per_second > 0 else 0
+        self._lock = threading.Lock()
+        self._hosts = {}
+
+    @staticmethod
+    def get_host(url):
+        """
+        Get the limiter key of a URL.
+
+        :param url: Request URL
+        :return: Lowercase netloc of the URL
+        """
+        return urlparse(str(url)).netloc.lower()
+
+    def _host_state(self, host):
+        """
+        Get the state of a host (caller must hold the lock).
+
+        :param host: Host key
+        :return: Dict with 'active' connections and 'next_time' of the next allowed request
+        """
+        return self._hosts.setdefault(host, {'active': 0, 'next_time': 0.0})
+
+    def _try_acquire(self, host):
+        """
+        Try to take a connection slot for a host.
+
+        :param host: Host key
+        :return: 0 if the slot was taken, otherwise the seconds to wait before trying again
+        """
+        now = time.monotonic()
+        with self._lock:
+            state = self._host_state(host)
+            if self.max_connections and state['active'] >= self.max_connections:
+                return self.POLL_INTERVAL
+
+            if now < state['next_time']:
+                return state['next_time'] - now
+
+            state['active'] += 1
+            state['next_time'] = now + self.request_interval
+            return 0
+
+    async def acquire(self, url):
+        """
+        Wait (without blocking the event loop) until a request to the URL host is allowed.
+
+        :param url: Request URL
+        """
+        host = self.get_host(url)
+        while True:
+            wait = self._try_acquire(host)
+            if not wait:
+                return
+
+            await asyncio.sleep(wait)
+
+    def release(self, url):
+        """
+        Release the connection slot taken by acquire().
+
+        :param url: Request URL
+        """
+        with self._lock:
+            state = self._host_state(self.get_host(url))
+            state['active'] = max(state['active'] - 1, 0)
+
+    def backoff(self, url, seconds):
+        """
+        Delay every new request to the URL host (e.g. after a 429 response).
+
+        :param url: Request URL
+        :param seconds: Seconds to wait before the next request
+        """
+        with self._lock:
+            state = self._host_state(self.get_host(url))
+            state['next_time'] = max(state['next_time'], time.monotonic() + seconds)
+
+    @contextlib.asynccontextmanager
+    async def limit(self, url):
+        """
+        Async context manager that holds a connection slot for the URL host.
+
+        :param url: Request URL
+        """
+        await self.acquire(url)
+        try:
+            yield
+        finally:
+            self.release(url)
@@ -0,0 +1,166 @@
+import asyncio
+import threading
+import aiohttp
+
+from universal_updater.HttpResponse import HttpResponse
+
+
+class HttpEngine:
+    """
+    Shared asyncio HTTP engine. Owns one event loop (running in a background thread)
+    and one aiohttp connection pool, so connections and TLS sessions are reused across tools.
+    """
+
+    def __init__(self, connection_limit=100, host_limiter=None):
+        """
+        Initialize the engine. The event loop and the session are created on first use.
+
+        :param connection_limit: Maximum number of simultaneous connections in the pool
+        :param host_limiter: Optional HostLimiter applied to every request
+        """
+        self.connection_limit = connection_limit
+        self.host_limiter = host_limiter
+        self._loop = None
+        self._thread = None
+        self._session = None
+        self._lock = threading.Lock()
+
+    def _start(self):
+        """
+        Start the event loop thread if it is not running yet.
+        """
+        with self._lock:
+            if self._loop:
+                return
+
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self._loop.run_forever, name='HttpEngine', daemon=True)
+            self._thread.start()
+
+    def run(self, coroutine):
+        """
+        Run a coroutine on the engine loop and wait for its result.
+        Must not be called from the engine loop itself.
+
+        :param coroutine: Coroutine to run
+        :return: Result of the coroutine
+        """
+        self._start()
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    async def _get_session(self):
+        """
+        Get the shared session, creating it on the engine loop if needed.
+
+        :return: aiohttp.ClientSession instance
+        """
+        if self._session is None:
+            # cookies are tracked per tool by the scraper, never shared between tools
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.connection_limit, ttl_dns_cache=300),
+                cookie_jar=aiohttp.DummyCookieJar(),
+            )
+
+        return self._session
+
+    async def request(self, method, url, headers=None, cookies=None, timeout=30, json=None, scanner=None):
+        """
+        Perform an HTTP request following redirects and read the whole body.
+        With a scanner, a 200 body is fed to it instead and the connection is closed once it has every match.
+
+        :param method: HTTP method name ('get', 'head' or 'post')
+        :param url: The URL to request
+        :param headers: Optional dictionary of HTTP headers
+        :param cookies: Optional dictionary of cookies to send
+        :param timeout: Timeout in seconds for the whole request
+        :param json: Optional object sent as JSON body
+        :param scanner: Optional StreamScanner, the response content is then empty unless the scanner keeps it
+        :return: HttpResponse object
+        """
+        if self.host_limiter is None:
+            return await self._request(method, url, headers, cookies, timeout, json, scanner)
+
+        async with self.host_limiter.limit(url):
+            response = await self._request(method, url, headers, cookies, timeout, json, scanner)
+
+        # slow down every worker hitting this host, not only the one that got the 429
+        if response.status_code == 429:
+            retry_after = response.headers.get('retry-after', '')
+            self.host_limiter.backoff(url, int(retry_after) if retry_after.isdigit() else 1)
+
+        return response
+
+    async def _request(self, method, url, headers, cookies, timeout, json, scanner):
+        """
+        Perform the request on the shared session (see request()).
+
+        :param method: HTTP method name ('get', 'head' or 'post')
+        :param url: The URL to request
+        :param headers: Dictionary of HTTP headers
+        :param cookies: Dictionary of cookies to send
+        :param timeout: Timeout in seconds for the whole request
+        :param json: Object sent as JSON body or None
+        :param scanner: StreamScanner or None
+        :return: HttpResponse object
+        """
+        session = await self._get_session()
+        async with session.request(method.upper(), url, headers=headers, cookies=cookies, json=json,
+                                   allow_redirects=True, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+            if scanner is not None and response.status == 200:
+                content = await self._scan(response, scanner)
+            else:
+                content = await response.read()
+
+            response_cookies = {}
+            for step in (*response.history, response):
+                for name, morsel in step.cookies.items():
+                    response_cookies[name] = morsel.value
+
+            return HttpResponse(
+                status_code=response.status,
+                url=str(response.url),
+                headers=response.headers,
+                content=content,
+                encoding=response.charset,
+                reason=response.reason or '',
+                cookies=response_cookies,
+            )
+
+    @staticmethod
+    async def _scan(response, scanner):
+        """
+        Feed the response body to a scanner as it arrives.
+
+        :param response: aiohttp response
+        :param scanner: StreamScanner instance
+        :return: Body kept by the scanner, or empty bytes
+        """
+        scanner.start(response.headers, response.charset)
+        async for chunk in response.content.iter_any():
+            if scanner.feed(chunk) and not scanner.keep_body:
+                # the rest of the body is not needed, drop the connection instead of reading it
+                response.close()
+                break
+
+        scanner.finish()
+
+        return bytes(scanner.body) if scanner.body is not None else b''
+
+    def close(self):
+        """
+        Close the shared session and stop the event loop thread.
+        """
+        with self._lock:
+            loop = self._loop
+            self._loop = None
+
+        if not loop:
+            return
+
+        if self._session is not None:
+            asyncio.run_coroutine_threadsafe(self._session.close(), loop).result()
+            self._session = None
+
+        loop.call_soon_threadsafe(loop.stop)
+        self._thread.join()
+        loop.close()
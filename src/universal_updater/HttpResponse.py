@@ -0,0 +1,56 @@
+import json
+from multidict import CIMultiDict
+
+
+class HttpResponse:
+    """
+    Fully buffered HTTP response returned by the HttpEngine.
+    Mimics the parts of requests.Response used by the scrapers.
+    """
+
+    def __init__(self, status_code, url, headers=None, content=b'', encoding=None, reason='', cookies=None):
+        """
+        Initialize the response with the data read from the server.
+
+        :param status_code: HTTP status code
+        :param url: Final URL (after redirects)
+        :param headers: Response headers
+        :param content: Raw response body
+        :param encoding: Charset used to decode the body, default is utf-8
+        :param reason: HTTP reason phrase
+        :param cookies: Dict of cookies set by the server along the redirect chain
+        """
+        self.status_code = status_code
+        self.url = url
+        self.headers = CIMultiDict(headers or {})
+        self.content = content
+        self.encoding = encoding or 'utf-8'
+        self.reason = reason
+        self.cookies = cookies or {}
+
+    @property
+    def text(self):
+        """
+        Decoded response body.
+
+        :return: Body as string
+        """
+        return self.content.decode(self.encoding, errors='replace')
+
+    def json(self):
+        """
+        Parse the response body as JSON.
+
+        :return: Parsed JSON object
+        """
+        return json.loads(self.text)
+
+    def raise_for_status(self):
+        """
+        Raise an exception if the server returned an error status.
+
+        :raises Exception: If the status code is 400 or greater
+        """
+        if self.status_code >= 400:
+            kind = 'Client' if self.status_code < 500 else 'Server'
+            raise Exception(f'{self.status_code} {kind} Error: {self.reason} for url: {self.url}')
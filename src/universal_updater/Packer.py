@@ -1,31 +1,51 @@
 import zipfile
-import rarfile
 import py7zr
+import py7zr_extend  # noqa: F401
 import pathlib
 import os
-import shutil
+import time
 import colorama
 import logging
 
 from universal_updater.Helpers import Helpers
+from universal_updater.ParallelZipWriter import ParallelZipWriter
+from universal_updater.ParallelExtractor import ParallelExtractor
 
 
 class Packer:
     """Handles unpacking and repacking of compressed files."""
 
-    def __init__(self, update_folder_path, save_format_type, disable_clean):
+    # repack method -> (extension, valid levels)
+    REPACK_METHODS = {
+        'lzma2': ('.7z', range(0, 10)),
+        'zstd': ('.7z', range(1, 23)),
+        'deflate': ('.zip', range(0, 10)),
+        'store': ('.zip', range(0, 1)),
+    }
+
+    def __init__(self, update_folder_path, save_format_type, disable_clean,
+                 repack_method='lzma2', repack_level=-1, repack_threads=0, unpack_workers=0):
         """
         Initialize the Packer with configurations.
 
         :param update_folder_path: Path to the update folder
         :param save_format_type: Format type for saving compressed files
         :param disable_clean: Flag to disable cleaning
+        :param repack_method: Default compression method for repacks (lzma2, zstd, deflate or store)
+        :param repack_level: Default compression level for repacks (-1 = default of the method)
+        :param repack_threads: Number of compression threads (0 = number of CPUs)
+        :param unpack_workers: Number of members extracted in parallel (0 = number of CPUs)
         """
         self.update_folder_path = update_folder_path
         self.save_format_type = save_format_type
         self.disable_clean = disable_clean
+        self.repack_method = repack_method
+        self.repack_level = repack_level
+        self.repack_threads = repack_threads
+        self.extractor = ParallelExtractor(unpack_workers)
         self.tool_name = ""
         self.tool_config = {}
+        self.unpacked_size = 0
         self.valid_extensions = ['.zip', '.rar', '.7z']
 
     def tool_setup(self, tool_name, tool_config):
@@ -37,6 +57,7 @@ class Packer:
         """
         self.tool_name = tool_name
         self.tool_config = tool_config
+        self.unpacked_size = 0
 
     def unpack_zip(self, file_path, unpack_path, file_pass=None):
         """
@@ -45,12 +66,12 @@ class Packer:
         :param file_path: Path to the ZIP file
         :param unpack_path: Destination path to unpack
         :param file_pass: Password for the ZIP file, default is None
+        :return: Number of bytes extracted
         """
         if file_pass:
             file_pass = bytes(file_pass, 'utf-8')
-        
-        with zipfile.ZipFile(file_path, 'r') as compressed:
-            compressed.extractall(unpack_path, pwd=file_pass)
+
+        return self.extractor.extract_zip(file_path, unpack_path, file_pass)
 
     def unpack_rar(self, file_path, unpack_path, file_pass=None):
         """
@@ -59,12 +80,12 @@ class Packer:
         :param file_path: Path to the RAR file
         :param unpack_path: Destination path to unpack
         :param file_pass: Password for the RAR file, default is None
+        :return: Number of bytes extracted
         """
         # download first "UnRAR for Windows" from https://www.rarlab.com/rar_add.htm
         # direct link: https://www.rarlab.com/rar/unrarw32.exe
         # new link: https://www.win-rar.com/predownload.html?&Version=32bit&L=0.
-        with rarfile.RarFile(file_path, 'r') as compressed:
-            compressed.extractall(unpack_path, pwd=file_pass)
+        return self.extractor.extract_rar(file_path, unpack_path, file_pass)
 
     def unpack_7z(self, file_path, unpack_path, file_pass=None):
         """
@@ -73,9 +94,9 @@ class Packer:
         :param file_path: Path to the 7z file
         :param unpack_path: Destination path to unpack
         :param file_pass: Password for the 7z file, default is None
+        :return: Number of bytes extracted
         """
-        with py7zr.SevenZipFile(file_path, 'r', password=file_pass) as compressed:
-            compressed.extractall(unpack_path)
+        return self.extractor.extract_7z(file_path, unpack_path, file_pass)
 
     def unpack(self, file_path, unpack_path, file_pass=None):
         """
@@ -91,16 +112,23 @@ class Packer:
         if file_ext not in self.valid_extensions:
             return False
 
+        start_time = time.perf_counter()
         try:
             if file_ext == '.zip':
-                self.unpack_zip(file_path, unpack_path, file_pass)
+                unpacked_size = self.unpack_zip(file_path, unpack_path, file_pass)
             elif file_ext == '.rar':
-                self.unpack_rar(file_path, unpack_path, file_pass)
-            elif file_ext == '.7z':
-                self.unpack_7z(file_path, unpack_path, file_pass)
+                unpacked_size = self.unpack_rar(file_path, unpack_path, file_pass)
+            else:
+                unpacked_size = self.unpack_7z(file_path, unpack_path, file_pass)
         except Exception as error:
             raise Exception(colorama.Fore.RED + f'An error occurred during unpacking: {error}')
 
+        self.unpacked_size += unpacked_size
+        elapsed = max(time.perf_counter() - start_time, 1e-6)
+        logging.debug(f'{self.tool_name}: unpacked {pathlib.Path(file_path).name} '
+                      f'({unpacked_size / 1048576:.1f} MiB in {elapsed:.2f} s, {unpacked_size / 1048576 / elapsed:.1f} MiB/s, '
+                      f'{self.extractor.workers} workers)')
+
         return True
 
     def unpack_nested(self, unpack_path):
@@ -123,7 +151,7 @@ class Packer:
         :return: Path to the unpacked folder
         """
         unpack_path = pathlib.Path(file_path).parent
-        update_file_pass = self.tool_config.get('update_file_pass', None)
+        update_file_pass = self.tool_config.update_file_pass
 
         if self.unpack(file_path, unpack_path, update_file_pass):
             os.remove(file_path)
@@ -133,48 +161,128 @@ class Packer:
 
         return unpack_path
 
-    def repack_save_compress_name(self, name, version):
+    def get_repack_settings(self):
+        """
+        Get the compression method and level for the current tool (tool config overrides the defaults).
+        The tool values are validated by ToolSpec, only the mix with the global defaults is checked here.
+
+        :return: Tuple (method, level)
+        :raises Exception: If the level is not valid for the method
+        """
+        method = self.tool_config.repack_method or self.repack_method
+        level = self.tool_config.repack_level
+        if level is None:
+            level = self.repack_level
+        if level != -1 and level not in self.REPACK_METHODS[method][1]:
+            raise Exception(colorama.Fore.RED + f'{self.tool_name}: invalid repack_level for "{method}"')
+
+        return method, level
+
+    def repack_save_compress_name(self, name, version, extension=None):
         """
         Generate the compressed file name based on the save format type.
 
         :param name: Name of the tool
         :param version: Version of the tool
+        :param extension: File extension, default is the one of the current repack method
         :return: Compressed file name
         """
-        pack_name = f'{name} - {version}.7z'
+        if extension is None:
+            extension = self.REPACK_METHODS[self.get_repack_settings()[0]][0]
+
+        pack_name = f'{name} - {version}{extension}'
         if self.save_format_type == 'version':
-            pack_name = f'{version}.7z'
+            pack_name = f'{version}{extension}'
         elif self.save_format_type == 'name':
-            pack_name = f'{name}.7z'
+            pack_name = f'{name}{extension}'
 
         return pack_name
 
+    def write_archive(self, archive_path, source_path, base_archive_path=None):
+        """
+        Compress the content of a folder with the repack method of the current tool.
+
+        :param archive_path: Path of the archive to create
+        :param source_path: Folder to compress (its items are stored at the archive root)
+        :param base_archive_path: Optional ZIP file returned by repack_merge() to merge with
+        """
+        method, level = self.get_repack_settings()
+        logging.debug(f'{self.tool_name}: repack with {method} (level {level}, threads {self.repack_threads})')
+
+        if method in ('deflate', 'store'):
+            writer = ParallelZipWriter(method, level, self.repack_threads)
+            result = writer.write_tree(archive_path, source_path, base_archive_path)
+            logging.debug(f'{self.tool_name}: wrote {result["members"]} members, '
+                          f'{result["reused"]} reused from the old archive')
+            return
+
+        filters = None
+        if method == 'zstd':
+            filters = [{'id': py7zr.FILTER_ZSTD, 'level': 3 if level == -1 else level}]
+        elif level != -1:
+            filters = [{'id': py7zr.FILTER_X86}, {'id': py7zr.FILTER_LZMA2, 'preset': level}]
+
+        with py7zr.SevenZipFile(archive_path, 'w', filters=filters) as archive:
+            for item in sorted(pathlib.Path(source_path).iterdir()):
+                archive.writeall(item, item.name)
+
+    def unpack_missing(self, file_path, unpack_path):
+        """
+        Unpack only the members of an archive that are not in a folder yet, straight into it.
+
+        :param file_path: Path to the .7z or .zip file
+        :param unpack_path: Folder to complete
+        """
+        existing = set()
+        for folder, dir_names, file_names in os.walk(unpack_path):
+            relative_folder = pathlib.PurePath(os.path.relpath(folder, unpack_path))
+            existing.update(relative_folder.joinpath(name).as_posix() for name in dir_names + file_names)
+
+        if pathlib.Path(file_path).suffix == '.zip':
+            with zipfile.ZipFile(file_path, 'r') as compressed:
+                members = [info for info in compressed.infolist() if info.filename.rstrip('/') not in existing]
+                compressed.extractall(unpack_path, members)
+            return
+
+        with py7zr.SevenZipFile(file_path, 'r') as compressed:
+            targets = [name for name in compressed.getnames() if name not in existing]
+            if targets:
+                compressed.extract(path=unpack_path, targets=targets)
+
     def repack_merge(self, tool_folder_path, tool_unpack_path):
         """
         Merge the new unpacked version with the old one.
+        A ZIP repack reuses the unchanged members of the old archive as they are (see write_archive);
+        otherwise only the old files that the new version does not replace are unpacked.
 
         :param tool_folder_path: Path to the tool folder
         :param tool_unpack_path: Path to the unpacked folder
-        :return: None
+        :return: Path to the old archive if write_archive() has to merge it, None otherwise
         """
         # checks and preparation
+        # the repack method may have changed since the old archive was written
         old_version = self.tool_config.get('local_version', '0')
-        old_compress_name = self.repack_save_compress_name(self.tool_name, old_version)
-        old_tool_compress_path = tool_folder_path.joinpath(old_compress_name)
-        if not old_tool_compress_path.exists():
-            return False
+        extensions = dict.fromkeys([self.REPACK_METHODS[self.get_repack_settings()[0]][0], '.7z', '.zip'])
+        for extension in extensions:
+            old_compress_name = self.repack_save_compress_name(self.tool_name, old_version, extension)
+            old_tool_compress_path = tool_folder_path.joinpath(old_compress_name)
+            if old_tool_compress_path.exists():
+                break
+        else:
+            return None
 
         logging.info(f'{self.tool_name}: merging with "{old_compress_name}"')
 
-        # unpack old version
-        old_tool_unpack_folder = pathlib.Path(old_compress_name).stem
-        old_tool_unpack_path = pathlib.Path(self.update_folder_path).joinpath(old_tool_unpack_folder)
-        self.unpack(old_tool_compress_path, old_tool_unpack_path)
+        if old_tool_compress_path.suffix == '.zip' and \
+                self.REPACK_METHODS[self.get_repack_settings()[0]][0] == '.zip':
+            return old_tool_compress_path
 
-        # merge
-        shutil.copytree(tool_unpack_path, old_tool_unpack_path, copy_function=shutil.copy, dirs_exist_ok=True)
-        shutil.rmtree(tool_unpack_path)
-        shutil.move(old_tool_unpack_path, tool_unpack_path, copy_function=shutil.copy)
+        try:
+            self.unpack_missing(old_tool_compress_path, tool_unpack_path)
+        except Exception as error:
+            raise Exception(colorama.Fore.RED + f'An error occurred during unpacking: {error}')
+
+        return None
 
     def repack_step(self, tool_folder_path, tool_unpack_path, unpack_folder_path, version):
         """
@@ -186,23 +294,27 @@ class Packer:
         :param version: Version of the tool
         :return: Dictionary containing tool name, tool folder, and compressed file name
         """
-        use_merge = self.tool_config.get('merge', None)
+        base_archive_path = None
+        use_merge = self.tool_config.merge
         if use_merge:
-            self.repack_merge(tool_folder_path, tool_unpack_path)
+            base_archive_path = self.repack_merge(tool_folder_path, tool_unpack_path)
 
         logging.info(f'{self.tool_name}: saving to folder {tool_folder_path}')
 
-        if not self.disable_clean:
-            Helpers.cleanup_folder(tool_folder_path)
-
+        # write straight into the tool folder under a temporary name, then rename it into place
         save_compress_name = self.repack_save_compress_name(self.tool_name, version)
-        tool_repack_path = pathlib.Path(unpack_folder_path).parent.joinpath(save_compress_name)
+        tool_repack_path = pathlib.Path(tool_folder_path).joinpath(save_compress_name)
+        temp_repack_path = pathlib.Path(tool_folder_path).joinpath(f'.{save_compress_name}.tmp')
+        try:
+            self.write_archive(temp_repack_path, tool_unpack_path, base_archive_path)
 
-        with py7zr.SevenZipFile(tool_repack_path, 'w') as archive:
-            for item in sorted(pathlib.Path(tool_unpack_path).iterdir()):
-                archive.writeall(item, item.name)
+            if not self.disable_clean:
+                Helpers.cleanup_folder(tool_folder_path, exclude=[temp_repack_path.name])
 
-        shutil.copy(tool_repack_path, tool_folder_path)
+            os.replace(temp_repack_path, tool_repack_path)
+        finally:
+            if temp_repack_path.exists():
+                temp_repack_path.unlink()
 
         return {
             'tool_name': self.tool_name,
@@ -0,0 +1,159 @@
+import os
+import zipfile
+import rarfile
+import py7zr
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ParallelExtractor:
+    """
+    Extracts archives with a thread pool.
+    ZIP and non-solid RAR members are split into balanced groups, each worker extracts its group through
+    its own handle of the archive. py7zr already extracts the solid blocks of a 7z archive in parallel, except
+    for password-protected archives, which it extracts serially: only those are split by solid block here
+    (a solid block can only be decompressed from its start).
+    zlib, bz2, lzma and zstd release the GIL while decompressing, and RAR members are decompressed by
+    unrar subprocesses, so threads use several cores.
+    """
+
+    # archives smaller than this are not worth the extra handles
+    MIN_PARALLEL_SIZE = 4 * 1024 * 1024
+
+    def __init__(self, workers=0):
+        """
+        Initialize the extractor.
+
+        :param workers: Number of members (or solid blocks) extracted at the same time (0 = number of CPUs)
+        """
+        self.workers = workers if workers > 0 else (os.cpu_count() or 1)
+
+    def split(self, items, size_of):
+        """
+        Split items into at most one group per worker with a similar total size (largest first).
+
+        :param items: Items to split
+        :param size_of: Function returning the size of an item
+        :return: List of non-empty groups
+        """
+        groups = [[] for _ in range(self.workers)]
+        sizes = [0] * self.workers
+        for item in sorted(items, key=size_of, reverse=True):
+            index = sizes.index(min(sizes))
+            groups[index].append(item)
+            sizes[index] += size_of(item)
+
+        return [group for group in groups if group]
+
+    def run(self, function, groups):
+        """
+        Call a function for each group in the thread pool.
+
+        :param function: Function receiving a group
+        :param groups: Groups returned by split()
+        """
+        with ThreadPoolExecutor(max_workers=len(groups)) as executor:
+            # consume the iterator so the first error is raised here
+            for _ in executor.map(function, groups):
+                pass
+
+    @staticmethod
+    def get_zip_member_path(info):
+        """
+        Get the relative path zipfile extracts a member to (absolute paths, drive letters,
+        "." and ".." are removed).
+
+        :param info: ZipInfo of the member
+        :return: Relative path
+        """
+        name = os.path.splitdrive(info.filename.replace('/', os.path.sep))[1]
+        invalid_parts = ('', os.path.curdir, os.path.pardir)
+        return os.path.sep.join(part for part in name.split(os.path.sep) if part not in invalid_parts)
+
+    def extract_zip(self, file_path, unpack_path, file_pass=None):
+        """
+        Extract a ZIP file.
+
+        :param file_path: Path to the ZIP file
+        :param unpack_path: Destination path
+        :param file_pass: Password as bytes, default is None
+        :return: Number of bytes extracted
+        """
+        with zipfile.ZipFile(file_path, 'r') as compressed:
+            members = compressed.infolist()
+            total_size = sum(info.file_size for info in members)
+            groups = self.split(members, lambda info: info.compress_size)
+            if len(groups) < 2 or total_size < self.MIN_PARALLEL_SIZE:
+                compressed.extractall(unpack_path, pwd=file_pass)
+                return total_size
+
+        # zipfile checks and creates the parent folders without a lock, so create them up front
+        for info in members:
+            relative_path = self.get_zip_member_path(info)
+            folder = relative_path if info.is_dir() else os.path.dirname(relative_path)
+            if folder:
+                os.makedirs(os.path.join(unpack_path, folder), exist_ok=True)
+
+        def extract_group(group):
+            with zipfile.ZipFile(file_path, 'r') as handle:
+                handle.extractall(unpack_path, group, pwd=file_pass)
+
+        self.run(extract_group, groups)
+        return total_size
+
+    def extract_rar(self, file_path, unpack_path, file_pass=None):
+        """
+        Extract a RAR file (solid archives are extracted as a whole).
+
+        :param file_path: Path to the RAR file
+        :param unpack_path: Destination path
+        :param file_pass: Password, default is None
+        :return: Number of bytes extracted
+        """
+        with rarfile.RarFile(file_path, 'r') as compressed:
+            members = compressed.infolist()
+            total_size = sum(info.file_size for info in members)
+            groups = self.split(members, lambda info: info.compress_size)
+            if compressed.is_solid() or len(groups) < 2 or total_size < self.MIN_PARALLEL_SIZE:
+                compressed.extractall(unpack_path, pwd=file_pass)
+                return total_size
+
+        def extract_group(group):
+            with rarfile.RarFile(file_path, 'r') as handle:
+                handle.extractall(unpack_path, [info.filename for info in group], pwd=file_pass)
+
+        self.run(extract_group, groups)
+        return total_size
+
+    def extract_7z(self, file_path, unpack_path, file_pass=None):
+        """
+        Extract a 7z file. Password-protected archives are extracted one solid block per worker at a time,
+        py7zr already runs a thread per block for the others.
+
+        :param file_path: Path to the 7z file
+        :param unpack_path: Destination path
+        :param file_pass: Password, default is None
+        :return: Number of bytes extracted
+        """
+        with py7zr.SevenZipFile(file_path, 'r', password=file_pass) as compressed:
+            total_size = sum(file.uncompressed for file in compressed.files if not file.emptystream)
+            main_streams = compressed.header.main_streams
+            blocks = main_streams.unpackinfo.folders if main_streams is not None else []
+            if not compressed.password_protected or self.workers == 1 or len(blocks) < 2 \
+                    or total_size < self.MIN_PARALLEL_SIZE:
+                compressed.extractall(unpack_path)
+                return total_size
+
+            # folders and empty files are not part of any block
+            targets = [[file.filename for file in block.files] for block in blocks]
+            targets[0].extend(file.filename for file in compressed.files if file.emptystream)
+            sizes = [sum(file.uncompressed for file in block.files) for block in blocks]
+            groups = self.split(range(len(blocks)), lambda index: sizes[index])
+
+        def extract_group(group):
+            with py7zr.SevenZipFile(file_path, 'r', password=file_pass) as handle:
+                for index in group:
+                    handle.extract(unpack_path, targets[index])
+                    handle.reset()
+
+        self.run(extract_group, groups)
+        return total_size
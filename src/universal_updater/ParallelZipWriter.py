@@ -0,0 +1,344 @@
+import os
+import time
+import zlib
+import struct
+import zipfile
+import tempfile
+import contextlib
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ParallelZipWriter:
+    """
+    Writes a folder tree to a ZIP file, compressing the members in a thread pool.
+    zlib releases the GIL while it compresses, so the members are deflated in parallel and then
+    written in order. Each compressed member is spooled (in memory up to SPOOL_SIZE, then on disk),
+    so memory use stays bounded for big files. ZIP64 records are added only when they are needed.
+    When a base archive is given, its members are merged in and the compressed data of every member
+    that did not change is copied as is instead of being compressed again.
+    """
+
+    METHODS = {'store': 0, 'deflate': 8}
+    SPOOL_SIZE = 16 * 1024 * 1024
+    CHUNK_SIZE = 1024 * 1024
+    LOCAL_STRUCT = struct.Struct('<4sHHHHHIIIHH')
+    CENTRAL_STRUCT = struct.Struct('<4sHHHHHHIIIHHHHHII')
+    EOCD_STRUCT = struct.Struct('<4sHHHHIIH')
+    EOCD64_STRUCT = struct.Struct('<4sQHHIIQQQQ')
+    LOCATOR64_STRUCT = struct.Struct('<4sIQI')
+    UTF8_FLAG = 0x800
+    MAX_32 = 0xFFFFFFFF
+    MAX_16 = 0xFFFF
+
+    def __init__(self, method='deflate', level=-1, threads=0):
+        """
+        Initialize the writer.
+
+        :param method: 'deflate' or 'store'
+        :param level: zlib level from 0 to 9 (-1 = zlib default)
+        :param threads: Number of members compressed at the same time (0 = number of CPUs)
+        """
+        self.method = self.METHODS[method]
+        self.level = level
+        self.threads = threads if threads > 0 else (os.cpu_count() or 1)
+
+    @staticmethod
+    def get_dos_time(timestamp):
+        """
+        Convert a timestamp to the DOS (time, date) pair used by ZIP headers.
+
+        :param timestamp: POSIX timestamp
+        :return: Tuple (dos_time, dos_date)
+        """
+        parts = time.localtime(timestamp)
+        if parts.tm_year < 1980:
+            return 0, (1 << 5) | 1
+
+        dos_time = (parts.tm_hour << 11) | (parts.tm_min << 5) | (parts.tm_sec // 2)
+        dos_date = ((parts.tm_year - 1980) << 9) | (parts.tm_mon << 5) | parts.tm_mday
+        return dos_time, dos_date
+
+    @staticmethod
+    def list_entries(source_path, prefix=''):
+        """
+        List the folders and files of a tree in archive order.
+
+        :param source_path: Root folder
+        :param prefix: Path prefix of the members inside the archive
+        :return: List of (member name, path, os.stat_result); folder names end with "/"
+        """
+        entries = []
+        for folder, dir_names, file_names in os.walk(source_path):
+            dir_names.sort()
+            relative_folder = os.path.relpath(folder, source_path).replace(os.sep, '/')
+            base_name = prefix if relative_folder == '.' else f'{prefix}{relative_folder}/'
+            if base_name:
+                entries.append((base_name, folder, os.stat(folder)))
+            for file_name in sorted(file_names):
+                file_path = os.path.join(folder, file_name)
+                entries.append((base_name + file_name, file_path, os.stat(file_path)))
+
+        return entries
+
+    def get_attributes(self, name, stat_result):
+        """
+        Get the header attributes of a member from the stat of its source.
+
+        :param name: Member name
+        :param stat_result: os.stat_result of the source
+        :return: Tuple (dos_time, dos_date, external_attr)
+        """
+        external_attr = (stat_result.st_mode & 0xFFFF) << 16
+        if name.endswith('/'):
+            external_attr |= 0x10
+
+        return *self.get_dos_time(stat_result.st_mtime), external_attr
+
+    @staticmethod
+    def get_base_attributes(info):
+        """
+        Get the header attributes of a member of the base archive.
+
+        :param info: zipfile.ZipInfo
+        :return: Tuple (dos_time, dos_date, external_attr)
+        """
+        year, month, day, hour, minute, second = info.date_time
+        dos_time = (hour << 11) | (minute << 5) | (second // 2)
+        dos_date = ((year - 1980) << 9) | (month << 5) | day
+        return dos_time, dos_date, info.external_attr
+
+    @staticmethod
+    def is_reusable(info):
+        """
+        Check whether the compressed data of a base member can be copied as is.
+
+        :param info: zipfile.ZipInfo or None
+        :return: True if it is a plain (not encrypted) store or deflate member
+        """
+        return info is not None and info.compress_type in (0, 8) and not info.flag_bits & 0x1
+
+    def compress_source(self, open_source):
+        """
+        Compress a source into a spool.
+
+        :param open_source: Callable that opens the source as a binary file object
+        :return: Tuple (method, crc32, file size, compressed size, iterable of compressed chunks)
+        """
+        spool = tempfile.SpooledTemporaryFile(max_size=self.SPOOL_SIZE)
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, -15) if self.method == 8 else None
+        crc = 0
+        file_size = 0
+        with open_source() as file:
+            for chunk in iter(lambda: file.read(self.CHUNK_SIZE), b''):
+                crc = zlib.crc32(chunk, crc)
+                file_size += len(chunk)
+                spool.write(compressor.compress(chunk) if compressor else chunk)
+
+        if compressor:
+            spool.write(compressor.flush())
+
+        # already compressed data (installers, media...) is stored as is, like 7-Zip does
+        if compressor and spool.tell() >= file_size:
+            spool.close()
+            stored = self.__class__('store')
+            return stored.compress_source(open_source)
+
+        compress_size = spool.tell()
+        spool.seek(0)
+        return self.method, crc, file_size, compress_size, self.read_spool(spool)
+
+    def read_spool(self, spool):
+        """
+        Yield the content of a spool and close it.
+
+        :param spool: Spooled file positioned at the start
+        """
+        with spool:
+            yield from iter(lambda: spool.read(self.CHUNK_SIZE), b'')
+
+    def prepare_file(self, file_path, info):
+        """
+        Compress a file, unless the base archive already holds the same content.
+
+        :param file_path: Path to the file
+        :param info: zipfile.ZipInfo of the base member with the same name or None
+        :return: compress_source() result, or None to copy the base member
+        """
+        if self.is_reusable(info) and info.file_size == os.path.getsize(file_path):
+            crc = 0
+            with open(file_path, 'rb') as file:
+                for chunk in iter(lambda: file.read(self.CHUNK_SIZE), b''):
+                    crc = zlib.crc32(chunk, crc)
+            if crc == info.CRC:
+                return None
+
+        return self.compress_source(lambda: open(file_path, 'rb'))
+
+    def read_base_member(self, base_file, info):
+        """
+        Get the compressed data of a base member without decompressing it.
+
+        :param base_file: Base archive opened in binary mode (only used from the writing thread)
+        :param info: zipfile.ZipInfo of the member
+        :return: Tuple (method, crc32, file size, compressed size, iterable of compressed chunks)
+        """
+        base_file.seek(info.header_offset)
+        header = base_file.read(self.LOCAL_STRUCT.size)
+        name_length, extra_length = struct.unpack_from('<HH', header, 26)
+        data_offset = info.header_offset + self.LOCAL_STRUCT.size + name_length + extra_length
+
+        def read_chunks():
+            base_file.seek(data_offset)
+            remaining = info.compress_size
+            while remaining > 0:
+                chunk = base_file.read(min(remaining, self.CHUNK_SIZE))
+                if not chunk:
+                    raise EOFError(f'truncated member "{info.filename}" in the base archive')
+                remaining -= len(chunk)
+                yield chunk
+
+        return info.compress_type, info.CRC, info.file_size, info.compress_size, read_chunks()
+
+    def write_member(self, archive, name, attributes, compressed):
+        """
+        Write the local header and the data of a member.
+
+        :param archive: Archive file object
+        :param name: Member name
+        :param attributes: Tuple (dos_time, dos_date, external_attr)
+        :param compressed: Result of compress_source() / read_base_member() or None for a folder
+        :return: Central directory record fields for write_central_directory()
+        """
+        method, crc, file_size, compress_size, chunks = compressed if compressed else (0, 0, 0, 0, ())
+        offset = archive.tell()
+        encoded_name = name.encode('utf-8')
+        dos_time, dos_date, external_attr = attributes
+
+        zip64 = file_size >= self.MAX_32 or compress_size >= self.MAX_32
+        extra = struct.pack('<HHQQ', 1, 16, file_size, compress_size) if zip64 else b''
+        archive.write(self.LOCAL_STRUCT.pack(
+            b'PK\x03\x04', 45 if zip64 else 20, self.UTF8_FLAG, method, dos_time, dos_date, crc,
+            self.MAX_32 if zip64 else compress_size, self.MAX_32 if zip64 else file_size,
+            len(encoded_name), len(extra),
+        ))
+        archive.write(encoded_name)
+        archive.write(extra)
+        for chunk in chunks:
+            archive.write(chunk)
+
+        return {
+            'name': encoded_name,
+            'method': method,
+            'dos_time': dos_time,
+            'dos_date': dos_date,
+            'crc': crc,
+            'file_size': file_size,
+            'compress_size': compress_size,
+            'offset': offset,
+            'external_attr': external_attr,
+        }
+
+    def write_central_directory(self, archive, records):
+        """
+        Write the central directory and the end of central directory records.
+
+        :param archive: Archive file object
+        :param records: Member records returned by write_member()
+        """
+        central_offset = archive.tell()
+        for record in records:
+            # the ZIP64 extra only holds the fields that do not fit in 32 bits, in this order
+            zip64_fields = [value for value in (record['file_size'], record['compress_size'], record['offset'])
+                            if value >= self.MAX_32]
+            extra = struct.pack(f'<HH{len(zip64_fields)}Q', 1, 8 * len(zip64_fields), *zip64_fields) \
+                if zip64_fields else b''
+            version = 45 if zip64_fields else 20
+            archive.write(self.CENTRAL_STRUCT.pack(
+                b'PK\x01\x02', (3 << 8) | version, version, self.UTF8_FLAG, record['method'],
+                record['dos_time'], record['dos_date'], record['crc'],
+                min(record['compress_size'], self.MAX_32), min(record['file_size'], self.MAX_32),
+                len(record['name']), len(extra), 0, 0, 0, record['external_attr'],
+                min(record['offset'], self.MAX_32),
+            ))
+            archive.write(record['name'])
+            archive.write(extra)
+
+        central_end = archive.tell()
+        central_size = central_end - central_offset
+        entries = len(records)
+        if entries >= self.MAX_16 or central_size >= self.MAX_32 or central_offset >= self.MAX_32:
+            archive.write(self.EOCD64_STRUCT.pack(
+                b'PK\x06\x06', self.EOCD64_STRUCT.size - 12, 45, 45, 0, 0,
+                entries, entries, central_size, central_offset,
+            ))
+            archive.write(self.LOCATOR64_STRUCT.pack(b'PK\x06\x07', 0, central_end, 1))
+
+        archive.write(self.EOCD_STRUCT.pack(
+            b'PK\x05\x06', 0, 0, min(entries, self.MAX_16), min(entries, self.MAX_16),
+            min(central_size, self.MAX_32), min(central_offset, self.MAX_32), 0,
+        ))
+
+    def write_tree(self, archive_path, source_path, base_archive_path=None):
+        """
+        Write every item of a folder to a new ZIP file (the folder itself is not included).
+
+        :param archive_path: Path of the ZIP file to create
+        :param source_path: Folder to archive
+        :param base_archive_path: Optional ZIP file to merge with; the folder wins on name clashes
+        :return: Dictionary with the 'members' written and the 'reused' members copied from the base
+        """
+        entries = self.list_entries(source_path)
+        records = []
+        reused = 0
+        with contextlib.ExitStack() as stack:
+            base = stack.enter_context(zipfile.ZipFile(base_archive_path)) if base_archive_path else None
+            base_file = stack.enter_context(open(base_archive_path, 'rb')) if base_archive_path else None
+            base_infos = {info.filename: info for info in base.infolist()} if base else {}
+            archive = stack.enter_context(open(archive_path, 'wb'))
+            executor = stack.enter_context(ThreadPoolExecutor(max_workers=self.threads))
+
+            def submit(name, attributes, info, task, *args):
+                future = executor.submit(task, *args) if task else None
+                return name, attributes, info, future
+
+            def write(job):
+                nonlocal reused
+                name, attributes, info, future = job
+                compressed = future.result() if future else None
+                if compressed is None and info is not None and not name.endswith('/'):
+                    compressed = self.read_base_member(base_file, info)
+                    reused += 1
+                records.append(self.write_member(archive, name, attributes, compressed))
+
+            jobs = []
+            for name, path, stat_result in entries:
+                attributes = self.get_attributes(name, stat_result)
+                if name.endswith('/'):
+                    jobs.append((name, attributes, None, None, ()))
+                else:
+                    jobs.append((name, attributes, base_infos.get(name), self.prepare_file, (path, base_infos.get(name))))
+
+            source_names = {entry[0] for entry in entries}
+            for name, info in base_infos.items():
+                if name in source_names:
+                    continue
+                if info.is_dir() or self.is_reusable(info):
+                    jobs.append((name, self.get_base_attributes(info), info, None, ()))
+                else:
+                    open_source = (lambda member: lambda: base.open(member))(info)
+                    jobs.append((name, self.get_base_attributes(info), None, self.compress_source, (open_source,)))
+
+            # keep a bounded window of members in flight and write them in archive order
+            pending = collections.deque()
+            for name, attributes, info, task, args in jobs:
+                pending.append(submit(name, attributes, info, task, *args))
+                if len(pending) >= self.threads * 2:
+                    write(pending.popleft())
+
+            while pending:
+                write(pending.popleft())
+
+            self.write_central_directory(archive, records)
+
+        return {'members': len(records), 'reused': reused}
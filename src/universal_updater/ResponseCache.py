@@ -0,0 +1,141 @@
+import os
+import json
+import pathlib
+import hashlib
+import threading
+import logging
+
+from universal_updater.HttpResponse import HttpResponse
+
+
+class ResponseCache:
+    """
+    On-disk cache of scraped page bodies, revalidated with conditional requests (ETag / Last-Modified).
+    The validators are stored with the body they belong to, not in the state store: one is useless without
+    the other, and a cache entry is dropped as a whole.
+    """
+
+    def __init__(self, cache_folder_path):
+        """
+        Initialize the cache with the folder where entries are stored.
+
+        :param cache_folder_path: Path to the folder where cached responses will be saved
+        """
+        self.cache_folder_path = pathlib.Path(cache_folder_path)
+        self.cache_folder_path.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self.stats = {
+            'revalidated': 0,
+            'misses': 0,
+            'not_modified': 0,
+        }
+
+    def _count(self, key):
+        """
+        Increment one of the cache counters.
+
+        :param key: Counter name ('revalidated': an entry was found and the request is conditional,
+            'misses': no entry, 'not_modified': the server answered 304 and the entry was reused)
+        """
+        with self._lock:
+            self.stats[key] += 1
+
+    def _entry_path(self, url):
+        """
+        Get the path of the cache entry for a given URL.
+
+        :param url: Requested URL
+        :return: Path object of the cache entry
+        """
+        return self.cache_folder_path.joinpath(hashlib.sha256(url.encode()).hexdigest() + '.json')
+
+    def load(self, url):
+        """
+        Load the cache entry for a given URL.
+
+        :param url: Requested URL
+        :return: Dict with the cached entry or None if there is no usable entry
+        """
+        entry_path = self._entry_path(url)
+        try:
+            with open(entry_path, 'r', encoding='utf-8') as entry_file:
+                entry = json.load(entry_file)
+        except (OSError, ValueError):
+            self._count('misses')
+            return None
+
+        if entry.get('url') != url:
+            self._count('misses')
+            return None
+
+        self._count('revalidated')
+        return entry
+
+    def conditional_headers(self, entry):
+        """
+        Build the conditional request headers for a cached entry.
+
+        :param entry: Cached entry returned by load()
+        :return: Dict of HTTP headers
+        """
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+
+        return headers
+
+    def store(self, url, response):
+        """
+        Save a response in the cache if the server sent a validator for it.
+
+        :param url: Requested URL
+        :param response: Response object with status 200
+        """
+        etag = response.headers.get('etag')
+        last_modified = response.headers.get('last-modified')
+        if response.status_code != 200 or not (etag or last_modified):
+            return
+
+        entry = {
+            'url': url,
+            'final_url': response.url,
+            'etag': etag,
+            'last_modified': last_modified,
+            'content_type': response.headers.get('content-type', ''),
+            'encoding': response.encoding,
+            'body': response.text,
+        }
+
+        # write to a temp file first so parallel workers never read a half-written entry
+        entry_path = self._entry_path(url)
+        temp_path = entry_path.with_suffix(f'.{threading.get_ident()}.tmp')
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as entry_file:
+                json.dump(entry, entry_file)
+            os.replace(temp_path, entry_path)
+        except OSError as error:
+            logging.debug("Response cache write failed for %s: %s", url, error)
+
+    def replay(self, entry, response):
+        """
+        Build a response object from a cached entry after a 304 Not Modified.
+
+        :param entry: Cached entry returned by load()
+        :param response: The 304 response object
+        :return: HttpResponse object with the cached body
+        """
+        self._count('not_modified')
+
+        headers = dict(response.headers)
+        headers['content-type'] = entry.get('content_type', '')
+
+        return HttpResponse(
+            status_code=200,
+            url=entry.get('final_url') or entry['url'],
+            headers=headers,
+            content=entry['body'].encode('utf-8'),
+            encoding='utf-8',
+            cookies=response.cookies,
+        )
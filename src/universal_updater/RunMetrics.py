@@ -0,0 +1,229 @@
+import os
+import json
+import time
+import threading
+import contextlib
+
+
+class RunMetrics:
+    """
+    Collects the duration (monotonic clock) and the bytes moved by every phase of every tool in a run, so a
+    slow run can be traced to scraping, downloading, unpacking, repacking or the hook scripts.
+    The totals can be written as JSON and as a Prometheus textfile-collector file.
+    """
+
+    PHASES = ('pre_update', 'scrape_step', 'stream_step', 'download_step', 'unpack', 'post_unpack', 'save',
+              'repack', 'post_update')
+    PROMETHEUS_PREFIX = 'universal_updater'
+
+    def __init__(self):
+        """
+        Initialize an empty run.
+        """
+        self.started = time.time()
+        self._start_time = time.monotonic()
+        self._lock = threading.Lock()
+        self.tools = {}
+
+    def _tool(self, name):
+        """
+        Get the record of a tool (caller must hold the lock).
+
+        :param name: Name of the tool
+        :return: Dict with 'phases' (phase -> {'seconds', 'bytes'}) and 'result'
+        """
+        return self.tools.setdefault(name, {'phases': {}, 'result': ''})
+
+    def add(self, name, phase, seconds=0.0, bytes_moved=0):
+        """
+        Add time and bytes to a phase of a tool.
+
+        :param name: Name of the tool
+        :param phase: Phase name (one of PHASES)
+        :param seconds: Elapsed seconds
+        :param bytes_moved: Bytes downloaded, unpacked or written by the phase
+        """
+        with self._lock:
+            record = self._tool(name)['phases'].setdefault(phase, {'seconds': 0.0, 'bytes': 0})
+            record['seconds'] += seconds
+            record['bytes'] += bytes_moved
+
+    @contextlib.contextmanager
+    def measure(self, name, phase):
+        """
+        Time a phase of a tool, also when it raises.
+
+        :param name: Name of the tool
+        :param phase: Phase name (one of PHASES)
+        """
+        start_time = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add(name, phase, time.monotonic() - start_time)
+
+    def set_result(self, name, result):
+        """
+        Record how the update of a tool ended.
+
+        :param name: Name of the tool
+        :param result: 'updated', 'up_to_date', 'available' (dry run) or 'failed'
+        """
+        with self._lock:
+            self._tool(name)['result'] = result
+
+    @property
+    def elapsed(self):
+        """
+        Seconds since the run started.
+
+        :return: Float
+        """
+        return time.monotonic() - self._start_time
+
+    def get_tool_seconds(self, name):
+        """
+        Get the time spent in every phase of a tool.
+
+        :param name: Name of the tool
+        :return: Seconds
+        """
+        return sum(record['seconds'] for record in self.tools[name]['phases'].values())
+
+    def get_slowest(self, count):
+        """
+        Get the tools that took the longest.
+
+        :param count: Maximum number of tools
+        :return: List of (name, seconds, phases dict) ordered by time, slowest first
+        """
+        with self._lock:
+            slowest = sorted(((name, self.get_tool_seconds(name), dict(tool['phases']))
+                              for name, tool in self.tools.items()), key=lambda item: item[1], reverse=True)
+
+        return [item for item in slowest[:count] if item[1] > 0]
+
+    def get_phase_totals(self):
+        """
+        Get the time and bytes of every phase summed over all the tools.
+
+        :return: Dict of phase -> {'seconds', 'bytes'}, in PHASES order
+        """
+        totals = {phase: {'seconds': 0.0, 'bytes': 0} for phase in self.PHASES}
+        with self._lock:
+            for tool in self.tools.values():
+                for phase, record in tool['phases'].items():
+                    total = totals.setdefault(phase, {'seconds': 0.0, 'bytes': 0})
+                    total['seconds'] += record['seconds']
+                    total['bytes'] += record['bytes']
+
+        return totals
+
+    def get_result_counts(self):
+        """
+        Count the tools by result.
+
+        :return: Dict of result -> number of tools
+        """
+        counts = {}
+        with self._lock:
+            for tool in self.tools.values():
+                result = tool['result'] or 'unknown'
+                counts[result] = counts.get(result, 0) + 1
+
+        return counts
+
+    def to_dict(self):
+        """
+        Get the metrics of the run as a JSON-serializable dict.
+
+        :return: Dict with the run times, the phase totals, the result counts and every tool
+        """
+        with self._lock:
+            tools = {name: {'result': tool['result'], 'seconds': round(self.get_tool_seconds(name), 6),
+                            'phases': {phase: {'seconds': round(record['seconds'], 6), 'bytes': record['bytes']}
+                                       for phase, record in tool['phases'].items()}}
+                     for name, tool in self.tools.items()}
+
+        return {
+            'started': self.started,
+            'duration': round(self.elapsed, 6),
+            'results': self.get_result_counts(),
+            'phases': {phase: {'seconds': round(total['seconds'], 6), 'bytes': total['bytes']}
+                       for phase, total in self.get_phase_totals().items()},
+            'tools': tools,
+        }
+
+    @staticmethod
+    def escape_label(value):
+        """
+        Escape a Prometheus label value.
+
+        :param value: Label value
+        :return: Escaped string
+        """
+        return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+    def to_prometheus(self):
+        """
+        Get the metrics of the run in the Prometheus text exposition format.
+
+        :return: String
+        """
+        prefix = self.PROMETHEUS_PREFIX
+        data = self.to_dict()
+        lines = []
+
+        def add_metric(name, help_text, samples):
+            lines.append(f'# HELP {prefix}_{name} {help_text}')
+            lines.append(f'# TYPE {prefix}_{name} gauge')
+            for labels, value in samples:
+                label_text = ','.join(f'{key}="{self.escape_label(label)}"' for key, label in labels.items())
+                lines.append(f'{prefix}_{name}{{{label_text}}} {value}' if label_text else f'{prefix}_{name} {value}')
+
+        add_metric('last_run_timestamp_seconds', 'Unix time the last run started.', [({}, data['started'])])
+        add_metric('last_run_duration_seconds', 'Duration of the last run.', [({}, data['duration'])])
+        add_metric('tools', 'Tools of the last run by result.',
+                   [({'result': result}, count) for result, count in sorted(data['results'].items())])
+        add_metric('phase_seconds', 'Time spent in each phase by all the tools of the last run.',
+                   [({'phase': phase}, total['seconds']) for phase, total in data['phases'].items()])
+        add_metric('phase_bytes', 'Bytes moved by each phase by all the tools of the last run.',
+                   [({'phase': phase}, total['bytes']) for phase, total in data['phases'].items()])
+        add_metric('tool_seconds', 'Time spent by each tool in the last run.',
+                   [({'tool': name}, tool['seconds']) for name, tool in sorted(data['tools'].items())])
+        add_metric('tool_phase_seconds', 'Time spent by each tool in each phase in the last run.',
+                   [({'tool': name, 'phase': phase}, record['seconds'])
+                    for name, tool in sorted(data['tools'].items()) for phase, record in tool['phases'].items()])
+
+        return '\n'.join(lines) + '\n'
+
+    def write_json(self, file_name):
+        """
+        Write the metrics of the run as JSON.
+
+        :param file_name: Output file
+        """
+        self._write_file(file_name, json.dumps(self.to_dict(), indent=2) + '\n')
+
+    def write_prometheus(self, file_name):
+        """
+        Write the metrics of the run for the Prometheus node exporter textfile collector.
+
+        :param file_name: Output file, its name must end with .prom for the collector to read it
+        """
+        self._write_file(file_name, self.to_prometheus())
+
+    @staticmethod
+    def _write_file(file_name, content):
+        """
+        Write a file to a temporary name and rename it over the old one, so a collector never reads a
+        partial file.
+
+        :param file_name: Name of the file to replace
+        :param content: Text to write
+        """
+        temp_file_name = f'{file_name}.tmp'
+        with open(temp_file_name, 'w') as output_file:
+            output_file.write(content)
+
+        os.replace(temp_file_name, file_name)
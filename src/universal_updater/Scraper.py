@@ -1,13 +1,14 @@
 import re
-import time
-import platform
-import requests
+import asyncio
 import urllib.parse
 import hashlib
 import colorama
 import logging
 
 from universal_updater.Helpers import Helpers
+from universal_updater.HttpEngine import HttpEngine
+from universal_updater.StreamScanner import StreamScanner
+from universal_updater.ToolSpec import ToolSpec
 
 
 class Scraper:
@@ -15,7 +16,8 @@ class Scraper:
     Handles all scraping tasks for the Updater.
     """
 
-    def __init__(self, force_download, use_github_api, user_agent, request_timeout=30, request_retries=3):
+    def __init__(self, force_download, use_github_api, user_agent, request_timeout=30, request_retries=3,
+                 response_cache=None, http_engine=None, github_releases=None):
         """
         Initialize the Scraper with necessary configurations.
 
@@ -23,21 +25,26 @@ class Scraper:
         :param user_agent: User agent string for HTTP requests
         :param request_timeout: Timeout in seconds for HTTP requests
         :param request_retries: Number of retry attempts on request failure
+        :param response_cache: Optional ResponseCache instance used for conditional GET requests
+        :param http_engine: Optional HttpEngine shared by all the scrapers of the run
+        :param github_releases: Optional dict of repo -> latest release prefetched by GitHubBatchLookup
         """
         self.user_agent = user_agent
         self.force_download = force_download
         self.use_github_api = use_github_api
         self.request_timeout = request_timeout
         self.request_retries = request_retries
-        self.session = requests.Session()
-        self.arch_suffix = '_x64' if '64' in platform.machine() else '_x86'
+        self.response_cache = response_cache
+        self.github_releases = github_releases or {}
+        self.http_engine = http_engine or HttpEngine()
+        self.cookies = {}
         self.tool_name = ""
         self.tool_config = {}
         self.github_version_check = 'https://github.com/{0}/releases.atom'
         self.github_files = 'https://github.com/{0}/releases/expanded_assets/{1}'
         self.github_api_files = 'https://api.github.com/repos/{0}/releases/latest'
         self.scoop_manifest = 'https://raw.githubusercontent.com/ScoopInstaller/{0}/master/bucket/{1}.json'
-        self.re_github_version = '\/releases\/tag\/(\S+)"'
+        self.re_github_version = re.compile('\/releases\/tag\/(\S+)"')
         self.re_github_download = '"(.*?/{0})"'
 
     def tool_setup(self, tool_name, tool_config):
@@ -45,38 +52,41 @@ class Scraper:
         Initialize tool-specific settings.
 
         :param tool_name: Name of the tool
-        :param tool_config: Configuration object for the specific tool
+        :param tool_config: ToolSpec of the tool
         """
         self.tool_name = tool_name
         self.tool_config = tool_config
+        self.cookies = {}
 
-    def _request_with_retry(self, method_name, url, headers):
+    async def _request_with_retry(self, method_name, url, headers, scanner=None):
         """
         Performs an HTTP request with retry logic and exponential backoff.
 
         :param method_name: HTTP method name ('get' or 'head')
         :param url: The URL to request
         :param headers: Dictionary of HTTP headers
-        :return: Response object
+        :param scanner: Optional StreamScanner the body is fed to (see HttpEngine.request)
+        :return: HttpResponse object
         :raises Exception: If all attempts fail
         """
-        method = getattr(self.session, method_name)
         last_exception = None
         for attempt in range(self.request_retries):
             try:
-                response = method(url, headers=headers, timeout=self.request_timeout, allow_redirects=True)
+                response = await self.http_engine.request(method_name, url, headers=headers, cookies=self.cookies,
+                                                          timeout=self.request_timeout, scanner=scanner)
                 response.raise_for_status()
+                self.cookies.update(response.cookies)
                 return response
             except Exception as exception:
                 last_exception = exception
                 if attempt < self.request_retries - 1:
                     wait = 2 ** attempt
                     logging.warning(f'{self.tool_name}: request failed (attempt {attempt + 1}/{self.request_retries}), retrying in {wait}s...')
-                    time.sleep(wait)
+                    await asyncio.sleep(wait)
 
         raise Exception(colorama.Fore.RED + f'{self.tool_name}: Error {last_exception}')
 
-    def head_request(self, url, headers=None):
+    async def head_request(self, url, headers=None):
         """
         Performs a HEAD request to a given URL with retry logic.
 
@@ -88,11 +98,12 @@ class Scraper:
         if headers is None:
             headers = {'User-Agent': self.user_agent}
 
-        return self._request_with_retry('head', url, headers)
+        return await self._request_with_retry('head', url, headers)
 
-    def get_request(self, url, headers=None):
+    async def get_request(self, url, headers=None):
         """
         Performs a GET request to a given URL.
+        If the response cache is enabled, the request is conditional and a 304 replays the cached body.
 
         :param url: The URL to perform the GET request to
         :param headers: Optional dictionary containing HTTP headers. If not provided, the default User-Agent is used.
@@ -102,21 +113,55 @@ class Scraper:
         if headers is None:
             headers = {'User-Agent': self.user_agent}
 
-        return self._request_with_retry('get', url, headers)
+        if not self.response_cache:
+            return await self._request_with_retry('get', url, headers)
 
-    def get_arch_config(self, key):
+        cache_entry = self.response_cache.load(url)
+        if cache_entry:
+            headers = {**headers, **self.response_cache.conditional_headers(cache_entry)}
+
+        response = await self._request_with_retry('get', url, headers)
+        if response.status_code == 304 and cache_entry:
+            logging.debug(f'{self.tool_name}: {url} not modified, using cached response')
+            return self.response_cache.replay(cache_entry, response)
+
+        self.response_cache.store(url, response)
+        return response
+
+    async def scan_request(self, url, patterns):
         """
-        Returns the architecture-specific config value if available, falling back to the generic key.
+        Performs a GET request and finds the first match of each pattern while the body is read,
+        closing the connection as soon as every pattern has matched.
+        If the response cache is enabled, a 304 is scanned from the cached body and a response the cache
+        can revalidate is read whole so it can be stored.
 
-        :param key: Base config key (e.g. 're_download', 'update_url')
-        :return: Value for the arch-specific key or the generic key, or None if neither exists
+        :param url: The URL to perform the GET request to
+        :param patterns: List of compiled patterns, None entries are skipped
+        :return: List with the first match of each pattern (as re.findall()[0]), or None where there is none
+        :raises Exception: If an error occurs during the request
         """
-        return self.tool_config.get(f'{key}{self.arch_suffix}') or self.tool_config.get(key)
+        headers = {'User-Agent': self.user_agent}
+        cache_entry = self.response_cache.load(url) if self.response_cache else None
+        if cache_entry:
+            headers = {**headers, **self.response_cache.conditional_headers(cache_entry)}
+
+        scanner = StreamScanner(patterns, keep_cacheable_body=bool(self.response_cache))
+        response = await self._request_with_retry('get', url, headers, scanner)
+        if response.status_code == 304 and cache_entry:
+            logging.debug(f'{self.tool_name}: {url} not modified, scanning cached response')
+            response = self.response_cache.replay(cache_entry, response)
+            return scanner.scan(response.content, response.headers, response.encoding)
+
+        if scanner.keep_body:
+            self.response_cache.store(url, response)
+
+        logging.debug(f'{self.tool_name}: scanned {scanner.bytes_read} bytes of {url}')
+        return scanner.matches
 
     #################
     # Scraper methods
     #################
-    def scrape_web(self):
+    async def scrape_web(self):
         """
         Scrape web for version and download URL based on tool_config.
 
@@ -126,18 +171,17 @@ class Scraper:
             Returns False if the version cannot be extracted.
         :raises Exception: If required configuration fields are missing or HTTP requests fail.
         """
-        # load html
-        url = self.tool_config.get('url', None)
-        url_response = self.get_request(url)
-        logging.debug(f'{self.tool_name}: HTML content fetched, starting regex matching.')
+        # scan html, both regexes in the same read
+        url = self.tool_config.url
+        re_version = self.tool_config.re_version
+        version_match, download_match = await self.scan_request(url, [re_version, self.tool_config.re_download])
+        logging.debug(f'{self.tool_name}: HTML content scanned.')
 
-        # regex shit
-        re_version = self.tool_config.get('re_version', None)
-        download_version = self.check_version_from_web(url_response.text, re_version)
+        download_version = self.check_version_from_web(version_match, re_version)
         if download_version is None:
             return False
 
-        download_url = self.get_download_url_from_web(url, url_response.text)
+        download_url = await self.get_download_url_from_web(url, download_match)
         logging.debug(f'{self.tool_name}: Regex matching done.')
 
         return {
@@ -145,7 +189,7 @@ class Scraper:
             'download_url': download_url,
         }
 
-    def scrape_github(self):
+    async def scrape_github(self):
         """
         Scrape GitHub for version and download URL based on tool_config.
 
@@ -156,54 +200,59 @@ class Scraper:
         :raises Exception: If required configuration fields are missing or HTTP requests fail.
         """
         if self.use_github_api:
-            return self.scrape_github_api()
+            return await self.scrape_github_api()
 
-        github_repo = self.tool_config.get('url', None)
+        github_repo = self.tool_config.url
 
         # load html
         version_url = self.github_version_check.format(github_repo)
-        version_response = self.get_request(version_url)
-        logging.debug(f'{self.tool_name}: Version HTML fetched, starting regex matching for version.')
+        version_match = (await self.scan_request(version_url, [self.re_github_version]))[0]
+        logging.debug(f'{self.tool_name}: Version HTML scanned.')
 
-        download_version = self.check_version_from_web(version_response.text, self.re_github_version)
+        download_version = self.check_version_from_web(version_match, self.re_github_version)
         if download_version is None:
             return False
 
         logging.debug(f'{self.tool_name}: Regex matching for version done.')
 
         # the download url is not configured, so I have to generate one.
-        update_url = self.get_arch_config('update_url')
+        update_url = self.tool_config.update_url
         if not update_url:
             logging.debug(f'{self.tool_name}: update_url not set. I try to generate it.')
             download_url = self.github_files.format(github_repo, download_version)
-            update_url = self.get_download_url_from_github(download_url)
+            update_url = await self.get_download_url_from_github(download_url)
 
         return {
             'download_version': download_version,
             'download_url': update_url,
         }
 
-    def scrape_github_api(self):
+    async def scrape_github_api(self):
         """
         Scrape GitHub API for version and download URL based on tool_config.
 
         :return: dict|bool: A dictionary containing:
             - 'download_version' (str): Extracted version from the API response.
             - 'download_url' (str): The determined or generated download URL.
+            - 'download_digest' (str|None): Digest of the matching release asset ("sha256:...").
             Returns False if the version cannot be extracted.
         :raises Exception: If the API request fails or the response is invalid.
         """
         logging.debug(f'{self.tool_name}: Consuming GitHub via Api')
-        github_repo = self.tool_config.get('url', None)
-        repo_url = self.github_api_files.format(github_repo)
+        github_repo = self.tool_config.url
 
-        # load json
-        headers = {'Authorization': f'token {self.use_github_api}'}
-        api_response = self.get_request(repo_url, headers)
-        json_response = api_response.json()
-        logging.debug(f'{self.tool_name}: JSON fetched, extracting version and download URL.')
+        # use the release prefetched by the GraphQL batch lookup if available
+        json_response = self.github_releases.get(github_repo)
+        if json_response is not None:
+            logging.debug(f'{self.tool_name}: using release from GitHub batch lookup.')
+        else:
+            repo_url = self.github_api_files.format(github_repo)
+            headers = {'Authorization': f'token {self.use_github_api}'}
+            api_response = await self.get_request(repo_url, headers)
+            json_response = api_response.json()
+            logging.debug(f'{self.tool_name}: JSON fetched, extracting version and download URL.')
 
-        update_url = self.get_arch_config('update_url')
+        update_url = self.tool_config.update_url
         if not update_url:
             logging.debug(f'{self.tool_name}: update_url not set. I try to generate it.')
             update_url = self.get_download_url_from_github_api(json_response)
@@ -218,9 +267,10 @@ class Scraper:
         return {
             'download_version': download_version,
             'download_url': update_url,
+            'download_digest': self.get_digest_from_github_api(json_response, update_url),
         }
 
-    def scrape_http(self):
+    async def scrape_http(self):
         """
         Scrape HTTP headers for version based on tool_config.
 
@@ -231,12 +281,9 @@ class Scraper:
         :raises Exception: If 'update_url' is missing or an HTTP error occurs.
         """
         # get http response
-        update_url = self.get_arch_config('update_url')
-        if not update_url:
-            raise Exception(colorama.Fore.RED +
-                            f'{self.tool_name}: the update_url field is required for the selected mode')
-
-        http_response = self.head_request(update_url)
+        # required for this mode, checked when the config is loaded
+        update_url = self.tool_config.update_url
+        http_response = await self.head_request(update_url)
         logging.debug(f'{self.tool_name}: HTTP headers fetched, extracting version.')
 
         download_version = self.check_version_from_http(http_response.headers)
@@ -245,28 +292,28 @@ class Scraper:
 
         logging.debug(f'{self.tool_name}: Version extracted.')
 
+        # the HEAD already points to the file, the downloader reuses it instead of probing again
         return {
             'download_version': download_version,
             'download_url': update_url,
+            'file_name': Helpers.get_filename_from_headers(http_response.headers, http_response.url),
+            'content_type': http_response.headers.get('content-type', ''),
         }
 
-    def scrape_scoop(self):
+    async def scrape_scoop(self):
         """
         Scrape a Scoop bucket manifest for version and download URL.
 
         :return: dict|bool: A dictionary containing:
             - 'download_version' (str): Version from the manifest.
             - 'download_url' (str): Resolved download URL.
+            - 'download_digest' (str|None): Digest of the download from the manifest "hash" field.
             Returns False if already up to date.
         :raises Exception: If the manifest is missing required fields.
         """
-        app = self.tool_config.get('url', None)
-        bucket = self.tool_config.get('scoop_bucket', 'main').capitalize()
-        force_x86 = self.tool_config.get('force_x86', 'false').lower() == 'true'
-
-        manifest_url = self.scoop_manifest.format(bucket, app)
+        manifest_url = self.scoop_manifest.format(self.tool_config.scoop_bucket, self.tool_config.url)
         logging.debug(f'{self.tool_name}: fetching scoop manifest from {manifest_url}')
-        response = self.get_request(manifest_url)
+        response = await self.get_request(manifest_url)
         manifest = response.json()
 
         version = manifest.get('version')
@@ -280,9 +327,11 @@ class Scraper:
 
         logging.info(f'{self.tool_name}: updated from {local_version} --> {version}')
 
-        arch_key = '32bit' if (force_x86 or self.arch_suffix == '_x86') else '64bit'
-        arch_url = manifest.get('architecture', {}).get(arch_key, {}).get('url')
+        arch_key = '32bit' if (self.tool_config.force_x86 or ToolSpec.ARCH_SUFFIX == '_x86') else '64bit'
+        arch_manifest = manifest.get('architecture', {}).get(arch_key, {})
+        arch_url = arch_manifest.get('url')
         download_url = arch_url or manifest.get('url')
+        download_hash = arch_manifest.get('hash') if arch_url else manifest.get('hash')
 
         if not download_url:
             raise Exception(colorama.Fore.RED + f'{self.tool_name}: no download URL found in scoop manifest')
@@ -290,35 +339,40 @@ class Scraper:
         if isinstance(download_url, list):
             download_url = download_url[0]
 
+        # the hashes follow the order of the urls, scoop defaults to sha256
+        if isinstance(download_hash, list):
+            download_hash = download_hash[0] if download_hash else None
+
         return {
             'download_version': version,
             'download_url': download_url,
+            'download_digest': Helpers.parse_digest(download_hash),
         }
 
     #################
     # Check methods
     #################
-    def check_version_from_web(self, html, re_version):
+    def check_version_from_web(self, version_match, re_version):
         """
         Check version from web HTML content.
 
-        :param html: HTML content
-        :param re_version: Regex pattern for version
+        :param version_match: First match of re_version in the HTML content, None if it did not match
+        :param re_version: Compiled regex pattern for version
         :return: Version string
         """
         local_version = self.tool_config.get('local_version', '0')
-        html_regex_version = re.findall(re_version, html)
 
-        if not html_regex_version:
-            raise Exception(colorama.Fore.RED + f'{self.tool_name}: re_version regex not match ({re_version})')
+        if version_match is None:
+            raise Exception(colorama.Fore.RED +
+                            f'{self.tool_name}: re_version regex not match ({re_version.pattern})')
 
-        if not self.force_download and local_version == html_regex_version[0]:
+        if not self.force_download and local_version == version_match:
             logging.info(f'{self.tool_name}: {local_version} is the latest version')
             return None
 
-        logging.info(f'{self.tool_name}: updated from {local_version} --> {html_regex_version[0]}')
+        logging.info(f'{self.tool_name}: updated from {local_version} --> {version_match}')
 
-        return html_regex_version[0]
+        return version_match
 
     def check_version_from_http(self, headers):
         """
@@ -373,43 +427,43 @@ class Scraper:
     #################
     # Download url methods
     #################
-    def get_download_url_from_web(self, url, response_html):
+    async def get_download_url_from_web(self, url, download_match):
         """
         Get download URL from a web page using regex.
 
         :param url: Original URL of the web page
-        :param response_html: HTML content of the web page
+        :param download_match: First match of re_download in the web page, None if it did not match
         :return: Download URL found or None
         """
-        re_download = self.get_arch_config('re_download')
-        update_url = self.get_arch_config('update_url')
+        re_download = self.tool_config.re_download
+        update_url = self.tool_config.update_url
 
         # case 2: if update_url is not set, scrape the link from html
         if re_download:
-            html_regex_download = re.findall(re_download, response_html)
-            if not html_regex_download:
+            if download_match is None:
                 # case 4: use update_url as regex target
                 if not update_url:
-                    raise Exception(colorama.Fore.RED + f'{self.tool_name}: re_download regex not match ({re_download})')
+                    raise Exception(colorama.Fore.RED +
+                                    f'{self.tool_name}: re_download regex not match ({re_download.pattern})')
 
                 logging.debug(f'{self.tool_name}: Testing combination of update_url and re_download.')
-                update_url_response = self.get_request(update_url)
-                html_regex_download = re.findall(re_download, update_url_response.text)
-                if not html_regex_download:
-                    raise Exception(colorama.Fore.RED + f'{self.tool_name}: re_download regex not match ({re_download})')
+                download_match = (await self.scan_request(update_url, [re_download]))[0]
+                if download_match is None:
+                    raise Exception(colorama.Fore.RED +
+                                    f'{self.tool_name}: re_download regex not match ({re_download.pattern})')
 
             # case 1: generated link is valid
-            if Helpers.is_valid_url(html_regex_download[0]):
-                return html_regex_download[0]
+            if Helpers.is_valid_url(download_match):
+                return download_match
 
             # case 2: fix generated link
             if update_url:
                 # fix from configured path
-                update_url = f'{update_url}{html_regex_download[0]}'
+                update_url = f'{update_url}{download_match}'
             else:
                 # fix from original url path
                 url_parse_fix = urllib.parse.urlparse(url)
-                update_url = f'{url_parse_fix.scheme}://{url_parse_fix.netloc}/{html_regex_download[0]}'
+                update_url = f'{url_parse_fix.scheme}://{url_parse_fix.netloc}/{download_match}'
 
         # case 3: if only update_url is set... download it!
         if not update_url:
@@ -417,25 +471,24 @@ class Scraper:
 
         return update_url
 
-    def get_download_url_from_github(self, download_url):
+    async def get_download_url_from_github(self, download_url):
         """
         Get download URL from a github release page using regex.
 
         :param download_url: Base URL for download
         :return: Download URL found or None
         """
-        re_download = self.get_arch_config('re_download')
+        re_download = self.tool_config.re_download
         if not re_download:
             raise Exception(colorama.Fore.RED + f'{self.tool_name}: re_download not set!')
 
-        download_response = self.get_request(download_url)
-        fixed_re_download = self.re_github_download.format(re_download)
-        html_regex_download = re.findall(fixed_re_download, download_response.text)
-        if not html_regex_download:
-            raise Exception(colorama.Fore.RED + f'{self.tool_name}: re_download regex not match ({re_download})')
+        fixed_re_download = re.compile(self.re_github_download.format(re_download.pattern))
+        download_match = (await self.scan_request(download_url, [fixed_re_download]))[0]
+        if download_match is None:
+            raise Exception(colorama.Fore.RED + f'{self.tool_name}: re_download regex not match ({re_download.pattern})')
 
         download_url_parse = urllib.parse.urlparse(download_url)
-        update_url = f'{download_url_parse.scheme}://{download_url_parse.netloc}/{html_regex_download[0]}'
+        update_url = f'{download_url_parse.scheme}://{download_url_parse.netloc}/{download_match}'
 
         return update_url
 
@@ -446,7 +499,7 @@ class Scraper:
         :param json: JSON response from GitHub API
         :return: Download URL found or None
         """
-        re_download = self.get_arch_config('re_download')
+        re_download = self.tool_config.re_download
         if not re_download:
             raise Exception(colorama.Fore.RED + f'{self.tool_name}: re_download regex not set')
 
@@ -456,36 +509,57 @@ class Scraper:
 
         update_url = None
         for attachment in assets:
-            html_regex_download = re.findall(re_download, attachment['browser_download_url'])
-            if html_regex_download:
+            if re_download.search(attachment['browser_download_url']):
                 update_url = attachment['browser_download_url']
                 break
 
         if not update_url:
-            raise Exception(colorama.Fore.RED + f'{self.tool_name}: re_download regex not match ({re_download})')
+            raise Exception(colorama.Fore.RED + f'{self.tool_name}: re_download regex not match ({re_download.pattern})')
 
         return update_url
 
+    def get_digest_from_github_api(self, json, download_url):
+        """
+        Get the digest GitHub publishes for the release asset of a download URL.
+
+        :param json: JSON response from GitHub API
+        :param download_url: Download URL of the asset
+        :return: Digest as "algorithm:hex", or None if the asset has none
+        """
+        for attachment in json.get('assets') or []:
+            if attachment.get('browser_download_url') == download_url:
+                return Helpers.parse_digest(attachment.get('digest'), default_algorithm='')
+
+        return None
+
     #################
     # Scrape step
     #################
-    def scrape_step(self):
+    async def scrape_step_async(self):
         """
-        Execute a specific script for a given tool based on tool_config.
+        Execute the configured scraper for the tool as a coroutine on the HTTP engine loop.
 
         :return: Dictionary containing 'download_version', 'download_url' and 'cookies'
         """
-        from_url = self.tool_config.get('from', 'web')
+        from_url = self.tool_config.source
         if from_url == 'github':
-            result = self.scrape_github()
+            result = await self.scrape_github()
         elif from_url == 'http':
-            result = self.scrape_http()
+            result = await self.scrape_http()
         elif from_url == 'scoop':
-            result = self.scrape_scoop()
+            result = await self.scrape_scoop()
         else:
-            result = self.scrape_web()
+            result = await self.scrape_web()
 
         if result:
-            result['cookies'] = dict(self.session.cookies)
+            result['cookies'] = dict(self.cookies)
 
         return result
+
+    def scrape_step(self):
+        """
+        Execute a specific script for a given tool based on tool_config.
+
+        :return: Dictionary containing 'download_version', 'download_url' and 'cookies'
+        """
+        return self.http_engine.run(self.scrape_step_async())
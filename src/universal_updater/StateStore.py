@@ -0,0 +1,114 @@
+import time
+import sqlite3
+import threading
+
+
+class StateStore:
+    """
+    Runtime state of the tools (installed version, digests, check times, durations...) kept in an SQLite database
+    in WAL mode, so recording the result of a tool is a single-row upsert instead of rewriting tools.ini.
+    The connection is opened on first use and shared by every thread behind a lock.
+    """
+
+    def __init__(self, database_path):
+        """
+        Initialize the store.
+
+        :param database_path: Path to the SQLite database file (created if needed)
+        """
+        self.database_path = database_path
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        """
+        Open the database and create the tables (caller must hold the lock).
+
+        :return: sqlite3 connection
+        """
+        if self._connection is None:
+            connection = sqlite3.connect(self.database_path, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS tool_state ('
+                               'tool TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, updated REAL NOT NULL, '
+                               'PRIMARY KEY (tool, key))')
+            self._connection = connection
+
+        return self._connection
+
+    def get(self, tool, key):
+        """
+        Get a state value of a tool.
+
+        :param tool: Name of the tool
+        :param key: State key
+        :return: Value or None if it is not set
+        """
+        with self._lock:
+            row = self._connect().execute('SELECT value FROM tool_state WHERE tool = ? AND key = ?',
+                                          (tool, key)).fetchone()
+
+        return row[0] if row else None
+
+    def get_tool_state(self, tool):
+        """
+        Get every state value of a tool.
+
+        :param tool: Name of the tool
+        :return: Dict of key -> value
+        """
+        with self._lock:
+            rows = self._connect().execute('SELECT key, value FROM tool_state WHERE tool = ?', (tool,)).fetchall()
+
+        return dict(rows)
+
+    def get_all(self):
+        """
+        Get the state of every tool.
+
+        :return: Dict of tool -> dict of key -> value
+        """
+        with self._lock:
+            rows = self._connect().execute('SELECT tool, key, value FROM tool_state ORDER BY tool, key').fetchall()
+
+        state = {}
+        for tool, key, value in rows:
+            state.setdefault(tool, {})[key] = value
+
+        return state
+
+    def set_many(self, tool, values):
+        """
+        Set several state values of a tool in one transaction.
+
+        :param tool: Name of the tool
+        :param values: Dict of key -> value (values are stored as strings)
+        """
+        now = time.time()
+        rows = [(tool, key, str(value), now) for key, value in values.items()]
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                connection.executemany('INSERT INTO tool_state (tool, key, value, updated) VALUES (?, ?, ?, ?) '
+                                       'ON CONFLICT (tool, key) DO UPDATE SET value = excluded.value, '
+                                       'updated = excluded.updated', rows)
+
+    def set(self, tool, key, value):
+        """
+        Set a state value of a tool.
+
+        :param tool: Name of the tool
+        :param key: State key
+        :param value: Value (stored as a string)
+        """
+        self.set_many(tool, {key: value})
+
+    def close(self):
+        """
+        Close the database connection.
+        """
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
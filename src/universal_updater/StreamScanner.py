@@ -0,0 +1,139 @@
+import codecs
+
+
+class StreamScanner:
+    """
+    Finds the first match of several regexes in a response body while it is read, so the request can stop
+    as soon as every pattern has matched instead of downloading and decoding the whole page.
+    The body is decoded in chunks and only a window of OVERLAP characters is kept between them. A match is
+    accepted once OVERLAP more characters have been read after it (or at the end of the body), so for any
+    match shorter than the window the result is the same as re.findall(...)[0] on the whole body.
+    """
+
+    OVERLAP = 16384
+
+    def __init__(self, patterns, keep_cacheable_body=False):
+        """
+        Initialize the scanner.
+
+        :param patterns: List of compiled patterns, None entries are skipped (their match stays None)
+        :param keep_cacheable_body: Keep the whole body of responses with an ETag or Last-Modified header,
+            so they can be stored in the response cache
+        """
+        self.patterns = list(patterns)
+        self.keep_cacheable_body = keep_cacheable_body
+        self.start({}, None)
+
+    def start(self, headers, encoding):
+        """
+        Reset the scanner for a new response body.
+
+        :param headers: Response headers
+        :param encoding: Charset of the body, default is utf-8
+        """
+        self.keep_body = self.keep_cacheable_body and bool(headers.get('etag') or headers.get('last-modified'))
+        self.body = bytearray() if self.keep_body else None
+        self.bytes_read = 0
+        self.matches = [None] * len(self.patterns)
+        self._pending = [index for index, pattern in enumerate(self.patterns) if pattern is not None]
+        self._positions = dict.fromkeys(self._pending, 0)
+        self._buffer = ''
+        try:
+            self._decoder = codecs.getincrementaldecoder(encoding or 'utf-8')(errors='replace')
+        except LookupError:
+            self._decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+
+    @property
+    def done(self):
+        """
+        Whether every pattern has matched.
+
+        :return: Boolean
+        """
+        return not self._pending
+
+    def feed(self, data):
+        """
+        Scan the next chunk of the body.
+
+        :param data: Bytes read from the response
+        :return: True once every pattern has matched
+        """
+        self.bytes_read += len(data)
+        if self.body is not None:
+            self.body += data
+
+        if self._pending:
+            self._buffer += self._decoder.decode(data)
+            self._search(final=False)
+
+        return self.done
+
+    def finish(self):
+        """
+        Scan the end of the body. Patterns that did not match keep None.
+        """
+        if self._pending:
+            self._buffer += self._decoder.decode(b'', final=True)
+            self._search(final=True)
+            self._pending = []
+
+    def scan(self, content, headers, encoding):
+        """
+        Scan a body that is already in memory (e.g. replayed from the response cache).
+
+        :param content: Response body
+        :param headers: Response headers
+        :param encoding: Charset of the body
+        :return: List with the first match of each pattern
+        """
+        self.start(headers, encoding)
+        self.feed(content)
+        self.finish()
+
+        return self.matches
+
+    def _search(self, final):
+        """
+        Search the pending patterns in the buffer and drop the text none of them can match anymore.
+
+        :param final: True when the buffer holds the end of the body
+        """
+        limit = len(self._buffer) - self.OVERLAP
+        pending = []
+        for index in self._pending:
+            match = self.patterns[index].search(self._buffer, self._positions[index])
+            if match and (final or match.end() <= limit):
+                self.matches[index] = self.get_value(match)
+                continue
+
+            # a match too close to the end may still grow, search it again with more text
+            pending.append(index)
+            self._positions[index] = match.start() if match else max(self._positions[index], limit)
+
+        self._pending = pending
+        if final or not pending:
+            return
+
+        # keep one character before the search positions, so ^ and lookbehinds see what precedes them
+        cut = min(self._positions[index] for index in pending) - 1
+        if cut > 0:
+            self._buffer = self._buffer[cut:]
+            for index in pending:
+                self._positions[index] -= cut
+
+    @staticmethod
+    def get_value(match):
+        """
+        Get the value re.findall() returns for a match: the whole match, its only group or the tuple of groups.
+
+        :param match: re.Match object
+        :return: String or tuple of strings
+        """
+        groups = match.re.groups
+        if groups == 0:
+            return match.group()
+        if groups == 1:
+            return match.group(1) or ''
+
+        return match.groups('')
@@ -0,0 +1,202 @@
+import re
+import pathlib
+import platform
+import colorama
+from types import MappingProxyType
+from collections.abc import Mapping
+
+from universal_updater.Packer import Packer
+
+
+class ToolSpec(Mapping):
+    """
+    Validated, read-only settings of a tool, built once when the config file is loaded.
+    Regexes are compiled, architecture-specific keys are resolved for this machine, booleans are parsed
+    and the install folder is resolved, so a bad tool fails before any request is made.
+    The raw values (and the runtime state) are still available through the mapping interface.
+    """
+
+    __slots__ = ('name', 'source', 'url', 'folder_path', 're_version', 're_download', 'update_url',
+                 'update_file_pass', 'scoop_bucket', 'merge', 'force_x86', 'disable_repack',
+                 'disable_content_type_check', 'stream_unpack', 'incremental_install', 'atomic_install',
+                 'check_interval', 'repack_method', 'repack_level', '_values')
+
+    SOURCES = ('web', 'github', 'http', 'scoop')
+    ARCH_SUFFIX = '_x64' if '64' in platform.machine() else '_x86'
+    BOOLEAN_OPTIONS = ('merge', 'force_x86', 'disable_repack', 'disable_content_type_check', 'stream_unpack',
+                       'incremental_install', 'atomic_install')
+    BOOLEAN_STATES = {'1': True, 'yes': True, 'true': True, 'on': True,
+                      '0': False, 'no': False, 'false': False, 'off': False, '': False}
+
+    def __init__(self, name, values, base_path):
+        """
+        Build the spec of a tool.
+
+        :param name: Name of the tool (its section)
+        :param values: Dict of raw values of the section
+        :param base_path: Folder that relative "folder" values are resolved against
+        :raises Exception: If a required field is missing or a value is not valid
+        """
+        setattr_ = super().__setattr__
+        setattr_('name', name)
+        setattr_('_values', MappingProxyType(dict(values)))
+
+        source = values.get('from', 'web').lower()
+        if source not in self.SOURCES:
+            self.fail(f'unknown "from" value "{source}"')
+        setattr_('source', source)
+
+        url = values.get('url')
+        if not url and source != 'http':
+            self.fail('"url" key is required in config')
+        setattr_('url', url)
+
+        folder = values.get('folder')
+        if not folder:
+            self.fail('"folder" key is required in config')
+        folder_path = pathlib.Path(folder)
+        if not folder_path.is_absolute():
+            folder_path = pathlib.Path(base_path).joinpath(folder_path)
+        setattr_('folder_path', folder_path.resolve(strict=False))
+
+        update_url = self.get_arch_value('update_url')
+        if not update_url and source == 'http':
+            self.fail('the update_url field is required for the selected mode')
+        setattr_('update_url', update_url)
+
+        re_version = values.get('re_version')
+        if not re_version and source == 'web':
+            self.fail('"re_version" key is required for the selected mode')
+        setattr_('re_version', self.compile('re_version', re_version))
+        setattr_('re_download', self.compile('re_download', self.get_arch_value('re_download')))
+
+        setattr_('update_file_pass', values.get('update_file_pass'))
+        setattr_('scoop_bucket', values.get('scoop_bucket', 'main').capitalize())
+        for option in self.BOOLEAN_OPTIONS:
+            setattr_(option, self.parse_boolean(option))
+        setattr_('check_interval', self.parse_hours('check_interval'))
+
+        repack_method = values.get('repack_method', '').strip().lower() or None
+        if repack_method is not None and repack_method not in Packer.REPACK_METHODS:
+            self.fail(f'unknown repack_method "{repack_method}"')
+        setattr_('repack_method', repack_method)
+        setattr_('repack_level', self.parse_repack_level('repack_level', repack_method))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'{type(self).__name__} is read-only')
+
+    def __getitem__(self, key):
+        return self._values[key]
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+    def fail(self, message):
+        """
+        Raise a config error for this tool.
+
+        :param message: Error message
+        :raises Exception: Always
+        """
+        raise Exception(colorama.Fore.RED + f'{self.name}: {message}')
+
+    def get_arch_value(self, key):
+        """
+        Get the architecture-specific value of a key for this machine, falling back to the generic key.
+
+        :param key: Base key (e.g. 're_download', 'update_url')
+        :return: Value or None if neither exists
+        """
+        return self._values.get(f'{key}{self.ARCH_SUFFIX}') or self._values.get(key)
+
+    def compile(self, key, pattern):
+        """
+        Compile a regex of the config.
+
+        :param key: Config key, for the error message
+        :param pattern: Regex string or None
+        :return: Compiled pattern or None
+        """
+        if not pattern:
+            return None
+
+        try:
+            return re.compile(pattern)
+        except re.error as error:
+            self.fail(f'invalid {key} regex ({pattern}): {error}')
+
+    def parse_boolean(self, key):
+        """
+        Parse a boolean value of the config (1/yes/true/on or 0/no/false/off, empty = false).
+
+        :param key: Config key
+        :return: Boolean value
+        """
+        value = self._values.get(key, 'false').strip().lower()
+        if value not in self.BOOLEAN_STATES:
+            self.fail(f'"{key}" must be true or false, not "{value}"')
+
+        return self.BOOLEAN_STATES[value]
+
+    def parse_hours(self, key):
+        """
+        Parse a number of hours of the config.
+
+        :param key: Config key
+        :return: Float value or None if it is not set
+        """
+        value = self._values.get(key, '').strip()
+        if not value:
+            return None
+
+        try:
+            hours = float(value)
+        except ValueError:
+            hours = -1
+        if hours < 0:
+            self.fail(f'"{key}" must be a number of hours, not "{value}"')
+
+        return hours
+
+    def parse_repack_level(self, key, method):
+        """
+        Parse a compression level of the config.
+
+        :param key: Config key
+        :param method: Repack method of the tool, None if it uses the global one
+        :return: Integer level (-1 = default of the method) or None if it is not set
+        """
+        value = self._values.get(key, '').strip()
+        if not value:
+            return None
+
+        if method is not None:
+            levels = Packer.REPACK_METHODS[method][1]
+        else:
+            levels = range(0, max(levels.stop for _, levels in Packer.REPACK_METHODS.values()))
+        try:
+            level = int(value)
+        except ValueError:
+            level = None
+        if level is None or (level != -1 and level not in levels):
+            self.fail(f'"{key}" must be -1 or a level from {levels.start} to {levels.stop - 1}, not "{value}"')
+
+        return level
+
+    def with_state(self, state):
+        """
+        Get a copy of the spec whose mapping also holds the runtime state (local_version...).
+
+        :param state: Dict of state key -> value
+        :return: New ToolSpec sharing the compiled values
+        """
+        spec = object.__new__(ToolSpec)
+        for slot in self.__slots__:
+            object.__setattr__(spec, slot, getattr(self, slot))
+        if state:
+            object.__setattr__(spec, '_values', MappingProxyType({**self._values, **state}))
+
+        return spec
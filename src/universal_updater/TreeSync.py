@@ -0,0 +1,208 @@
+import os
+import re
+import json
+import shutil
+import pathlib
+import hashlib
+import logging
+
+from universal_updater.Helpers import Helpers
+
+
+class TreeSync:
+    """
+    Differential copy of an unpacked tool into its install folder.
+    Only new or changed files are written and, if requested, only removed files are deleted.
+    A manifest per tool records the size, mtime and sha256 of every installed file,
+    so unchanged files are recognized on later runs without rehashing the install folder.
+    """
+
+    CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, manifest_folder_path):
+        """
+        Initialize the syncer.
+
+        :param manifest_folder_path: Path to the folder where the per-tool manifests are stored
+        """
+        self.manifest_folder_path = pathlib.Path(manifest_folder_path)
+
+    def get_manifest_path(self, tool_name):
+        """
+        Get the manifest path of a tool.
+
+        :param tool_name: Name of the tool
+        :return: Path object
+        """
+        return self.manifest_folder_path.joinpath(re.sub(r'[^\w.-]', '_', tool_name) + '.json')
+
+    def load_manifest(self, tool_name, dest_path):
+        """
+        Load the manifest of a tool, ignoring it if it was written for another install folder.
+
+        :param tool_name: Name of the tool
+        :param dest_path: Install folder
+        :return: Dict of relative path -> {'size', 'mtime_ns', 'sha256'}
+        """
+        try:
+            with open(self.get_manifest_path(tool_name), 'r', encoding='utf-8') as manifest_file:
+                manifest = json.load(manifest_file)
+        except (OSError, ValueError):
+            return {}
+
+        if manifest.get('folder') != str(dest_path):
+            return {}
+
+        return manifest.get('files', {})
+
+    def save_manifest(self, tool_name, dest_path, files):
+        """
+        Write the manifest of a tool.
+
+        :param tool_name: Name of the tool
+        :param dest_path: Install folder
+        :param files: Dict of relative path -> {'size', 'mtime_ns', 'sha256'}
+        """
+        self.manifest_folder_path.mkdir(parents=True, exist_ok=True)
+        manifest_path = self.get_manifest_path(tool_name)
+        temp_path = manifest_path.with_suffix('.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as manifest_file:
+            json.dump({'folder': str(dest_path), 'files': files}, manifest_file)
+        os.replace(temp_path, manifest_path)
+
+    @staticmethod
+    def list_files(root_path):
+        """
+        List the files and folders of a tree.
+
+        :param root_path: Root folder
+        :return: Tuple (dict of relative posix path -> os.stat_result, set of relative folder paths)
+        """
+        files = {}
+        folders = set()
+        for folder, dir_names, file_names in os.walk(root_path):
+            relative_folder = pathlib.PurePath(os.path.relpath(folder, root_path))
+            for dir_name in dir_names:
+                folders.add(relative_folder.joinpath(dir_name).as_posix())
+            for file_name in file_names:
+                files[relative_folder.joinpath(file_name).as_posix()] = os.stat(os.path.join(folder, file_name))
+
+        return files, folders
+
+    def copy_file(self, source_path, dest_path):
+        """
+        Copy a file (content, mode and times) and hash it in the same pass.
+
+        :param source_path: Source file
+        :param dest_path: Destination file (replaced if it exists)
+        :return: Hex digest string of the content
+        """
+        digest = hashlib.sha256()
+        if dest_path.is_dir() and not dest_path.is_symlink():
+            shutil.rmtree(dest_path)
+        elif dest_path.is_symlink() or dest_path.is_file():
+            # never write through a hard link shared with the download cache or another install
+            dest_path.unlink()
+
+        with open(source_path, 'rb') as source, open(dest_path, 'wb') as dest:
+            for chunk in iter(lambda: source.read(self.CHUNK_SIZE), b''):
+                digest.update(chunk)
+                dest.write(chunk)
+        shutil.copystat(source_path, dest_path)
+
+        return digest.hexdigest()
+
+    def is_unchanged(self, source_path, source_stat, dest_path, dest_stat, entry):
+        """
+        Check whether an installed file already has the content of the new one.
+
+        :param source_path: New file
+        :param source_stat: os.stat_result of the new file
+        :param dest_path: Installed file
+        :param dest_stat: os.stat_result of the installed file
+        :param entry: Manifest entry of the installed file or None
+        :return: Tuple (unchanged, sha256 of the new file or None if it was not needed)
+        """
+        if source_stat.st_size != dest_stat.st_size:
+            return False, None
+
+        # the manifest is only trusted while the installed file is untouched since it was written
+        known = entry and entry['size'] == dest_stat.st_size and entry['mtime_ns'] == dest_stat.st_mtime_ns
+        if known and source_stat.st_mtime_ns == dest_stat.st_mtime_ns:
+            return True, entry['sha256']
+
+        dest_hash = entry['sha256'] if known else Helpers.get_file_digest(dest_path)
+        source_hash = Helpers.get_file_digest(source_path)
+
+        return source_hash == dest_hash, source_hash
+
+    def sync(self, tool_name, source_path, dest_path, delete_removed):
+        """
+        Make the install folder match the unpacked tree.
+
+        :param tool_name: Name of the tool
+        :param source_path: Unpacked tree
+        :param dest_path: Install folder
+        :param delete_removed: Delete installed files and folders that are not in the unpacked tree
+        :return: Dictionary with the 'copied', 'unchanged' and 'deleted' file counts
+        """
+        source_path = pathlib.Path(source_path)
+        dest_path = pathlib.Path(dest_path)
+        manifest = self.load_manifest(tool_name, dest_path)
+        source_files, source_folders = self.list_files(source_path)
+        dest_files, dest_folders = self.list_files(dest_path)
+        stats = {'copied': 0, 'unchanged': 0, 'deleted': 0}
+        files = {}
+
+        for folder in sorted(source_folders):
+            folder_path = dest_path.joinpath(folder)
+            if folder_path.is_file() or folder_path.is_symlink():
+                folder_path.unlink()
+                dest_files.pop(folder, None)
+            folder_path.mkdir(parents=True, exist_ok=True)
+
+        for relative_path, source_stat in source_files.items():
+            source_file = source_path.joinpath(relative_path)
+            dest_file = dest_path.joinpath(relative_path)
+            dest_stat = dest_files.get(relative_path)
+
+            if dest_stat is not None:
+                unchanged, sha256 = self.is_unchanged(source_file, source_stat, dest_file, dest_stat,
+                                                      manifest.get(relative_path))
+                if unchanged:
+                    stats['unchanged'] += 1
+                    files[relative_path] = {
+                        'size': dest_stat.st_size,
+                        'mtime_ns': dest_stat.st_mtime_ns,
+                        'sha256': sha256,
+                    }
+                    continue
+
+            sha256 = self.copy_file(source_file, dest_file)
+            stats['copied'] += 1
+            dest_stat = dest_file.stat()
+            files[relative_path] = {'size': dest_stat.st_size, 'mtime_ns': dest_stat.st_mtime_ns, 'sha256': sha256}
+
+        if delete_removed:
+            for relative_path in dest_files.keys() - source_files.keys():
+                dest_path.joinpath(relative_path).unlink()
+                stats['deleted'] += 1
+
+            # deepest first, so parents are empty when they are reached
+            for folder in sorted(dest_folders - source_folders, key=len, reverse=True):
+                folder_path = dest_path.joinpath(folder)
+                if folder_path.is_symlink():
+                    folder_path.unlink()
+                else:
+                    shutil.rmtree(folder_path, ignore_errors=True)
+        else:
+            # keep tracking files that are still installed from earlier versions
+            for relative_path in dest_files.keys() - source_files.keys():
+                if relative_path in manifest:
+                    files[relative_path] = manifest[relative_path]
+
+        self.save_manifest(tool_name, dest_path, files)
+        logging.debug(f'{tool_name}: incremental install copied {stats["copied"]}, '
+                      f'kept {stats["unchanged"]}, deleted {stats["deleted"]} files')
+
+        return stats
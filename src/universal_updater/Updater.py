@@ -1,4 +1,6 @@
 import os
+import time
+import asyncio
 import pathlib
 import colorama
 import logging
@@ -7,8 +9,12 @@ from universal_updater.Scraper import Scraper
 from universal_updater.Downloader import Downloader
 from universal_updater.Packer import Packer
 from universal_updater.FileManager import FileManager
+from universal_updater.CopyEngine import CopyEngine
 from universal_updater.ScriptExecutor import ScriptExecutor
 from universal_updater.Helpers import Helpers
+from universal_updater.HttpEngine import HttpEngine
+from universal_updater.ZipStreamExtractor import ZipStreamExtractor
+from universal_updater.RunMetrics import RunMetrics
 
 
 class Updater:
@@ -18,7 +24,10 @@ class Updater:
     repacking the tool. It also handles pre-update and post-update scripts.
     """
 
-    def __init__(self, config_manager, updater_setup=None):
+    REQUEST_USER_AGENT = 'curl/7.84.0'
+
+    def __init__(self, config_manager, updater_setup=None, response_cache=None, http_engine=None,
+                 github_releases=None, download_cache=None, metrics=None):
         """
         Initialize the Updater class with various configurations.
 
@@ -32,6 +41,11 @@ class Updater:
             - disable_progress: Flag to disable progress bar
             - save_format_type: Format type for saving (default "full")
             - use_github_api: Flag to use GitHub API. The value is the token to use the api.
+        :param response_cache: Optional ResponseCache instance shared by all the scrapers of the run
+        :param http_engine: Optional HttpEngine shared by all the scrapers of the run
+        :param github_releases: Optional dict of repo -> latest release prefetched by GitHubBatchLookup
+        :param download_cache: Optional DownloadCache checked before downloading
+        :param metrics: Optional RunMetrics shared by all the updaters of the run
         """
         if updater_setup is None:
             updater_setup = {}
@@ -39,18 +53,29 @@ class Updater:
         self.tool_config = {}
         self.script_path = os.fsdecode(os.getcwdb())
         self.updates_root = pathlib.Path(self.script_path) / 'updates'
+        self.partials_root = self.updates_root / '.partial'
         self.update_folder_path = self.updates_root
-        self.request_user_agent = 'curl/7.84.0'
+        self.request_user_agent = self.REQUEST_USER_AGENT
         self.config_manager = config_manager
         self.disable_install_check = updater_setup.get('disable_install_check', False)
         self.disable_repack = updater_setup.get('disable_repack', False)
+        self.force_download = updater_setup.get('force_download', False)
         self.dry_run = updater_setup.get('dry_run', False)
+        self.http_engine = http_engine or HttpEngine()
+        self.download_cache = download_cache
+        self.metrics = metrics or RunMetrics()
+        self.stream_unpack = updater_setup.get('stream_unpack', False)
+        self.file_digest = None
+        self.check_time = 0
         self.scraper = Scraper(
             force_download=updater_setup.get('force_download', False),
             use_github_api=updater_setup.get('use_github_api', ''),
             user_agent=self.request_user_agent,
             request_timeout=updater_setup.get('request_timeout', 30),
             request_retries=updater_setup.get('download_retries', 3),
+            response_cache=response_cache,
+            http_engine=self.http_engine,
+            github_releases=github_releases,
         )
         self.downloader = Downloader(
             disable_progress=updater_setup.get('disable_progress', False),
@@ -60,14 +85,27 @@ class Updater:
             download_segments=updater_setup.get('download_segments', 3),
             request_timeout=updater_setup.get('request_timeout', 30),
         )
+        self.zip_stream_extractor = ZipStreamExtractor(
+            user_agent=self.request_user_agent,
+            request_timeout=updater_setup.get('request_timeout', 30),
+            host_limiter=self.http_engine.host_limiter,
+        )
+        self.copy_engine = CopyEngine(workers=updater_setup.get('copy_workers', 0))
         self.packer = Packer(
             save_format_type=updater_setup.get('save_format_type', 'full'),
             disable_clean=updater_setup.get('disable_clean', False),
             update_folder_path=self.update_folder_path,
+            repack_method=updater_setup.get('repack_method', 'lzma2'),
+            repack_level=updater_setup.get('repack_level', -1),
+            repack_threads=updater_setup.get('repack_threads', 0),
+            unpack_workers=updater_setup.get('unpack_workers', 0),
         )
         self.file_manager = FileManager(
             disable_clean=updater_setup.get('disable_clean', False),
             script_path=self.script_path,
+            incremental_install=updater_setup.get('incremental_install', False),
+            copy_engine=self.copy_engine,
+            atomic_install=updater_setup.get('atomic_install', False),
         )
         self.script_executor = ScriptExecutor()
 
@@ -93,62 +131,176 @@ class Updater:
         :param scrape_data: Scrape data from the tool
         :param processing_info: Information about the processing step
         """
+        if self.file_manager.previous_saved:
+            self.config_manager.set_config(self.tool_name, 'previous_version', self.tool_config.get('local_version', '0'))
+        self.config_manager.set_config(self.tool_name, 'local_digest',
+                                       f'sha256:{self.file_digest}' if self.file_digest else '')
         self.config_manager.update_local_version(self.tool_name, scrape_data['download_version'])
         self.script_executor.execute_script('post_update', processing_info)
         self.script_executor.execute_global_script(processing_info)
 
-    def download_step(self, download_url, cookies=None):
+    def download_step(self, scrape_data):
         """
-        Download the tool from the given URL.
+        Download the tool from the URL found by the scrape step.
 
-        :param download_url: URL to download the tool from
-        :param cookies: Optional cookies dict from the scrape session
+        :param scrape_data: Scrape data with 'download_url' and optionally 'cookies', 'file_name', 'content_type'
+            and 'download_digest'
         :return: Path to the downloaded file
         """
         # create updates folder if don't exist
         if not pathlib.Path.exists(self.update_folder_path):
             pathlib.Path.mkdir(self.update_folder_path, parents=True)
 
-        check_content_type = not self.tool_config.get('disable_content_type_check', False)
-        return self.downloader.download_from_web(self.tool_name, download_url, check_content_type, cookies)
+        download_url = scrape_data['download_url']
+        download_version = scrape_data['download_version']
+        if self.download_cache:
+            cached_file_path = self.download_cache.get(download_url, download_version, self.update_folder_path)
+            if cached_file_path:
+                logging.info(f'{self.tool_name}: using cached download "{cached_file_path.name}"')
+                self.file_digest = self.download_cache.get_sha256(download_url, download_version)
+                self.verify_download(cached_file_path, scrape_data.get('download_digest'))
+                return cached_file_path
+
+        check_content_type = not self.tool_config.disable_content_type_check
+        file_path = self.downloader.download_from_web(
+            tool_name=self.tool_name,
+            download_url=scrape_data['download_url'],
+            check_content_type=check_content_type,
+            cookies=scrape_data.get('cookies'),
+            file_name=scrape_data.get('file_name'),
+            content_type=scrape_data.get('content_type'),
+        )
+        self.file_digest = self.downloader.file_digest
+        self.metrics.add(self.tool_name, 'download_step', bytes_moved=pathlib.Path(file_path).stat().st_size)
+        self.verify_download(file_path, scrape_data.get('download_digest'))
+
+        if self.download_cache:
+            self.download_cache.put(download_url, download_version, file_path, self.file_digest)
+
+        return file_path
 
-    def processing_tool_step(self, file_path, download_version):
+    def verify_download(self, file_path, expected_digest):
         """
-        Process the downloaded tool.
+        Compare the digest of a download with the one published by its source.
+        sha256 digests reuse the one computed during the download, other algorithms read the file.
 
         :param file_path: Path to the downloaded file
+        :param expected_digest: Expected digest as "algorithm:hex", or None to skip the check
+        :raises Exception: If the digests do not match (the file is deleted)
+        """
+        if not expected_digest:
+            return
+
+        algorithm, expected_hex = expected_digest.split(':', 1)
+        if algorithm == 'sha256' and self.file_digest:
+            file_hex = self.file_digest
+        else:
+            file_hex = Helpers.get_file_digest(file_path, algorithm)
+
+        if file_hex != expected_hex:
+            pathlib.Path(file_path).unlink(missing_ok=True)
+            raise Exception(colorama.Fore.RED + f'{self.tool_name}: {algorithm} mismatch, '
+                                                f'expected {expected_hex} but the download is {file_hex}')
+
+        logging.debug(f'{self.tool_name}: {algorithm} verified ({expected_hex})')
+
+    def is_installed_download(self):
+        """
+        Check if the downloaded bytes are the same ones installed by the last update.
+
+        :return: True if the digest matches the recorded local_digest and the download is not forced
+        """
+        local_digest = self.tool_config.get('local_digest', '')
+        return bool(self.file_digest) and not self.force_download and local_digest == f'sha256:{self.file_digest}'
+
+    def stream_step(self, scrape_data):
+        """
+        Download and unpack a ZIP file in one pass, if enabled and possible for this tool.
+
+        :param scrape_data: Scrape data returned by check()
+        :return: Path to the unpacked folder, or None to use the regular download and unpack steps
+        """
+        stream_unpack = self.stream_unpack or self.tool_config.stream_unpack
+        if not stream_unpack or self.tool_config.update_file_pass:
+            return None
+
+        # a published digest is checked on the whole file, which streaming never has
+        if scrape_data.get('download_digest'):
+            return None
+
+        # a cached archive costs no bandwidth, prefer it
+        download_url = scrape_data['download_url']
+        if self.download_cache and self.download_cache.contains(download_url, scrape_data['download_version']):
+            return None
+
+        file_name = scrape_data.get('file_name') or Helpers.get_filename_from_url(download_url)
+        if pathlib.Path(file_name).suffix.lower() != '.zip':
+            return None
+
+        logging.info(f'{self.tool_name}: streaming update "{file_name}"')
+        with self.metrics.measure(self.tool_name, 'stream_step'):
+            try:
+                streamed = self.zip_stream_extractor.extract(self.tool_name, download_url, self.update_folder_path,
+                                                             scrape_data.get('cookies'))
+                self.metrics.add(self.tool_name, 'stream_step', bytes_moved=self.zip_stream_extractor.bytes_received)
+                if streamed:
+                    return self.update_folder_path
+            except Exception as exception:
+                logging.warning(f'{self.tool_name}: streaming unpack failed ({exception}), downloading instead')
+
+            self.cleanup_update_folder()
+        return None
+
+    def processing_tool_step(self, file_path, download_version, unpack_folder_path=None):
+        """
+        Process the downloaded tool.
+
+        :param file_path: Path to the downloaded file (None if already unpacked by stream_step)
         :param download_version: Version of the downloaded tool
+        :param unpack_folder_path: Path to the folder already unpacked by stream_step, if any
         :return: Dictionary containing processing information
         """
         # unpack logic
-        logging.debug(f'{self.tool_name}: unpack file {file_path}')
-        unpack_folder_path = self.packer.unpack_step(file_path)
-        self.script_executor.execute_script(
-            'post_unpack',
-            {
-                'tool_name': self.tool_name,
-                'unpack_folder': unpack_folder_path,
-                'download_version': download_version
-            }
-        )
+        with self.metrics.measure(self.tool_name, 'unpack'):
+            if unpack_folder_path:
+                self.packer.unpack_nested(unpack_folder_path)
+            else:
+                logging.debug(f'{self.tool_name}: unpack file {file_path}')
+                unpack_folder_path = self.packer.unpack_step(file_path)
+        self.metrics.add(self.tool_name, 'unpack', bytes_moved=self.packer.unpacked_size)
+
+        with self.metrics.measure(self.tool_name, 'post_unpack'):
+            self.script_executor.execute_script(
+                'post_unpack',
+                {
+                    'tool_name': self.tool_name,
+                    'unpack_folder': unpack_folder_path,
+                    'download_version': download_version
+                }
+            )
 
         # save or repack logic
-        disable_repack = self.tool_config.get('disable_repack', None)
         tool_path = self.file_manager.processing_tool_path(unpack_folder_path)
-        if self.disable_repack or disable_repack:
+        if self.disable_repack or self.tool_config.disable_repack:
             logging.debug(f'{self.tool_name}: repack is disabled')
-            return self.file_manager.save(
+            with self.metrics.measure(self.tool_name, 'save'):
+                return self.file_manager.save(
+                    tool_folder_path=tool_path['folder_path'],
+                    tool_unpack_path=tool_path['unpack_path'],
+                )
+
+        logging.debug(f'{self.tool_name}: repack update')
+        with self.metrics.measure(self.tool_name, 'repack'):
+            processing_info = self.packer.repack_step(
                 tool_folder_path=tool_path['folder_path'],
                 tool_unpack_path=tool_path['unpack_path'],
+                unpack_folder_path=unpack_folder_path,
+                version=download_version,
             )
+        repack_path = pathlib.Path(processing_info['tool_folder']).joinpath(processing_info['save_compress_name'])
+        self.metrics.add(self.tool_name, 'repack', bytes_moved=repack_path.stat().st_size)
 
-        logging.debug(f'{self.tool_name}: repack update')
-        return self.packer.repack_step(
-            tool_folder_path=tool_path['folder_path'],
-            tool_unpack_path=tool_path['unpack_path'],
-            unpack_folder_path=unpack_folder_path,
-            version=download_version,
-        )
+        return processing_info
 
     def cleanup_update_folder(self):
         """
@@ -159,56 +311,159 @@ class Updater:
 
     def cleanup_updates_root(self):
         """
-        Remove the entire updates root folder.
+        Remove the updates root folder, keeping the partial downloads so the next run can resume them.
         """
-        if self.updates_root.exists():
+        if not self.updates_root.exists():
+            return
+
+        for item in self.updates_root.iterdir():
+            if item == self.partials_root:
+                # drop the folders of downloads that failed before writing anything
+                for partial_folder in item.iterdir():
+                    if partial_folder.is_dir() and not any(partial_folder.iterdir()):
+                        Helpers.delete_folder(partial_folder)
+                continue
+
+            if item.is_dir():
+                Helpers.delete_folder(item)
+            else:
+                item.unlink()
+
+        if not self.partials_root.exists() or not any(self.partials_root.iterdir()):
             Helpers.delete_folder(self.updates_root)
 
-    def update(self, tool_name):
+    def tool_setup(self, tool_name):
         """
-        Perform the update process for a given tool.
+        Load the tool config and initialize the tool-specific settings of every helper.
 
         :param tool_name: Name of the tool to update
-        :return: bool: True if the update completes successfully, False if no update is needed.
-        :raises Exception: If any step in the update process fails.
         """
-        # tool data setup
         self.tool_name = tool_name
         self.tool_config = self.config_manager.get_tool_config(tool_name)
         self.update_folder_path = self.updates_root / tool_name
         self.downloader.update_folder_path = self.update_folder_path
+        self.downloader.partial_folder_path = self.partials_root / tool_name
         self.packer.update_folder_path = self.update_folder_path
         self.scraper.tool_setup(self.tool_name, self.tool_config)
         self.packer.tool_setup(self.tool_name, self.tool_config)
         self.file_manager.tool_setup(self.tool_name, self.tool_config)
         self.script_executor.tool_setup(self.tool_name, self.tool_config)
 
-        # execute checks and scripts
-        self.pre_update()
+    def check(self, tool_name):
+        """
+        Perform the check phase for a given tool: pre-update checks and scripts, and the scrape step.
 
-        try:
-            # generate version and download data
-            logging.debug(f'{self.tool_name}: start "scrape_step"')
-            scrape_data = self.scraper.scrape_step()
-            if scrape_data is False:
-                return False
+        :param tool_name: Name of the tool to check
+        :return: dict|bool: Scrape data if an update is available, False if no update is needed.
+        :raises Exception: If the pre-update checks or the scrape step fail.
+        """
+        return self.http_engine.run(self.check_async(tool_name))
+
+    async def check_async(self, tool_name):
+        """
+        Coroutine version of check(), to be run on the HTTP engine loop.
 
-            if self.dry_run:
-                logging.info(colorama.Fore.CYAN + f'{self.tool_name}: [dry-run] update available → {scrape_data["download_version"]} ({scrape_data["download_url"]})')
-                return True
+        :param tool_name: Name of the tool to check
+        :return: dict|bool: Scrape data if an update is available, False if no update is needed.
+        :raises Exception: If the pre-update checks or the scrape step fail.
+        """
+        self.tool_setup(tool_name)
+        self.check_time = time.time()
+
+        # execute checks and scripts (scripts are blocking, keep them out of the loop)
+        with self.metrics.measure(self.tool_name, 'pre_update'):
+            await asyncio.to_thread(self.pre_update)
+
+        # generate version and download data
+        logging.debug(f'{self.tool_name}: start "scrape_step"')
+        with self.metrics.measure(self.tool_name, 'scrape_step'):
+            scrape_data = await self.scraper.scrape_step_async()
+        if scrape_data is False:
+            self.mark_checked()
+            return False
+
+        if self.dry_run:
+            logging.info(colorama.Fore.CYAN + f'{self.tool_name}: [dry-run] update available → {scrape_data["download_version"]} ({scrape_data["download_url"]})')
+
+        return scrape_data
 
+    def install(self, scrape_data):
+        """
+        Perform the install phase for the tool returned by check(): download, process and post-update.
+
+        :param scrape_data: Scrape data returned by check()
+        :return: bool: True if the update completes successfully.
+        :raises Exception: If any step in the install process fails.
+        """
+        try:
             # download and process file
-            logging.debug(f'{self.tool_name}: start "download_step"')
-            update_file_path = self.download_step(scrape_data['download_url'], scrape_data.get('cookies'))
+            update_file_path = None
+            logging.debug(f'{self.tool_name}: start "stream_step"')
+            unpack_folder_path = self.stream_step(scrape_data)
+            if not unpack_folder_path:
+                logging.debug(f'{self.tool_name}: start "download_step"')
+                with self.metrics.measure(self.tool_name, 'download_step'):
+                    update_file_path = self.download_step(scrape_data)
+
+                # e.g. "http" tools whose Last-Modified changed without new content
+                if self.is_installed_download():
+                    logging.info(f'{self.tool_name}: the download is identical to the installed one, skipping install')
+                    self.config_manager.update_local_version(self.tool_name, scrape_data['download_version'])
+                    self.mark_checked()
+                    return True
 
             logging.debug(f'{self.tool_name}: start "processing_tool_step"')
-            processing_info = self.processing_tool_step(update_file_path, scrape_data['download_version'])
+            processing_info = self.processing_tool_step(update_file_path, scrape_data['download_version'],
+                                                        unpack_folder_path)
 
             # update complete
             logging.debug(f'{self.tool_name}: start "post_update"')
-            self.post_update(scrape_data, processing_info)
+            with self.metrics.measure(self.tool_name, 'post_update'):
+                self.post_update(scrape_data, processing_info)
+            self.mark_checked()
 
             logging.info(f'{self.tool_name}: update complete')
             return True
         finally:
             self.cleanup_update_folder()
+
+    def mark_checked(self):
+        """
+        Record the time of the last complete check of the tool, used by the check schedule.
+        A failed check or install is not recorded, so the tool is retried on the next run.
+        """
+        if not self.dry_run:
+            self.config_manager.set_config(self.tool_name, 'last_checked', str(int(self.check_time)))
+
+    def rollback(self, tool_name):
+        """
+        Restore the version kept by the last atomic install of a tool.
+
+        :param tool_name: Name of the tool
+        :raises Exception: If there is no previous version or the folders cannot be swapped
+        """
+        self.tool_setup(tool_name)
+        previous_version = self.tool_config.get('previous_version', '0')
+        self.file_manager.rollback()
+        self.config_manager.set_config(self.tool_name, 'previous_version', self.tool_config.get('local_version', '0'))
+        # the recorded digest belongs to the version that was just rolled back
+        self.config_manager.set_config(self.tool_name, 'local_digest', '')
+        self.config_manager.update_local_version(self.tool_name, previous_version)
+        logging.info(f'{self.tool_name}: rolled back to version {previous_version}')
+
+    def update(self, tool_name):
+        """
+        Perform the update process for a given tool.
+
+        :param tool_name: Name of the tool to update
+        :return: bool: True if the update completes successfully, False if no update is needed.
+        :raises Exception: If any step in the update process fails.
+        """
+        scrape_data = self.check(tool_name)
+        if scrape_data is False:
+            return False
+
+        if self.dry_run:
+            return True
+
+        return self.install(scrape_data)
@@ -0,0 +1,304 @@
+import os
+import re
+import zlib
+import struct
+import pathlib
+import asyncio
+import aiohttp
+import logging
+import contextlib
+
+
+class ZipStreamUnsupported(Exception):
+    """Raised when an archive or a server cannot be used for streaming extraction."""
+
+
+class ZipStreamExtractor:
+    """
+    Extracts a remote ZIP file while it is being downloaded.
+    The central directory is read first with a range request, then the archive is streamed
+    with a single GET and every member is inflated to disk as its bytes arrive.
+    Only plain (non ZIP64, non encrypted) archives using store or deflate are supported.
+    """
+
+    EOCD_SIGNATURE = b'PK\x05\x06'
+    CENTRAL_SIGNATURE = b'PK\x01\x02'
+    LOCAL_SIGNATURE = b'PK\x03\x04'
+    EOCD_STRUCT = struct.Struct('<4sHHHHIIH')
+    CENTRAL_STRUCT = struct.Struct('<4sHHHHHHIIIHHHHHII')
+    LOCAL_STRUCT = struct.Struct('<4sHHHHHIIIHH')
+    TAIL_SIZE = 22 + 65535
+    CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, user_agent, request_timeout=30, host_limiter=None):
+        """
+        Initialize the extractor.
+
+        :param user_agent: User agent string for HTTP requests
+        :param request_timeout: Timeout in seconds for the range request (the stream has no total timeout)
+        :param host_limiter: Optional HostLimiter applied to the requests
+        """
+        self.user_agent = user_agent
+        self.request_timeout = request_timeout
+        self.host_limiter = host_limiter
+        self.tool_name = ""
+        self.bytes_received = 0
+
+    @contextlib.asynccontextmanager
+    async def _get(self, session, url, headers, timeout):
+        """
+        Open a GET request through the host limiter, holding the host slot until the body has been read.
+
+        :param session: aiohttp session
+        :param url: The URL to request
+        :param headers: Dictionary of HTTP headers
+        :param timeout: aiohttp.ClientTimeout for the request
+        :return: Async context manager yielding the aiohttp response
+        """
+        async with self.host_limiter.limit(url) if self.host_limiter else contextlib.nullcontext():
+            async with session.get(url, headers=headers, timeout=timeout, allow_redirects=True) as response:
+                yield response
+
+    async def _read_range(self, session, url, range_header):
+        """
+        Read a byte range of the remote file.
+
+        :param session: aiohttp session
+        :param url: File URL
+        :param range_header: Value of the Range header
+        :return: Tuple (data, total_size)
+        :raises ZipStreamUnsupported: If the server does not honor the range
+        """
+        headers = {'User-Agent': self.user_agent, 'Range': range_header}
+        async with self._get(session, url, headers, aiohttp.ClientTimeout(total=self.request_timeout)) as response:
+            response.raise_for_status()
+            content_range = response.headers.get('content-range', '')
+            if response.status != 206 or '/' not in content_range:
+                raise ZipStreamUnsupported('server does not support range requests')
+
+            total_size = content_range.split('/')[-1]
+            if not total_size.isdigit():
+                raise ZipStreamUnsupported('unknown archive size')
+
+            return await response.read(), int(total_size)
+
+    def parse_central_directory(self, data):
+        """
+        Parse the central directory records.
+
+        :param data: Bytes of the whole central directory
+        :return: List of member dicts sorted by local header offset
+        :raises ZipStreamUnsupported: If a member cannot be streamed
+        """
+        members = []
+        position = 0
+        while position + self.CENTRAL_STRUCT.size <= len(data) and \
+                data[position:position + 4] == self.CENTRAL_SIGNATURE:
+            (_, _, _, flags, method, _, _, crc, compress_size, file_size,
+             name_length, extra_length, comment_length, _, _, _, offset) = \
+                self.CENTRAL_STRUCT.unpack_from(data, position)
+            position += self.CENTRAL_STRUCT.size
+
+            raw_name = data[position:position + name_length]
+            position += name_length + extra_length + comment_length
+
+            if flags & 0x1:
+                raise ZipStreamUnsupported('encrypted archive')
+            if method not in (0, 8):
+                raise ZipStreamUnsupported(f'unsupported compression method {method}')
+            if 0xFFFFFFFF in (compress_size, file_size, offset):
+                raise ZipStreamUnsupported('ZIP64 archive')
+
+            members.append({
+                'name': raw_name.decode('utf-8' if flags & 0x800 else 'cp437'),
+                'method': method,
+                'crc': crc,
+                'compress_size': compress_size,
+                'file_size': file_size,
+                'offset': offset,
+            })
+
+        return sorted(members, key=lambda member: member['offset'])
+
+    async def read_members(self, session, url):
+        """
+        Read the member list of the remote archive from its central directory.
+
+        :param session: aiohttp session
+        :param url: File URL
+        :return: List of member dicts sorted by local header offset
+        :raises ZipStreamUnsupported: If the archive cannot be streamed
+        """
+        tail, total_size = await self._read_range(session, url, f'bytes=-{self.TAIL_SIZE}')
+        eocd_position = tail.rfind(self.EOCD_SIGNATURE)
+        if eocd_position < 0 or eocd_position + self.EOCD_STRUCT.size > len(tail):
+            raise ZipStreamUnsupported('end of central directory not found')
+
+        (_, disk_number, _, _, entries, central_size, central_offset, _) = \
+            self.EOCD_STRUCT.unpack_from(tail, eocd_position)
+        if disk_number or 0xFFFF == entries or 0xFFFFFFFF in (central_size, central_offset):
+            raise ZipStreamUnsupported('multi-disk or ZIP64 archive')
+
+        # the central directory is usually inside the tail, otherwise fetch it
+        tail_offset = total_size - len(tail)
+        if central_offset >= tail_offset:
+            central = tail[central_offset - tail_offset:central_offset - tail_offset + central_size]
+        else:
+            central, _ = await self._read_range(session, url,
+                                                f'bytes={central_offset}-{central_offset + central_size - 1}')
+
+        members = self.parse_central_directory(central)
+        if len(members) != entries:
+            raise ZipStreamUnsupported('central directory entries mismatch')
+
+        return members
+
+    @staticmethod
+    def get_member_path(unpack_path, name):
+        """
+        Get a safe destination path for a member (same rules as zipfile: no absolute paths or "..").
+
+        :param unpack_path: Destination folder
+        :param name: Member name
+        :return: Path object or None if nothing is left of the name
+        """
+        name = os.path.splitdrive(name)[1]
+        parts = [part for part in re.split(r'[\\/]', name) if part not in ('', '.', '..')]
+        if not parts:
+            return None
+
+        return pathlib.Path(unpack_path).joinpath(*parts)
+
+    async def stream_members(self, session, url, members, unpack_path):
+        """
+        Stream the archive and write every member as soon as its bytes arrive.
+
+        :param session: aiohttp session
+        :param url: File URL
+        :param members: Member list from read_members()
+        :param unpack_path: Destination folder
+        :return: Number of bytes received
+        """
+        headers = {'User-Agent': self.user_agent}
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=self.request_timeout, sock_read=self.request_timeout)
+        async with self._get(session, url, headers, timeout) as response:
+            response.raise_for_status()
+            reader = _StreamReader(response.content, self.CHUNK_SIZE)
+
+            for member in members:
+                await reader.skip_to(member['offset'])
+                header = await reader.read_exact(self.LOCAL_STRUCT.size)
+                if header[:4] != self.LOCAL_SIGNATURE:
+                    raise Exception(f'bad local header for "{member["name"]}"')
+
+                name_length, extra_length = struct.unpack_from('<HH', header, 26)
+                await reader.read_exact(name_length + extra_length)
+
+                member_path = self.get_member_path(unpack_path, member['name'])
+                if member_path is None or member['name'].endswith('/'):
+                    if member_path is not None:
+                        member_path.mkdir(parents=True, exist_ok=True)
+                    await reader.read_exact(member['compress_size'])
+                    continue
+
+                member_path.parent.mkdir(parents=True, exist_ok=True)
+                inflater = zlib.decompressobj(-15) if member['method'] == 8 else None
+                crc = 0
+                with open(member_path, 'wb') as member_file:
+                    async for chunk in reader.iter_exact(member['compress_size']):
+                        if inflater:
+                            chunk = inflater.decompress(chunk)
+                        crc = zlib.crc32(chunk, crc)
+                        member_file.write(chunk)
+
+                    if inflater:
+                        chunk = inflater.flush()
+                        crc = zlib.crc32(chunk, crc)
+                        member_file.write(chunk)
+
+                if crc != member['crc']:
+                    raise Exception(f'CRC mismatch for "{member["name"]}"')
+
+            return reader.position
+
+    async def _extract(self, url, unpack_path, cookies):
+        """
+        Coroutine behind extract().
+
+        :param url: File URL
+        :param unpack_path: Destination folder
+        :param cookies: Optional cookies dict to include in the requests
+        :return: Number of bytes received
+        """
+        async with aiohttp.ClientSession(cookies=cookies) as session:
+            members = await self.read_members(session, url)
+            logging.debug(f'{self.tool_name}: streaming {len(members)} zip members')
+            return await self.stream_members(session, url, members, unpack_path)
+
+    def extract(self, tool_name, url, unpack_path, cookies=None):
+        """
+        Download and extract a remote ZIP file in one pass.
+
+        :param tool_name: Name of the tool
+        :param url: File URL
+        :param unpack_path: Destination folder
+        :param cookies: Optional cookies dict to include in the requests
+        :return: True if the archive was extracted, False if it cannot be streamed (use the regular path)
+        :raises Exception: If the stream fails after extraction started
+        """
+        self.tool_name = tool_name
+        self.bytes_received = 0
+        os.makedirs(unpack_path, exist_ok=True)
+        try:
+            self.bytes_received = asyncio.run(self._extract(url, unpack_path, cookies))
+        except ZipStreamUnsupported as reason:
+            logging.debug(f'{self.tool_name}: streaming unpack not possible ({reason})')
+            return False
+
+        logging.debug(f'{self.tool_name}: streamed {self.bytes_received} bytes')
+        return True
+
+
+class _StreamReader:
+    """
+    Sequential reader over an aiohttp stream that tracks the absolute position.
+    """
+
+    def __init__(self, content, chunk_size):
+        """
+        :param content: aiohttp StreamReader of the response
+        :param chunk_size: Maximum size of the chunks yielded by iter_exact()
+        """
+        self.content = content
+        self.chunk_size = chunk_size
+        self.position = 0
+
+    async def read_exact(self, size):
+        """
+        Read exactly size bytes.
+        """
+        data = await self.content.readexactly(size) if size else b''
+        self.position += size
+        return data
+
+    async def iter_exact(self, size):
+        """
+        Yield chunks until exactly size bytes have been read.
+        """
+        while size > 0:
+            chunk = await self.content.read(min(size, self.chunk_size))
+            if not chunk:
+                raise Exception('unexpected end of stream')
+            self.position += len(chunk)
+            size -= len(chunk)
+            yield chunk
+
+    async def skip_to(self, offset):
+        """
+        Discard bytes up to an absolute offset.
+        """
+        if offset < self.position:
+            raise Exception('overlapping zip members')
+
+        async for _ in self.iter_exact(offset - self.position):
+            pass